@@ -0,0 +1,91 @@
+Feature: Advisory lock
+
+    Scenario: Concurrent run waits for advisory lock and exits as no-op
+        Given migration dir
+        And migrations
+           | file                     | code                           |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint); |
+        And database and connection
+        And successful pgmigrate run with "-t latest migrate"
+        And running query "SELECT pg_advisory_xact_lock(hashtext('pgmigrate:public')), pg_sleep(1)"
+        When we run pgmigrate with "--metrics_file metrics.prom -t latest migrate"
+        Then pgmigrate command "succeeded"
+        And "Waiting for advisory lock of schema public" is logged 1 times
+        And "Advisory lock of schema public acquired in" is logged 1 times
+        And "Database is up to date" is logged 1 times
+        And file "metrics.prom" in migration dir contains "pgmigrate_advisory_lock_wait_seconds_total 0."
+
+    Scenario: Concurrent run reads state committed by lock holder
+        Given migration dir
+        And migrations
+           | file                      | code                            |
+           | V1__Single_migration.sql  | CREATE TABLE test (id bigint);  |
+           | V2__Another_migration.sql | CREATE TABLE test2 (id bigint); |
+        And config
+        """
+        session:
+          - SET TRANSACTION ISOLATION LEVEL REPEATABLE READ
+        """
+        And database and connection
+        And successful pgmigrate run with "-t 1 migrate"
+        And running query "SELECT pg_advisory_xact_lock(hashtext('pgmigrate:public')); CREATE TABLE test2 (id bigint); INSERT INTO schema_version (version, description, installed_by) VALUES (2, 'Another migration', CURRENT_USER); SELECT pg_sleep(1)"
+        When we run pgmigrate with "-t latest migrate"
+        Then pgmigrate command "succeeded"
+        And "Waiting for advisory lock of schema public" is logged 1 times
+        And "Database is up to date" is logged 1 times
+        And query "SELECT count(*) FROM schema_version" on database "pgmigratetest" equals
+           | count |
+           | 2     |
+
+    Scenario: Tenant schema is migrated under its advisory lock
+        Given migration dir
+        And migrations
+           | file                      | code                            |
+           | V1__Single_migration.sql  | CREATE TABLE test (id bigint);  |
+           | V2__Another_migration.sql | CREATE TABLE test2 (id bigint); |
+        And database and connection
+        And query "CREATE SCHEMA tenant_1"
+        And successful pgmigrate run with "--tenant_schemas tenant_1 -t 1 tenants"
+        And running query "SELECT pg_advisory_xact_lock(hashtext('pgmigrate:tenant_1')); CREATE TABLE tenant_1.test2 (id bigint); INSERT INTO tenant_1.schema_version (version, description, installed_by) VALUES (2, 'Another migration', CURRENT_USER); SELECT pg_sleep(1)"
+        When we run pgmigrate with "--tenant_schemas tenant_1 -t latest tenants"
+        Then pgmigrate command "succeeded"
+        And fleet report has 1 "succeeded" targets
+        And "Waiting for advisory lock of schema tenant_1" is logged 1 times
+        And query "SELECT count(*) FROM tenant_1.schema_version" on database "pgmigratetest" equals
+           | count |
+           | 2     |
+        And query "SELECT count(*) FROM pg_locks WHERE locktype = 'advisory'" on database "pgmigratetest" equals
+           | count |
+           | 0     |
+
+    Scenario: Advisory lock wait is limited by timeout
+        Given migration dir
+        And migrations
+           | file                     | code                           |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint); |
+        And database and connection
+        And running query "SELECT pg_advisory_xact_lock(hashtext('pgmigrate:public')), pg_sleep(3)"
+        When we run pgmigrate with "--advisory_lock_timeout 0.5 -t latest migrate"
+        Then pgmigrate command "failed"
+        And migrate command failed with Unable to acquire advisory lock of schema public in 0.5 seconds
+        And database has no schema_version table
+
+    Scenario: Advisory lock could be disabled
+        Given migration dir
+        And migrations
+           | file                     | code                           |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint); |
+        And database and connection
+        And running query "SELECT pg_advisory_xact_lock(hashtext('pgmigrate:public')), pg_sleep(3)"
+        When we run pgmigrate with "--disable_advisory_lock -t latest migrate"
+        Then pgmigrate command "succeeded"
+        And "Waiting for advisory lock" is logged 0 times
+
+    Scenario: Baseline waits for advisory lock
+        Given migration dir
+        And database and connection
+        And running query "SELECT pg_advisory_xact_lock(hashtext('pgmigrate:public')), pg_sleep(1)"
+        When we run pgmigrate with "-b 1 baseline"
+        Then pgmigrate command "succeeded"
+        And "Waiting for advisory lock of schema public" is logged 1 times
+        And migration info contains forced baseline=1
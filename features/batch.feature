@@ -0,0 +1,63 @@
+Feature: Statements batching
+
+    Scenario: Statements are sent in batches limited by count
+        Given migration dir
+        And migrations
+           | file                      | code                                                                                                                                                            |
+           | V1__Single_migration.sql  | CREATE TABLE test (id bigint); INSERT INTO test VALUES (1); INSERT INTO test VALUES (2); INSERT INTO test VALUES (3); INSERT INTO test VALUES (4); SELECT '%s'; |
+           | V2__Another_migration.sql | INSERT INTO test VALUES (5); INSERT INTO test VALUES (6) --+ hint                                                                                                 |
+        And database and connection
+        When we run pgmigrate with "--batch 3 -t latest migrate"
+        Then pgmigrate command "succeeded"
+        And "RELEASE SAVEPOINT pgmigrate_batch" is logged 3 times
+        And query "SELECT count(*), sum(id) FROM test" equals
+           | count | sum |
+           | 6     | 21  |
+
+    Scenario: Statements are sent in batches limited by size
+        Given migration dir
+        And migrations
+           | file                     | code                                              |
+           | V1__Single_migration.sql | SELECT 1; SELECT 2; SELECT 3; SELECT 4; SELECT 5; |
+        And database and connection
+        When we run pgmigrate with "--batch 100 --batch_bytes 20 -t latest migrate"
+        Then pgmigrate command "succeeded"
+        And "RELEASE SAVEPOINT pgmigrate_batch" is logged 2 times
+
+    Scenario: Statement with syntax error in batch is reported
+        Given migration dir
+        And migrations
+           | file                     | code                                                    |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint); THIS_IS_ERROR; SELECT 1; |
+        And database and connection
+        When we run pgmigrate with "--batch 10 -t latest migrate"
+        Then pgmigrate command "failed"
+        And migrate command failed with Error executing statement from
+        And "ERROR   : b'THIS_IS_ERROR;'" is logged 1 times
+        And database has no schema_version table
+
+    Scenario: Failed statement in batch is reported
+        Given migration dir
+        And migrations
+           | file                     | code                                                                             |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint); SELECT 1 / (SELECT count(*) FROM test); SELECT 1; |
+        And database and connection
+        When we run pgmigrate with "--batch 10 -t latest migrate"
+        Then pgmigrate command "failed"
+        And migrate command failed with Batch of 3 statements failed
+        And "ERROR   : b'SELECT 1 / (SELECT count(*) FROM test);'" is logged 1 times
+        And database has no schema_version table
+
+    Scenario: Statements of nontransactional migrations are not batched
+        Given migration dir
+        And migrations
+           | file                               | code                                                       |
+           | V1__Transactional_migration.sql    | CREATE TABLE test (id bigint); INSERT INTO test VALUES (1); |
+           | V2__NONTRANSACTIONAL_migration.sql | INSERT INTO test VALUES (2); INSERT INTO test VALUES (3);   |
+        And database and connection
+        When we run pgmigrate with "--batch 10 -t latest migrate"
+        Then pgmigrate command "succeeded"
+        And "RELEASE SAVEPOINT pgmigrate_batch" is logged 1 times
+        And query "SELECT count(*), sum(id) FROM test" equals
+           | count | sum |
+           | 3     | 6   |
@@ -0,0 +1,176 @@
+Feature: Up-to-date check
+
+    Scenario: Check reports pending migrations on empty database
+        Given migration dir
+        And migrations
+           | file                      | code                           |
+           | V1__Single_migration.sql  | CREATE TABLE test (id bigint); |
+        And database and connection
+        When we run pgmigrate with "-t latest check"
+        Then pgmigrate command exited with code 3
+        And "Pending versions: 1" is logged 1 times
+
+    Scenario: Check passes on database without migrations
+        Given migration dir
+        And database and connection
+        When we run pgmigrate with "-t latest check"
+        Then pgmigrate command exited with code 0
+
+    Scenario: Check compares applied versions with target
+        Given migration dir
+        And migrations
+           | file                      | code                           |
+           | V1__Single_migration.sql  | CREATE TABLE test (id bigint); |
+           | V2__Another_migration.sql | SELECT 1;                      |
+        And database and connection
+        And successful pgmigrate run with "-t 1 migrate"
+        When we run pgmigrate with "-t 1 check"
+        Then pgmigrate command exited with code 0
+        And "Database is up to date" is logged 1 times
+        When we run pgmigrate with "-t latest check"
+        Then pgmigrate command exited with code 3
+        And "Pending versions: 2" is logged 1 times
+
+    Scenario: Migrate is no-op with single query on up to date database
+        Given migration dir
+        And migrations
+           | file                      | code                           |
+           | V1__Single_migration.sql  | CREATE TABLE test (id bigint); |
+        And database and connection
+        And successful pgmigrate run with "-t latest migrate"
+        When we run pgmigrate with "-t latest migrate"
+        Then pgmigrate command "succeeded"
+        And "Database is up to date" is logged 1 times
+        And "max(version)" is logged 1 times
+        And "information_schema" is logged 0 times
+        And "SELECT CURRENT_USER" is logged 0 times
+
+    Scenario: Check uses cached migrations dir manifest
+        Given migration dir
+        And migrations
+           | file                      | code                           |
+           | V1__Single_migration.sql  | CREATE TABLE test (id bigint); |
+        And database and connection
+        And successful pgmigrate run with "--cache_dir cache -t latest migrate"
+        When we run pgmigrate with "--cache_dir cache -t latest check"
+        Then pgmigrate command exited with code 0
+        And file "cache/manifest.json" in migration dir contains ""versions": [1]"
+        Given file "migrations/V2__Another_migration.sql" in migration dir
+        """
+        SELECT 1;
+        """
+        When we run pgmigrate with "--cache_dir cache -t latest check"
+        Then pgmigrate command exited with code 3
+        And file "cache/manifest.json" in migration dir contains ""versions": [1, 2]"
+
+    Scenario: Check trusts manifest of dirs not changed around its save
+        Given migration dir
+        And migrations
+           | file                      | code                           |
+           | V1__Single_migration.sql  | CREATE TABLE test (id bigint); |
+           | V2__Another_migration.sql | SELECT 1;                      |
+        And database and connection
+        And successful pgmigrate run with "-t 1 migrate"
+        And manifest of migrations dir with versions "1" saved 10 seconds after its change
+        When we run pgmigrate with "--cache_dir cache -t latest check"
+        Then pgmigrate command exited with code 0
+        Given manifest of migrations dir with versions "1" saved 1 seconds after its change
+        When we run pgmigrate with "--cache_dir cache -t latest check"
+        Then pgmigrate command exited with code 3
+        And "Pending versions: 2" is logged 1 times
+
+    Scenario: Migrations dirs sharing cache dir have separate manifests
+        Given migration dir
+        And migrations
+           | file                      | code                           |
+           | V1__Single_migration.sql  | CREATE TABLE test (id bigint); |
+        And file "other/migrations/V1__Single_migration.sql" in migration dir
+        """
+        CREATE TABLE test (id bigint);
+        """
+        And file "other/migrations/V2__Another_migration.sql" in migration dir
+        """
+        SELECT 1;
+        """
+        And database and connection
+        And successful pgmigrate run with "-t 1 migrate"
+        And manifest of migrations dir with versions "1" saved 10 seconds after its change
+        When we run pgmigrate in subdir "other" with "--cache_dir ../cache -t latest check"
+        Then pgmigrate command exited with code 3
+        And "Pending versions: 2" is logged 1 times
+        And file "cache/manifest.json" in migration dir contains "other/migrations": {"dirs"
+        When we run pgmigrate with "--cache_dir cache -t latest check"
+        Then pgmigrate command exited with code 0
+
+    Scenario: Check fails on migrations with same version
+        Given migration dir
+        And migrations
+           | file                     | code      |
+           | V1__Single_migration.sql | SELECT 1; |
+           | V1__Same_migration.sql   | SELECT 1; |
+        And database and connection
+        When we run pgmigrate with "-t latest check"
+        Then migrate command failed with Found migrations with same version: 1
+
+    Scenario: Check with pending migrations is successful run in metrics
+        Given migration dir
+        And migrations
+           | file                      | code                           |
+           | V1__Single_migration.sql  | CREATE TABLE test (id bigint); |
+        And database and connection
+        When we run pgmigrate with "--metrics_file pgmigrate.prom -t latest check"
+        Then pgmigrate command exited with code 3
+        And file "pgmigrate.prom" in migration dir contains "pgmigrate_run_success 1"
+
+    Scenario: Check with missing schema reports pending migrations
+        Given migration dir
+        And migrations
+           | file                      | code                           |
+           | V1__Single_migration.sql  | CREATE TABLE test (id bigint); |
+        And database and connection
+        When we run pgmigrate with "-m missing -t latest check"
+        Then pgmigrate command exited with code 3
+
+    Scenario: Check fails on malformed schema_version
+        Given migration dir
+        And database and connection
+        And query "CREATE TABLE schema_version (id bigint)"
+        When we run pgmigrate with "-t latest check"
+        Then pgmigrate command "failed"
+        And migrate command failed with unexpected structure
+
+    Scenario: Check fails without migrations dir
+        Given migration dir
+        And removed migrations subdir
+        And database and connection
+        When we run pgmigrate with "-t latest check"
+        Then pgmigrate command "failed"
+        And migrate command failed with Migrations dir not found
+
+    Scenario: Check scans migrations subdirs and ignores broken manifest
+        Given migration dir
+        And migrations
+           | file                      | code                           |
+           | V1__Single_migration.sql  | CREATE TABLE test (id bigint); |
+        And file "migrations/nested/V2__Another_migration.sql" in migration dir
+        """
+        SELECT 1;
+        """
+        And manifest of migrations dir
+        """
+        {"dirs": ["migrations"], "versions": [1]}
+        """
+        And database and connection
+        And successful pgmigrate run with "-t 1 migrate"
+        When we run pgmigrate with "--cache_dir cache -t latest check"
+        Then pgmigrate command exited with code 3
+        And "Pending versions: 2" is logged 1 times
+        And file "cache/manifest.json" in migration dir contains ""versions": [1, 2]"
+
+    Scenario: Check fails on query error
+        Given migration dir
+        And database and connection
+        And query "CREATE TABLE schema_version (version jsonb)"
+        When we run pgmigrate with "-t latest check"
+        Then pgmigrate command "failed"
+        And migrate command failed with function max(jsonb) does not exist
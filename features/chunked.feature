@@ -0,0 +1,123 @@
+Feature: Chunked migrations
+
+    Scenario: Chunked migration with LIMIT batches
+        Given migration dir
+        And migrations
+           | file                      | code                                                                                                                                   |
+           | V1__Create_test_table.sql | CREATE TABLE test (id bigint, v int); INSERT INTO test SELECT generate_series(1, 10);                                                  |
+           | V2__CHUNKED_backfill.sql  | -- Fill v column\n-- pgmigrate: batch_size=3\nUPDATE test SET v = 1 WHERE id IN (SELECT id FROM test WHERE v IS NULL LIMIT %(limit)s); |
+        And database and connection
+        When we run pgmigrate with "-t 2 migrate"
+        Then pgmigrate command "succeeded"
+        And "Version 2 processed 10 rows in 5 batches" is logged 1 times
+        And query "SELECT count(*) FROM test WHERE v = 1" on database "pgmigratetest" equals
+           | count |
+           | 10    |
+
+    Scenario: Chunked migration with key range batches adapts batch size
+        Given migration dir
+        And migrations
+           | file                      | code                                                                                                                                                        |
+           | V1__Create_test_table.sql | CREATE TABLE test (id bigint, v int); INSERT INTO test SELECT generate_series(1, 10);                                                                       |
+           | V2__CHUNKED_backfill.sql  | -- pgmigrate: batch_size=4 sleep=0.01 target_duration=10\nSELECT min(id), max(id) FROM test;\nUPDATE test SET v = 2 WHERE id >= %(start)s AND id < %(end)s; |
+        And database and connection
+        When we run pgmigrate with "-t 2 migrate"
+        Then pgmigrate command "succeeded"
+        And "Version 2 batch 2: 6 rows in" is logged 1 times
+        And "Version 2 processed 10 rows in 2 batches" is logged 1 times
+        And query "SELECT count(*) FROM test WHERE v = 2" on database "pgmigratetest" equals
+           | count |
+           | 10    |
+
+    Scenario: Interrupted chunked migration resumes from recorded position
+        Given migration dir
+        And migrations
+           | file                      | code                                                                                                                               |
+           | V1__Create_test_table.sql | CREATE TABLE test (id bigint, d int); INSERT INTO test SELECT generate_series(1, 10), 1; UPDATE test SET d = 0 WHERE id = 7;       |
+           | V2__CHUNKED_backfill.sql  | -- pgmigrate: batch_size=3\nSELECT min(id), max(id) FROM test;\nUPDATE test SET d = 10 / d WHERE id >= %(start)s AND id < %(end)s; |
+        And database and connection
+        When we run pgmigrate with "-t 2 migrate"
+        Then pgmigrate command "failed"
+        Given query "UPDATE test SET d = 1 WHERE id = 7"
+        When we run pgmigrate with "-t 2 migrate"
+        Then pgmigrate command "succeeded"
+        And query "SELECT position, batches, rows FROM schema_version_chunks" on database "pgmigratetest" equals
+           | position | batches | rows |
+           | 13       | 4       | 10   |
+        And query "SELECT count(*) FROM test WHERE d = 10" on database "pgmigratetest" equals
+           | count |
+           | 10    |
+
+    Scenario: Chunked migration with empty key range
+        Given migration dir
+        And migrations
+           | file                      | code                                                                                              |
+           | V1__Create_test_table.sql | CREATE TABLE test (id bigint, v int);                                                             |
+           | V2__CHUNKED_backfill.sql  | SELECT min(id), max(id) FROM test;\nUPDATE test SET v = 2 WHERE id >= %(start)s AND id < %(end)s; |
+        And database and connection
+        When we run pgmigrate with "-t 2 migrate"
+        Then pgmigrate command "succeeded"
+        And "Version 2 has empty key range" is logged 1 times
+
+    Scenario: Chunked migration with non-integer key range
+        Given migration dir
+        And migrations
+           | file                      | code                                                                                              |
+           | V1__Create_test_table.sql | CREATE TABLE test (id text, v int); INSERT INTO test VALUES ('a', 1), ('b', 1);                   |
+           | V2__CHUNKED_backfill.sql  | SELECT min(id), max(id) FROM test;\nUPDATE test SET v = 2 WHERE id >= %(start)s AND id < %(end)s; |
+        And database and connection
+        When we run pgmigrate with "-t 2 migrate"
+        Then migrate command failed with should return min and max integer keys, got ('a', 'b')
+        And query "SELECT count(*) AS rows, sum(v) AS v FROM test" equals
+           | rows | v |
+           | 2    | 2 |
+
+    Scenario: Chunked migration without placeholders
+        Given migration dir
+        And migrations
+           | file                      | code                                  |
+           | V1__Create_test_table.sql | CREATE TABLE test (id bigint, v int); |
+           | V2__CHUNKED_backfill.sql  | UPDATE test SET v = 1;                |
+        And database and connection
+        When we run pgmigrate with "-t 2 migrate"
+        Then migrate command failed with should have statement with %(limit)s
+
+    Scenario: Chunked migration with unknown param
+        Given migration dir
+        And migrations
+           | file                      | code                                                 |
+           | V1__Create_test_table.sql | CREATE TABLE test (id bigint, v int);                |
+           | V2__CHUNKED_backfill.sql  | -- pgmigrate: size=1\nUPDATE test SET v = %(limit)s; |
+        And database and connection
+        When we run pgmigrate with "-t 2 migrate"
+        Then migrate command failed with Unknown chunked migration param size
+
+    Scenario: Chunked migration with invalid param
+        Given migration dir
+        And migrations
+           | file                      | code                                                  |
+           | V1__Create_test_table.sql | CREATE TABLE test (id bigint, v int);                 |
+           | V2__CHUNKED_backfill.sql  | -- pgmigrate: sleep=x\nUPDATE test SET v = %(limit)s; |
+        And database and connection
+        When we run pgmigrate with "-t 2 migrate"
+        Then migrate command failed with Invalid chunked migration param sleep
+
+    Scenario: Chunked migration with zero batch size
+        Given migration dir
+        And migrations
+           | file                      | code                                                       |
+           | V1__Create_test_table.sql | CREATE TABLE test (id bigint, v int);                      |
+           | V2__CHUNKED_backfill.sql  | -- pgmigrate: batch_size=0\nUPDATE test SET v = %(limit)s; |
+        And database and connection
+        When we run pgmigrate with "-t 2 migrate"
+        Then migrate command failed with Chunked migration batch_size should be positive
+
+    Scenario: Chunked migration with failing batch
+        Given migration dir
+        And migrations
+           | file                      | code                                            |
+           | V1__Create_test_table.sql | CREATE TABLE test (id bigint, v int);           |
+           | V2__CHUNKED_backfill.sql  | UPDATE test SET v = 1 / 0 WHERE id < %(limit)s; |
+        And database and connection
+        When we run pgmigrate with "-t 2 migrate"
+        Then migrate command failed with Unable to apply statement
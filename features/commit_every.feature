@@ -0,0 +1,82 @@
+Feature: Intermediate commits
+
+    Scenario: Transactional versions are committed in chunks
+        Given migration dir
+        And migrations
+           | file                     | code                                 |
+           | V1__Create_test.sql      | CREATE TABLE test (id bigint);       |
+           | V2__Insert_one.sql       | INSERT INTO test VALUES (1);         |
+           | V3__Insert_two.sql       | INSERT INTO test VALUES (2);         |
+        And callbacks
+           | type      | file            | code                         |
+           | afterAll  | after_all.sql   | INSERT INTO test VALUES (3); |
+        And database and connection
+        When we run pgmigrate with our callbacks and "--commit_every 2 -t latest migrate"
+        Then pgmigrate command "succeeded"
+        And "Committed 2 versions in" is logged 1 times
+        And query "SELECT count(*) FROM test" on database "pgmigratetest" equals
+           | count |
+           | 3     |
+
+    Scenario: Committed chunks are kept on failure
+        Given migration dir
+        And migrations
+           | file                     | code                                 |
+           | V1__Create_test.sql      | CREATE TABLE test (id bigint);       |
+           | V2__Insert_one.sql       | INSERT INTO test VALUES (1);         |
+           | V3__Insert_two.sql       | INSERT INTO missing VALUES (2);      |
+        And database and connection
+        When we run pgmigrate with "--commit_every 1 -t latest migrate"
+        Then pgmigrate command "failed"
+        And "Committed 1 versions in" is logged 2 times
+        And query "SELECT count(*) FROM schema_version" on database "pgmigratetest" equals
+           | count |
+           | 2     |
+
+    Scenario: Schema check is done before each commit
+        Given migration dir
+        And migrations
+           | file                        | code                                         |
+           | V1__Create_test_table.sql   | CREATE TABLE "test-schema".test (id bigint); |
+           | V2__Create_public_table.sql | CREATE TABLE public.test (id bigint);        |
+        And database and connection
+        When we run pgmigrate with "--commit_every 1 -t latest -m test-schema migrate"
+        Then pgmigrate command "failed"
+        And migrate command failed with Unexpected relations used in migrations: public.test
+        And "Committed 1 versions in" is logged 1 times
+
+    Scenario: Dry run is not committed in chunks
+        Given migration dir
+        And migrations
+           | file                     | code                                 |
+           | V1__Create_test.sql      | CREATE TABLE test (id bigint);       |
+           | V2__Insert_one.sql       | INSERT INTO test VALUES (1);         |
+        And database and connection
+        When we run pgmigrate with "--dryrun --commit_every 1 -t latest migrate"
+        Then pgmigrate command "succeeded"
+        And "Committed" is logged 0 times
+        And database has no schema_version table
+
+    Scenario: Non-positive commit every is rejected
+        Given migration dir
+        And migrations
+           | file                     | code                           |
+           | V1__Create_test.sql      | CREATE TABLE test (id bigint); |
+        And database and connection
+        When we run pgmigrate with "--commit_every 0 -t latest migrate"
+        Then pgmigrate command "failed"
+        And migrate command failed with Unexpected commit every: 0
+
+    Scenario: Non-positive commit interval is rejected
+        Given migration dir
+        And migrations
+           | file                     | code                           |
+           | V1__Create_test.sql      | CREATE TABLE test (id bigint); |
+        And config
+        """
+        commit_interval: -1
+        """
+        And database and connection
+        When we run pgmigrate with "-t latest migrate"
+        Then pgmigrate command "failed"
+        And migrate command failed with Unexpected commit interval: -1
@@ -38,3 +38,44 @@ Feature: Conflicting pids termination
         And not committed query "UPDATE test SET id = 2 WHERE id = 1"
         When we run pgmigrate with "-l 0.1 -t 2 migrate"
         Then pgmigrate command "succeeded"
+
+    Scenario: Running blocking query is cancelled
+        Given migration dir
+        And migrations
+           | file                      | code                                   |
+           | V1__Alter_test_table.sql  | ALTER TABLE test ADD COLUMN test text; |
+        And database and connection
+        And query "CREATE TABLE test (id bigint)"
+        And running query "LOCK TABLE test; SELECT pg_sleep(30)"
+        When we run pgmigrate with "-l 0.1 --termination_grace 10 -t 1 migrate"
+        Then pgmigrate command "succeeded"
+        And "Cancelled conflicting pid" is logged 1 times
+        And "Conflicting backends: 1 cancels, 0 terminations" is logged 1 times
+
+    Scenario: Idle blocking transaction is terminated after grace period
+        Given migration dir
+        And migrations
+           | file                      | code                                   |
+           | V1__Create_test_table.sql | CREATE TABLE test (id bigint);         |
+           | V2__Alter_test_table.sql  | ALTER TABLE test ADD COLUMN test text; |
+        And database and connection
+        And successful pgmigrate run with "-t 1 migrate"
+        And not committed query "SELECT * FROM test"
+        When we run pgmigrate with "-l 0.1 --termination_grace 0.3 -t 2 migrate"
+        Then pgmigrate command "succeeded"
+        And "Conflicting backends: 1 cancels, 1 terminations" is logged 1 times
+        And "(user root, terminated, waited" is logged 1 times
+
+    Scenario: Blocking pid is terminated at once without grace period
+        Given migration dir
+        And migrations
+           | file                      | code                                   |
+           | V1__Create_test_table.sql | CREATE TABLE test (id bigint);         |
+           | V2__Alter_test_table.sql  | ALTER TABLE test ADD COLUMN test text; |
+        And database and connection
+        And successful pgmigrate run with "-t 1 migrate"
+        And not committed query "SELECT * FROM test"
+        When we run pgmigrate with "-l 0.1 --termination_grace 0 -t 2 migrate"
+        Then pgmigrate command "succeeded"
+        And "Cancelled conflicting pid" is logged 0 times
+        And "Conflicting backends: 0 cancels, 1 terminations" is logged 1 times
@@ -0,0 +1,112 @@
+Feature: COPY data in migrations
+
+    Scenario: Inline COPY data is streamed to database
+        Given migration dir
+        And migrations
+           | file                     | code                                                                                                                                                       |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint, name text);\nCOPY test (id, name) FROM STDIN WITH (FORMAT csv);\n1,one\n2,"two; three"\n\.\nINSERT INTO test VALUES (3, 'a'); |
+        And database and connection
+        When we run pgmigrate with "-t latest migrate"
+        Then pgmigrate command "succeeded"
+        And query "SELECT count(*), sum(id) FROM test" equals
+           | count | sum |
+           | 3     | 6   |
+        And query "SELECT id, name FROM test WHERE id = 2" equals
+           | id | name       |
+           | 2  | two; three |
+
+    Scenario: COPY data is read from sidecar file
+        Given migration dir
+        And migrations
+           | file                     | code                                                                                                |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint, name text);\n\copy test (id, name) from 'V1.csv' with (format csv)\n |
+           | V1.csv                   | 1,one\n2,two\n                                                                                      |
+        And database and connection
+        When we run pgmigrate with "-t latest migrate"
+        Then pgmigrate command "succeeded"
+        And query "SELECT count(*), sum(id) FROM test" equals
+           | count | sum |
+           | 2     | 3   |
+
+    Scenario: Batches are flushed before COPY
+        Given migration dir
+        And migrations
+           | file                     | code                                                                                                                                                           |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint); INSERT INTO test VALUES (1);\nCOPY test FROM STDIN;\n2\n3\n\.\nUPDATE test SET id = id * 10; INSERT INTO test VALUES (4); |
+        And database and connection
+        When we run pgmigrate with "--batch 10 -t latest migrate"
+        Then pgmigrate command "succeeded"
+        And "RELEASE SAVEPOINT pgmigrate_batch" is logged 2 times
+        And query "SELECT count(*), sum(id) FROM test" equals
+           | count | sum |
+           | 4     | 64  |
+
+    Scenario: COPY blocks are cached
+        Given migration dir
+        And migrations
+           | file                     | code                                                      |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint);\nCOPY test FROM STDIN;\n1\n2\n\.\n |
+        And database and connection
+        And successful pgmigrate run with "--cache_dir .pgmigrate-cache -t latest migrate"
+        Given database and connection
+        When we run pgmigrate with "--cache_dir .pgmigrate-cache -t latest migrate"
+        Then pgmigrate command "succeeded"
+        And cache dir ".pgmigrate-cache" contains 1 entries
+        And query "SELECT count(*), sum(id) FROM test" equals
+           | count | sum |
+           | 2     | 3   |
+
+    Scenario: Only COPY table FROM STDIN reads inline data
+        Given migration dir
+        And migrations
+           | file                     | code                                                                                                                                                   |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint, "from stdin" text);\nCOPY test (id, "from stdin") FROM STDIN WITH (FORMAT csv);\n1,one\n\.\nCREATE TABLE other (id int); |
+        And database and connection
+        When we run pgmigrate with "-t latest migrate"
+        Then pgmigrate command "succeeded"
+        And query "SELECT to_regclass('other')::text AS other, count(*) FROM test" equals
+           | other | count |
+           | other | 1     |
+
+    Scenario: Unterminated COPY data is reported
+        Given migration dir
+        And migrations
+           | file                     | code                                                              |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint);\nCOPY test FROM STDIN;\n1\n2\n |
+        And database and connection
+        When we run pgmigrate with "-t latest migrate"
+        Then pgmigrate command "failed"
+        And migrate command failed with No end of data marker
+        And database has no schema_version table
+
+    Scenario: Unsupported copy command is reported
+        Given migration dir
+        And migrations
+           | file                     | code                          |
+           | V1__Single_migration.sql | \copy test to 'V1.csv'\n |
+        And database and connection
+        When we run pgmigrate with "-t latest migrate"
+        Then pgmigrate command "failed"
+        And migrate command failed with Unsupported copy command
+
+    Scenario: Missing sidecar file is reported
+        Given migration dir
+        And migrations
+           | file                     | code                                                                  |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint);\n\copy test from 'missing.csv'\n |
+        And database and connection
+        When we run pgmigrate with "-t latest migrate"
+        Then pgmigrate command "failed"
+        And migrate command failed with Unable to read COPY data
+        And database has no schema_version table
+
+    Scenario: Malformed COPY data is reported
+        Given migration dir
+        And migrations
+           | file                     | code                                                                 |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint);\nCOPY test FROM STDIN;\nnot_a_number\n\.\n |
+        And database and connection
+        When we run pgmigrate with "-t latest migrate"
+        Then pgmigrate command "failed"
+        And migrate command failed with Error executing statement from
+        And database has no schema_version table
@@ -0,0 +1,109 @@
+Feature: Migration dependency headers
+
+    Scenario: Info shows schedule computed from dependency headers
+        Given migration dir
+        And migrations
+           | file                                 | code                                                                        |
+           | V1__Create_test_tables.sql           | CREATE TABLE test1 (id bigint); CREATE TABLE test2 (id bigint);             |
+           | V2__NONTRANSACTIONAL_Index_test1.sql | -- pgmigrate: depends=1\nCREATE INDEX CONCURRENTLY test1_idx ON test1 (id); |
+           | V3__NONTRANSACTIONAL_Index_test2.sql | -- pgmigrate: depends=1\nCREATE INDEX CONCURRENTLY test2_idx ON test2 (id); |
+           | V4__Alter_test1.sql                  | ALTER TABLE test1 ADD COLUMN test text;                                     |
+        And file "timings.json" in migration dir
+        """
+        {"1": 0.5, "2": 1.5, "3": 0.5, "4": 1}
+        """
+        And database and connection
+        When we run pgmigrate with "--parallel_workers 2 --timings_file timings.json info"
+        Then pgmigrate command "succeeded"
+        And migrate command output contains ""stage": 2"
+        And migrate command output contains ""stage": 3"
+        And "Schedule of 4 pending versions: critical path length 3" is logged 1 times
+        And "Estimated critical path duration: 3.000 seconds" is logged 1 times
+
+    Scenario: Info shows linear schedule without dependency headers
+        Given migration dir
+        And migrations
+           | file                      | code                                   |
+           | V1__Create_test_table.sql | CREATE TABLE test (id bigint);         |
+           | V2__Alter_test.sql        | ALTER TABLE test ADD COLUMN test text; |
+        And database and connection
+        When we run pgmigrate with "--parallel_workers 2 info"
+        Then pgmigrate command "succeeded"
+        And "Schedule of 2 pending versions: critical path length 2" is logged 1 times
+
+    Scenario: Independent nontransactional branches are applied concurrently
+        Given migration dir
+        And migrations
+           | file                                     | code                                                                             |
+           | V1__Create_test_tables.sql               | CREATE TABLE test1 (id bigint, val bigint); CREATE TABLE test2 (id bigint);      |
+           | V2__NONTRANSACTIONAL_Index_test1.sql     | -- pgmigrate: depends=1\nCREATE INDEX CONCURRENTLY test1_idx ON test1 (id);      |
+           | V3__NONTRANSACTIONAL_Index_test1_val.sql | -- pgmigrate: depends=2\nCREATE INDEX CONCURRENTLY test1_val_idx ON test1 (val); |
+           | V4__NONTRANSACTIONAL_Index_test2.sql     | -- pgmigrate: depends=1\nCREATE INDEX CONCURRENTLY test2_idx ON test2 (id);      |
+           | V5__Alter_test1.sql                      | ALTER TABLE test1 ADD COLUMN test text;                                          |
+        And database and connection
+        When we run pgmigrate with "--parallel_workers 2 -t 5 migrate"
+        Then pgmigrate command "succeeded"
+        And "Migrating to versions 3, 4 in parallel" is logged 1 times
+        And "Migrating to versions 2, 3" is logged 0 times
+        And query "SELECT count(*) FROM schema_version" on database "pgmigratetest" equals
+           | count |
+           | 5     |
+
+    Scenario: Dependency on later version is an error
+        Given migration dir
+        And migrations
+           | file                                | code                                                                      |
+           | V1__Create_test_table.sql           | CREATE TABLE test (id bigint);                                            |
+           | V2__NONTRANSACTIONAL_Index_test.sql | -- pgmigrate: depends=3\nCREATE INDEX CONCURRENTLY test_idx ON test (id); |
+           | V3__Alter_test.sql                  | ALTER TABLE test ADD COLUMN test text;                                    |
+        And database and connection
+        When we run pgmigrate with "--parallel_workers 2 -t 3 migrate"
+        Then pgmigrate command "failed"
+        And migrate command failed with Version 2 depends on later version 3
+
+    Scenario: Dependency on unknown version is an error
+        Given migration dir
+        And migrations
+           | file                      | code                                                              |
+           | V1__Create_test_table.sql | CREATE TABLE test (id bigint);                                    |
+           | V3__Alter_test.sql        | -- pgmigrate: depends=0,2\nALTER TABLE test ADD COLUMN test text; |
+        And database and connection
+        When we run pgmigrate with "--parallel_workers 2 info"
+        Then pgmigrate command "failed"
+        And migrate command failed with Version 3 depends on unknown version 2
+
+    Scenario: Invalid dependency header is an error
+        Given migration dir
+        And migrations
+           | file                      | code                                                                |
+           | V1__Create_test_table.sql | CREATE TABLE test (id bigint);                                      |
+           | V2__Alter_test.sql        | -- pgmigrate: depends=first\nALTER TABLE test ADD COLUMN test text; |
+        And database and connection
+        When we run pgmigrate with "--parallel_workers 2 info"
+        Then pgmigrate command "failed"
+        And migrate command failed with Invalid dependency header
+
+    Scenario: Info without parallel workers ignores dependency headers
+        Given migration dir
+        And migrations
+           | file                      | code                                                                |
+           | V1__Create_test_table.sql | CREATE TABLE test (id bigint);                                      |
+           | V2__Alter_test.sql        | -- pgmigrate: depends=first\nALTER TABLE test ADD COLUMN test text; |
+        And database and connection
+        When we run pgmigrate with "info"
+        Then pgmigrate command "succeeded"
+        And "Schedule of" is logged 0 times
+        And migrate command output contains ""version": 2"
+
+    Scenario: Chunked migration with dependency header
+        Given migration dir
+        And migrations
+           | file                        | code                                                                                                      |
+           | V1__Create_test_table.sql   | CREATE TABLE test (id bigint); INSERT INTO test SELECT generate_series(1, 5);                             |
+           | V2__CHUNKED_Delete_test.sql | -- pgmigrate: depends=1 batch_size=2\nDELETE FROM test WHERE id IN (SELECT id FROM test LIMIT %(limit)s); |
+        And database and connection
+        When we run pgmigrate with "--parallel_workers 2 -t 2 migrate"
+        Then pgmigrate command "succeeded"
+        And query "SELECT count(*) FROM test" on database "pgmigratetest" equals
+           | count |
+           | 0     |
@@ -0,0 +1,184 @@
+Feature: Fleet mode
+
+    Scenario: Migrations are applied to all fleet targets and split once
+        Given migration dir
+        And migrations
+           | file                      | code                             |
+           | V1__Single_migration.sql  | CREATE TABLE test (id bigint);   |
+           | V2__Another_migration.sql | INSERT INTO test VALUES (1);     |
+        And callbacks
+           | type      | file           | code                         |
+           | afterEach | after_each.sql | INSERT INTO test VALUES (0); |
+        And config
+        """
+        fleet_conn:
+            - dbname=pgmigratetest_f1
+            - dbname=pgmigratetest_f2
+        """
+        And fleet databases "pgmigratetest_f1,pgmigratetest_f2"
+        When we run pgmigrate with our callbacks and "-t latest fleet"
+        Then pgmigrate command "succeeded"
+        And fleet report has 2 "succeeded" targets
+        And "Reading statements from" is logged 3 times
+        And query "SELECT count(*), sum(id) FROM test" on database "pgmigratetest_f1" equals
+           | count | sum |
+           | 3     | 1   |
+        And query "SELECT count(*), sum(id) FROM test" on database "pgmigratetest_f2" equals
+           | count | sum |
+           | 3     | 1   |
+
+    Scenario: Failed targets do not stop fleet with continue policy
+        Given migration dir
+        And migrations
+           | file                     | code                           |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint); |
+        And file "targets.txt" in migration dir
+        """
+        # shards
+        dbname=pgmigratetest_f1 password=secret
+        dbname=pgmigratetest_missing
+
+        dbname=pgmigratetest_f2
+        """
+        And fleet databases "pgmigratetest_f1,pgmigratetest_f2"
+        And query "CREATE TABLE test (id bigint)" on database "pgmigratetest_f2"
+        When we run pgmigrate with "--fleet_file targets.txt --fleet_policy continue --fleet_workers 1 -t latest fleet"
+        Then pgmigrate command "failed"
+        And migrate command failed with Fleet migration failed on 2 of 3 targets
+        And fleet report has 1 "succeeded" targets
+        And fleet report has 2 "failed" targets
+        And fleet report contains target "password=*** dbname=pgmigratetest_f1"
+        And query "SELECT count(*) FROM schema_version" on database "pgmigratetest_f1" equals
+           | count |
+           | 1     |
+
+    Scenario: Fleet is stopped on first failed target with stop policy
+        Given migration dir
+        And migrations
+           | file                     | code                           |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint); |
+        And config
+        """
+        fleet_conn:
+            - dbname=pgmigratetest_missing
+            - dbname=pgmigratetest_f1
+        """
+        And fleet databases "pgmigratetest_f1"
+        When we run pgmigrate with "--fleet_workers 1 -t latest fleet"
+        Then pgmigrate command "failed"
+        And fleet report has 1 "failed" targets
+        And fleet report has 1 "skipped" targets
+
+    Scenario: Fleet without targets fails
+        Given migration dir
+        And migrations
+           | file                     | code      |
+           | V1__Single_migration.sql | SELECT 1; |
+        When we run pgmigrate with "-t latest fleet"
+        Then pgmigrate command "failed"
+        And migrate command failed with No fleet targets
+
+    Scenario: Fleet without target version fails
+        Given migration dir
+        And migrations
+           | file                     | code      |
+           | V1__Single_migration.sql | SELECT 1; |
+        When we run pgmigrate with "--fleet_conn dbname=pgmigratetest_f1 fleet"
+        Then pgmigrate command "failed"
+        And migrate command failed with Unknown target
+
+    Scenario: Unexpected fleet policy is reported
+        Given migration dir
+        And migrations
+           | file                     | code      |
+           | V1__Single_migration.sql | SELECT 1; |
+        And config
+        """
+        fleet_policy: retry
+        """
+        When we run pgmigrate with "-t latest fleet"
+        Then pgmigrate command "failed"
+        And migrate command failed with Unexpected fleet policy
+
+    Scenario: Malformed migration fails all fleet targets
+        Given migration dir
+        And migrations
+           | file                     | code                                 |
+           | V1__Single_migration.sql | SELECT 'ünicode';                     |
+        And config
+        """
+        fleet_conn:
+            - dbname=pgmigratetest_f1
+            - dbname=pgmigratetest_f2
+        """
+        And fleet databases "pgmigratetest_f1,pgmigratetest_f2"
+        When we run pgmigrate with "-l 0.1 --fleet_policy continue -t latest fleet"
+        Then pgmigrate command "failed"
+        And fleet report has 2 "failed" targets
+        And "Reading statements from" is logged 1 times
+
+    Scenario: Unexpected error of target is reported as failed target
+        Given migration dir
+        And migration "V1__Single_migration.sql" with invalid utf-8
+        And config
+        """
+        fleet_conn:
+            - dbname=pgmigratetest_f1
+            - dbname=pgmigratetest_f2
+        """
+        And fleet databases "pgmigratetest_f1,pgmigratetest_f2"
+        When we run pgmigrate with "--fleet_policy continue -t latest fleet"
+        Then pgmigrate command "failed"
+        And fleet report has 2 "failed" targets
+        And migrate command failed with Fleet migration failed on 2 of 2 targets
+
+    Scenario: Failed session setup of target stops its terminator
+        Given migration dir
+        And migrations
+           | file                     | code                           |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint); |
+        And config
+        """
+        fleet_conn:
+            - dbname=pgmigratetest_f1
+            - dbname=pgmigratetest_f2
+        session:
+            - SET pgmigrate_unknown_setting = 1
+        """
+        And fleet databases "pgmigratetest_f1,pgmigratetest_f2"
+        When we run pgmigrate with "-l 0.1 --fleet_policy continue -t latest fleet"
+        Then pgmigrate command "failed"
+        And fleet report has 2 "failed" targets
+        And "unrecognized configuration parameter" is logged 2 times
+
+    Scenario: Conflicting backends of fleet target are reported once
+        Given migration dir
+        And migrations
+           | file                     | code                                   |
+           | V1__Alter_test_table.sql | ALTER TABLE test ADD COLUMN test text; |
+        And config
+        """
+        fleet_conn:
+            - dbname=pgmigratetest_f1
+        """
+        And fleet databases "pgmigratetest_f1"
+        And query "CREATE TABLE test (id bigint)" on database "pgmigratetest_f1"
+        And running query "LOCK TABLE test; SELECT pg_sleep(30)" on database "pgmigratetest_f1"
+        When we run pgmigrate with "-l 0.1 --termination_grace 10 -t 1 fleet"
+        Then pgmigrate command "succeeded"
+        And fleet report has 1 "succeeded" targets
+        And "Conflicting backends: 1 cancels, 0 terminations" is logged 1 times
+
+    Scenario: Non-positive fleet workers are rejected
+        Given migration dir
+        And migrations
+           | file                     | code                           |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint); |
+        And config
+        """
+        fleet_conn:
+            - dbname=pgmigratetest_f1
+        """
+        When we run pgmigrate with "--fleet_workers 0 -t latest fleet"
+        Then pgmigrate command "failed"
+        And migrate command failed with Unexpected fleet workers: 0
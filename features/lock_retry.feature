@@ -0,0 +1,45 @@
+Feature: Lock timeout retries
+
+    Scenario: Version blocked for a while is retried
+        Given migration dir
+        And migrations
+           | file                      | code                                   |
+           | V1__Create_test_table.sql | CREATE TABLE test (id bigint);         |
+           | V2__Alter_test_table.sql  | ALTER TABLE test ADD COLUMN test text; |
+        And database and connection
+        And successful pgmigrate run with "-t 1 migrate"
+        And running query "LOCK TABLE test; SELECT pg_sleep(1)"
+        When we run pgmigrate with "--lock_retry 50 --lock_retry_deadline 4 -t 2 migrate"
+        Then pgmigrate command "succeeded"
+        And "Version 2 attempt 1 failed on lock timeout" is logged 1 times
+        And migrate command passed with Retrying version 2 in
+
+    Scenario: Version retries stop on deadline
+        Given migration dir
+        And migrations
+           | file                      | code                                   |
+           | V1__Create_test_table.sql | CREATE TABLE test (id bigint);         |
+           | V2__Alter_test_table.sql  | ALTER TABLE test ADD COLUMN test text; |
+        And database and connection
+        And successful pgmigrate run with "-t 1 migrate"
+        And not committed query "SELECT * FROM test"
+        When we run pgmigrate with "--lock_retry 50 --lock_retry_deadline 0.5 --metrics_file pgmigrate.prom -t 2 migrate"
+        Then migrate command failed with Unable to apply version 2 in
+        And file "pgmigrate.prom" in migration dir contains "pgmigrate_run_success 0"
+        And file "pgmigrate.prom" in migration dir contains "# TYPE pgmigrate_lock_timeouts_total counter"
+
+    Scenario: Batched version is retried
+        Given migration dir
+        And migrations
+           | file                      | code                                                          |
+           | V1__Create_test_table.sql | CREATE TABLE test (id bigint);                                |
+           | V2__Alter_test_table.sql  | ALTER TABLE test ADD COLUMN test text; SELECT 1;              |
+        And database and connection
+        And successful pgmigrate run with "-t 1 migrate"
+        And running query "LOCK TABLE test; SELECT pg_sleep(1)"
+        When we run pgmigrate with "--batch 10 --lock_retry 50 --lock_retry_deadline 4 -t 2 migrate"
+        Then pgmigrate command "succeeded"
+        And "Version 2 attempt 1 failed on lock timeout" is logged 1 times
+        And query "SELECT count(*) FROM information_schema.columns WHERE table_name = 'test'" on database "pgmigratetest" equals
+           | count |
+           | 2     |
@@ -0,0 +1,64 @@
+Feature: Metrics export
+
+    Scenario: Metrics file is written after successful migrate
+        Given migration dir
+        And migrations
+           | file                      | code                                     |
+           | V1__Single_migration.sql  | CREATE TABLE test (id bigint); SELECT 1; |
+           | V2__Another_migration.sql | INSERT INTO test VALUES (1);             |
+        And database and connection
+        When we run pgmigrate with "--metrics_file pgmigrate.prom -t latest migrate"
+        Then pgmigrate command "succeeded"
+        And file "pgmigrate.prom" in migration dir contains "pgmigrate_run_success 1"
+        And file "pgmigrate.prom" in migration dir contains "pgmigrate_run_in_progress 0"
+        And file "pgmigrate.prom" in migration dir contains "pgmigrate_versions_applied_total 2"
+        And file "pgmigrate.prom" in migration dir contains "pgmigrate_statements_total 3"
+        And file "pgmigrate.prom" in migration dir contains "pgmigrate_version_duration_seconds_count 2"
+        And file "pgmigrate.prom" in migration dir contains "pgmigrate_statement_duration_seconds_bucket{le="+Inf"} 3"
+        And file "pgmigrate.prom" in migration dir contains "# TYPE pgmigrate_parsed_bytes_total counter"
+
+    Scenario: Batched statements are counted
+        Given migration dir
+        And migrations
+           | file                      | code                                     |
+           | V1__Single_migration.sql  | CREATE TABLE test (id bigint); SELECT 1; |
+        And database and connection
+        When we run pgmigrate with "--batch 10 --metrics_file pgmigrate.prom -t latest migrate"
+        Then pgmigrate command "succeeded"
+        And file "pgmigrate.prom" in migration dir contains "pgmigrate_statements_total 2"
+        And file "pgmigrate.prom" in migration dir contains "pgmigrate_statement_duration_seconds_count 1"
+
+    Scenario: Metrics file is written after failed migrate
+        Given migration dir
+        And migrations
+           | file                      | code                   |
+           | V1__Single_migration.sql  | SELECT * FROM missing; |
+        And database and connection
+        When we run pgmigrate with "--metrics_file pgmigrate.prom -t latest migrate"
+        Then pgmigrate command "failed"
+        And file "pgmigrate.prom" in migration dir contains "pgmigrate_run_success 0"
+        And file "pgmigrate.prom" in migration dir contains "pgmigrate_versions_applied_total 0"
+
+    Scenario: Metrics file is refreshed during run
+        Given migration dir
+        And migrations
+           | file                      | code                 |
+           | V1__Single_migration.sql  | SELECT pg_sleep(1);  |
+        And database and connection
+        When we run pgmigrate with "--metrics_file pgmigrate.prom --metrics_interval 0.1 -t latest migrate"
+        Then pgmigrate command "succeeded"
+        And file "pgmigrate.prom" in migration dir contains "pgmigrate_run_success 1"
+
+    Scenario: Terminated conflicting backends are counted
+        Given migration dir
+        And migrations
+           | file                      | code                                   |
+           | V1__Create_test_table.sql | CREATE TABLE test (id bigint);         |
+           | V2__Insert_test_data.sql  | INSERT INTO test (id) VALUES (1);      |
+           | V3__Alter_test_table.sql  | ALTER TABLE test ADD COLUMN test text; |
+        And database and connection
+        And successful pgmigrate run with "-t 2 migrate"
+        And not committed query "UPDATE test SET id = 2 WHERE id = 1"
+        When we run pgmigrate with "--metrics_file pgmigrate.prom -l 0.1 -t 3 migrate"
+        Then pgmigrate command "succeeded"
+        And file "pgmigrate.prom" in migration dir contains "pgmigrate_terminated_backends_total 1"
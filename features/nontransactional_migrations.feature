@@ -157,3 +157,29 @@ Feature: Nontransactional migrations support
            | 11  | After all   |
            | 12  | Migration 4 |
            | 13  | Migration 5 |
+
+    Scenario: Callback files are split once per run
+        Given migration dir
+        And migrations
+           | file                               | code                                                 |
+           | V1__Transactional_migration.sql    | INSERT INTO mycooltable (op) values ('Migration 1'); |
+           | V2__Transactional_migration.sql    | INSERT INTO mycooltable (op) values ('Migration 2'); |
+           | V3__NONTRANSACTIONAL_migration.sql | INSERT INTO mycooltable (op) values ('Migration 3'); |
+           | V4__Transactional_migration.sql    | INSERT INTO mycooltable (op) values ('Migration 4'); |
+        And callbacks
+           | type       | file            | code                                                        |
+           | beforeAll  | before_all.sql  | CREATE TABLE mycooltable (seq SERIAL PRIMARY KEY, op TEXT); |
+           | beforeEach | before_each.sql | INSERT INTO mycooltable (op) values ('Before each');        |
+        And database and connection
+        When we run pgmigrate with our callbacks and "-t latest migrate"
+        Then pgmigrate command "succeeded"
+        And "Reading statements from" is logged 6 times
+        And query "SELECT * from mycooltable order by seq;" equals
+           | seq | op          |
+           | 1   | Before each |
+           | 2   | Migration 1 |
+           | 3   | Before each |
+           | 4   | Migration 2 |
+           | 5   | Migration 3 |
+           | 6   | Before each |
+           | 7   | Migration 4 |
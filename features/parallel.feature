@@ -0,0 +1,88 @@
+Feature: Parallel nontransactional migrations
+
+    Scenario: Adjacent parallel nontransactional migrations are applied concurrently
+        Given migration dir
+        And migrations
+           | file                                          | code                                                                      |
+           | V1__Create_test_tables.sql                    | CREATE TABLE test1 (id bigint); CREATE TABLE test2 (id bigint);           |
+           | V2__NONTRANSACTIONAL_PARALLEL_Index_test1.sql | SELECT pg_sleep(0.5);\nCREATE INDEX CONCURRENTLY test1_idx ON test1 (id); |
+           | V3__NONTRANSACTIONAL_PARALLEL_Index_test2.sql | SELECT pg_sleep(0.5);\nCREATE INDEX CONCURRENTLY test2_idx ON test2 (id); |
+           | V4__Alter_test1.sql                           | ALTER TABLE test1 ADD COLUMN test text;                                   |
+        And database and connection
+        When we run pgmigrate with "-l 0.1 --parallel_workers 2 -t 4 migrate"
+        Then pgmigrate command "succeeded"
+        And "Migrating to versions 2, 3 in parallel" is logged 1 times
+        And "Terminated conflicting pid" is logged 0 times
+        And query "SELECT string_agg(version::text, ',' ORDER BY installed_on, version) FROM schema_version" on database "pgmigratetest" equals
+           | versions |
+           | 1,2,3,4  |
+
+    Scenario: Parallel nontransactional migrations after applied ones
+        Given migration dir
+        And migrations
+           | file                                          | code                                                            |
+           | V1__Create_test_tables.sql                    | CREATE TABLE test1 (id bigint); CREATE TABLE test2 (id bigint); |
+           | V2__NONTRANSACTIONAL_PARALLEL_Index_test1.sql | CREATE INDEX CONCURRENTLY test1_idx ON test1 (id);              |
+           | V3__NONTRANSACTIONAL_PARALLEL_Index_test2.sql | CREATE INDEX CONCURRENTLY test2_idx ON test2 (id);              |
+        And database and connection
+        And successful pgmigrate run with "-t 1 migrate"
+        When we run pgmigrate with "--parallel_workers 2 -t 3 migrate"
+        Then pgmigrate command "succeeded"
+        And "Migrating to versions 2, 3 in parallel" is logged 1 times
+        And query "SELECT count(*) FROM schema_version" on database "pgmigratetest" equals
+           | count |
+           | 3     |
+
+    Scenario: Failed parallel migration keeps other versions unrecorded
+        Given migration dir
+        And migrations
+           | file                                          | code                                               |
+           | V1__Create_test_tables.sql                    | CREATE TABLE test1 (id bigint);                    |
+           | V2__NONTRANSACTIONAL_PARALLEL_Index_test1.sql | CREATE INDEX CONCURRENTLY test1_idx ON test1 (id); |
+           | V3__NONTRANSACTIONAL_PARALLEL_Select.sql      | SELECT * FROM missing;                             |
+        And database and connection
+        When we run pgmigrate with "--parallel_workers 2 -t 3 migrate"
+        Then pgmigrate command "failed"
+        And "Version 3 failed" is logged 1 times
+        And query "SELECT count(*) FROM schema_version" on database "pgmigratetest" equals
+           | count |
+           | 1     |
+        Given file "migrations/V3__NONTRANSACTIONAL_PARALLEL_Select.sql" in migration dir
+        """
+        SELECT 1;
+        """
+        When we run pgmigrate with "--parallel_workers 2 -t 3 migrate"
+        Then pgmigrate command "succeeded"
+        And "Skipping statement 1 of version 2 (completed by previous run)" is logged 1 times
+        And query "SELECT count(*) FROM schema_version_progress" on database "pgmigratetest" equals
+           | count |
+           | 0     |
+
+    Scenario: Parallel marker is ignored without parallel workers
+        Given migration dir
+        And migrations
+           | file                                          | code                                                            |
+           | V1__Create_test_tables.sql                    | CREATE TABLE test1 (id bigint); CREATE TABLE test2 (id bigint); |
+           | V2__NONTRANSACTIONAL_PARALLEL_Index_test1.sql | CREATE INDEX CONCURRENTLY test1_idx ON test1 (id);              |
+           | V3__NONTRANSACTIONAL_PARALLEL_Index_test2.sql | CREATE INDEX CONCURRENTLY test2_idx ON test2 (id);              |
+        And database and connection
+        When we run pgmigrate with "-t 3 migrate"
+        Then pgmigrate command "succeeded"
+        And "in parallel" is logged 0 times
+
+    Scenario: Parallel nontransactional migrations with prefetch
+        Given migration dir
+        And migrations
+           | file                                          | code                                                                                            |
+           | V1__Create_test_tables.sql                    | CREATE TABLE test1 (id bigint); CREATE TABLE test2 (id bigint); CREATE TABLE test3 (id bigint); |
+           | V2__NONTRANSACTIONAL_PARALLEL_Index_test1.sql | CREATE INDEX CONCURRENTLY test1_idx ON test1 (id);\nSELECT 1;                                   |
+           | V3__NONTRANSACTIONAL_PARALLEL_Index_test2.sql | CREATE INDEX CONCURRENTLY test2_idx ON test2 (id);\nSELECT 2;                                   |
+           | V4__NONTRANSACTIONAL_PARALLEL_Index_test3.sql | CREATE INDEX CONCURRENTLY test3_idx ON test3 (id);\nSELECT 3;                                   |
+        And database and connection
+        And successful pgmigrate run with "-t 1 migrate"
+        When we run pgmigrate with "--prefetch 2 --parallel_workers 3 -t 4 migrate"
+        Then pgmigrate command "succeeded"
+        And "Migrating to versions 2, 3, 4 in parallel" is logged 1 times
+        And query "SELECT count(*) FROM pg_index WHERE indisvalid AND indexrelid::regclass::text LIKE 'test%_idx'" on database "pgmigratetest" equals
+           | count |
+           | 3     |
@@ -0,0 +1,66 @@
+Feature: Background preparation of upcoming migrations
+
+    Scenario: Migrations prepared in background are applied in order
+        Given migration dir
+        And migrations
+           | file                        | code                                                 |
+           | V1__Single_migration.sql    | INSERT INTO mycooltable (op) values ('Migration 1'); |
+           | V2__Another_migration.sql   | INSERT INTO mycooltable (op) values ('Migration 2'); |
+           | V3__Third_migration.sql     | INSERT INTO mycooltable (op) values ('Migration 3'); |
+           | V4__Fourth_migration.sql    | INSERT INTO mycooltable (op) values ('Migration 4'); |
+        And callbacks
+           | type       | file            | code                                                        |
+           | beforeAll  | before_all.sql  | CREATE TABLE mycooltable (seq SERIAL PRIMARY KEY, op TEXT); |
+           | afterEach  | after_each.sql  | INSERT INTO mycooltable (op) values ('After each');         |
+        And database and connection
+        When we run pgmigrate with our callbacks and "--prefetch 2 -t latest migrate"
+        Then pgmigrate command "succeeded"
+        And "Reading statements from" is logged 6 times
+        And query "SELECT * from mycooltable order by seq;" equals
+           | seq | op          |
+           | 1   | Migration 1 |
+           | 2   | After each  |
+           | 3   | Migration 2 |
+           | 4   | After each  |
+           | 5   | Migration 3 |
+           | 6   | After each  |
+           | 7   | Migration 4 |
+           | 8   | After each  |
+
+    Scenario: Malformed migration prepared in background fails migration
+        Given migration dir
+        And migrations
+           | file                        | code                           |
+           | V1__Single_migration.sql    | CREATE TABLE test (id bigint); |
+           | V2__Another_migration.sql   | SELECT 'テスト';               |
+           | V3__Third_migration.sql     | SELECT 1;                      |
+        And database and connection
+        When we run pgmigrate with "--prefetch 3 -t latest migrate"
+        Then pgmigrate command "failed"
+        And migrate command failed with Non ascii symbols in file
+        And database has no schema_version table
+
+    Scenario: Mixed migrations prepared in background are applied
+        Given migration dir
+        And migrations
+           | file                               | code                                                        |
+           | V1__Transactional_migration.sql    | CREATE TABLE mycooltable (seq SERIAL PRIMARY KEY, op TEXT); |
+           | V2__NONTRANSACTIONAL_migration.sql | INSERT INTO mycooltable (op) values ('Migration 2');        |
+           | V3__Transactional_migration.sql    | INSERT INTO mycooltable (op) values ('Migration 3');        |
+        And database and connection
+        When we run pgmigrate with "--prefetch 1 -t latest migrate"
+        Then pgmigrate command "succeeded"
+        And query "SELECT * from mycooltable order by seq;" equals
+           | seq | op          |
+           | 1   | Migration 2 |
+           | 2   | Migration 3 |
+
+    Scenario: Negative prefetch depth is rejected
+        Given migration dir
+        And migrations
+           | file                     | code                           |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint); |
+        And database and connection
+        When we run pgmigrate with "--prefetch -1 -t latest migrate"
+        Then pgmigrate command "failed"
+        And migrate command failed with Unexpected prefetch: -1
@@ -0,0 +1,57 @@
+Feature: Lock impact preview
+
+    Scenario: Preview reports locks, rewrites and affected rows
+        Given migration dir
+        And migrations
+           | file                           | code                                                                                    |
+           | V1__Create_test.sql            | CREATE TABLE test (id bigint); INSERT INTO test SELECT generate_series(1, 10);          |
+           | V2__Rewrite_test.sql           | ALTER TABLE test ALTER COLUMN id TYPE int; UPDATE test SET id = id + 1 WHERE id < 4;    |
+           | V3__Delete_test.sql            | DELETE FROM test WHERE id > 8;                                                          |
+           | V4__NONTRANSACTIONAL_Index.sql | CREATE INDEX CONCURRENTLY test_idx ON test (id);                                        |
+           | V5__Drop_test.sql              | CREATE TABLE test2 (id bigint); DROP TABLE test;                                        |
+        And database and connection
+        And successful pgmigrate run with "-t 1 migrate"
+        When we run pgmigrate with "-t latest preview"
+        Then pgmigrate command "succeeded"
+        And migrate command output key "2.rewritten" equals ["public.test"]
+        And migrate command output key "2.rows" equals {"public.test": {"inserted": 0, "updated": 3, "deleted": 0}}
+        And migrate command output key "3.locks" equals {"public.test": ["AccessExclusiveLock", "RowExclusiveLock", "ShareLock"]}
+        And migrate command output key "3.rewritten" equals []
+        And migrate command output key "3.rows" equals {"public.test": {"inserted": 0, "updated": 0, "deleted": 2}}
+        And migrate command output key "4.skipped" equals "nontransactional"
+        And migrate command output key "5.created" equals ["public.test2"]
+        And migrate command output key "5.dropped" equals ["public.test"]
+        And migrate command output contains ""AccessExclusiveLock""
+        And query "SELECT count(*) FROM test" on database "pgmigratetest" equals
+           | count |
+           | 10    |
+        And query "SELECT count(*) FROM schema_version" on database "pgmigratetest" equals
+           | count |
+           | 1     |
+
+    Scenario: Preview on empty database is rolled back
+        Given migration dir
+        And migrations
+           | file                | code                           |
+           | V1__Create_test.sql | CREATE TABLE test (id bigint); |
+        And database and connection
+        When we run pgmigrate with "-t latest preview"
+        Then pgmigrate command "succeeded"
+        And migrate command output key "1.created" equals ["public.test"]
+        And migrate command output key "1.locks" equals {"public.test": ["AccessExclusiveLock"]}
+        And database has no schema_version table
+
+    Scenario: Preview stops on failed version
+        Given migration dir
+        And migrations
+           | file                | code                            |
+           | V1__Create_test.sql | CREATE TABLE test (id bigint);  |
+           | V2__Insert.sql      | INSERT INTO missing VALUES (1); |
+           | V3__Insert.sql      | INSERT INTO test VALUES (1);    |
+        And database and connection
+        When we run pgmigrate with "-t latest preview"
+        Then pgmigrate command "failed"
+        And migrate command failed with Preview of pending versions failed
+        And migrate command output contains "does not exist"
+        And migrate command output key "3.skipped" equals "previous version failed"
+        And database has no schema_version table
@@ -0,0 +1,65 @@
+Feature: Run profile
+
+    Scenario: Phases of migrate are written to trace
+        Given migration dir
+        And migrations
+           | file                | code                                                       |
+           | V1__Create_test.sql | CREATE TABLE test (id bigint);                             |
+           | V2__Insert_test.sql | INSERT INTO test VALUES (1);\nINSERT INTO test VALUES (2); |
+        And callbacks
+           | type     | file          | code                         |
+           | afterAll | after_all.sql | INSERT INTO test VALUES (3); |
+        And database and connection
+        When we run pgmigrate with our callbacks and "--profile trace.json -t latest migrate"
+        Then pgmigrate command "succeeded"
+        And trace "trace.json" in migration dir has spans
+           | cat      | name                |
+           | config   | config              |
+           | connect  | connect             |
+           | command  | migrate             |
+           | state    | pending versions    |
+           | state    | state               |
+           | plan     | plan                |
+           | version  | V1                  |
+           | parse    | V2__Insert_test.sql |
+           | execute  | statement           |
+           | callback | after_all.sql       |
+           | commit   | commit              |
+
+    Scenario: Batches, schema checks and intermediate commits are written to trace
+        Given migration dir
+        And migrations
+           | file                | code                                                                                   |
+           | V1__Create_test.sql | CREATE TABLE "test-schema".test (id bigint);                                           |
+           | V2__Insert_test.sql | INSERT INTO "test-schema".test VALUES (1);\nINSERT INTO "test-schema".test VALUES (2); |
+        And database and connection
+        When we run pgmigrate with "--profile trace.json --batch 10 --commit_every 1 -m test-schema -t latest migrate"
+        Then pgmigrate command "succeeded"
+        And trace "trace.json" in migration dir has spans
+           | cat          | name         |
+           | execute      | batch        |
+           | schema check | schema check |
+           | commit       | commit       |
+
+    Scenario: Trace and cProfile stats are written on failure
+        Given migration dir
+        And migrations
+           | file                | code                            |
+           | V1__Insert_test.sql | INSERT INTO missing VALUES (1); |
+        And database and connection
+        When we run pgmigrate with "--profile trace.json --profile_stats profile.stats -t latest migrate"
+        Then pgmigrate command "failed"
+        And trace "trace.json" in migration dir has spans
+           | cat     | name    |
+           | command | migrate |
+           | version | V1      |
+        And stats "profile.stats" in migration dir have function "_run_command"
+
+    Scenario: cProfile stats are written without trace
+        Given migration dir
+        And migrations
+           | file                | code                           |
+           | V1__Create_test.sql | CREATE TABLE test (id bigint); |
+        When we run pgmigrate with "--profile_stats profile.stats list"
+        Then pgmigrate command "succeeded"
+        And stats "profile.stats" in migration dir have function "list_migrations"
@@ -0,0 +1,55 @@
+Feature: Replication lag throttling
+
+    Scenario: Migration waits for replica replay
+        Given migration dir
+        And migrations
+           | file                                | code                                                             |
+           | V1__Create_test_table.sql           | CREATE TABLE test (id bigint);                                   |
+           | V2__NONTRANSACTIONAL_fill_table.sql | INSERT INTO test SELECT generate_series(1, 2000); SELECT 1;     |
+        And database and connection
+        And replica with 0.2 seconds replay delay
+        When we run pgmigrate with "--max_lag_bytes 0 --lag_check_interval 0.1 --wait_replicas -t 2 migrate"
+        Then pgmigrate command "succeeded"
+        And migrate command passed with Paused for
+        And migrate command passed with Replicas replayed
+
+    Scenario: Migration fails on replica lag timeout
+        Given migration dir
+        And migrations
+           | file                                | code                                              |
+           | V1__Create_test_table.sql           | CREATE TABLE test (id bigint);                    |
+           | V2__NONTRANSACTIONAL_fill_table.sql | INSERT INTO test SELECT generate_series(1, 2000); |
+        And database and connection
+        And stuck replica
+        When we run pgmigrate with "--max_lag_bytes 0 --lag_check_interval 0.1 --lag_timeout 0.5 -t 2 migrate"
+        Then migrate command failed with Replicas lag is not caught up in 0.5 seconds: stuck
+
+    Scenario: Final wait for replicas fails on timeout
+        Given migration dir
+        And migrations
+           | file                      | code                           |
+           | V1__Create_test_table.sql | CREATE TABLE test (id bigint); |
+        And database and connection
+        And stuck replica
+        When we run pgmigrate with "--wait_replicas --lag_check_interval 0.1 --lag_timeout 0.5 --metrics_file pgmigrate.prom -t 1 migrate"
+        Then migrate command failed with Replicas lag is not caught up in 0.5 seconds: stuck
+        And migrate command failed with Migration is committed, only wait for replicas timed out
+        And migrate command failed with Waiting for replica stuck (lag
+        And pgmigrate command exited with code 4
+        And file "pgmigrate.prom" in migration dir contains "pgmigrate_run_success 0"
+        And database contains schema_version
+        And query "SELECT count(*) AS versions, to_regclass('test')::text AS test FROM public.schema_version" equals
+           | versions | test |
+           | 1        | test |
+
+    Scenario: Migration without replicas does not wait
+        Given migration dir
+        And migrations
+           | file                      | code                           |
+           | V1__Create_test_table.sql | CREATE TABLE test (id bigint); |
+        And database and connection
+        And no replicas
+        When we run pgmigrate with "--max_lag_bytes 0 --max_lag_seconds 0 --wait_replicas --metrics_file pgmigrate.prom -t 1 migrate"
+        Then pgmigrate command "succeeded"
+        And "Paused for" is logged 0 times
+        And file "pgmigrate.prom" in migration dir contains "pgmigrate_replication_wait_seconds_total"
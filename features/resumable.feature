@@ -0,0 +1,78 @@
+Feature: Resumable nontransactional migrations
+
+    Scenario: Failed nontransactional migration resumes from failed statement
+        Given migration dir
+        And migrations
+           | file                                 | code                                                                                                 |
+           | V1__Create_test_table.sql            | CREATE TABLE test (id bigint); INSERT INTO test VALUES (1), (1);                                     |
+           | V2__NONTRANSACTIONAL_Add_indexes.sql | CREATE TABLE test2 (id bigint);\nCREATE UNIQUE INDEX CONCURRENTLY "Test_id_idx" ON public.test (id); |
+        And database and connection
+        And successful pgmigrate run with "-t 1 migrate"
+        When we run pgmigrate with "-t 2 migrate"
+        Then pgmigrate command "failed"
+        Given query "DELETE FROM test WHERE ctid = (SELECT max(ctid) FROM test)"
+        When we run pgmigrate with "-t 2 migrate"
+        Then migrate command failed with Invalid index "Test_id_idx" is left by previous run
+        When we run pgmigrate with "--drop_invalid_indexes -t 2 migrate"
+        Then pgmigrate command "succeeded"
+        And "Skipping statement 1 of version 2 (completed by previous run)" is logged 1 times
+        And "Dropping invalid index "Test_id_idx" left by previous run" is logged 1 times
+        And query "SELECT count(*) FROM pg_index WHERE indisvalid AND indexrelid = '"Test_id_idx"'::regclass" on database "pgmigratetest" equals
+           | count |
+           | 1     |
+        And query "SELECT count(*) FROM schema_version_progress" on database "pgmigratetest" equals
+           | count |
+           | 0     |
+
+    Scenario: Changed completed statement is not skipped
+        Given migration dir
+        And migrations
+           | file                               | code                                                    |
+           | V1__Create_test_table.sql          | CREATE TABLE test (id bigint);                          |
+           | V2__NONTRANSACTIONAL_Add_index.sql | CREATE TABLE test2 (id bigint);\nSELECT * FROM missing; |
+        And database and connection
+        And successful pgmigrate run with "-t 1 migrate"
+        When we run pgmigrate with "-t 2 migrate"
+        Then pgmigrate command "failed"
+        Given file "migrations/V2__NONTRANSACTIONAL_Add_index.sql" in migration dir
+        """
+        CREATE TABLE test3 (id bigint);
+        CREATE INDEX CONCURRENTLY Test_idx ON test (id);
+        """
+        When we run pgmigrate with "-t 2 migrate"
+        Then migrate command failed with Statement 1 of
+        And migrate command failed with was changed after previous run
+
+    Scenario: Nontransactional migration with COPY data
+        Given migration dir
+        And migrations
+           | file                               | code                                                                                   |
+           | V1__Create_test_table.sql          | CREATE TABLE test (id bigint);                                                         |
+           | V2__NONTRANSACTIONAL_Load_data.sql | COPY test (id) FROM STDIN;\n1\n2\n\.\nCREATE INDEX CONCURRENTLY Test_idx ON test (id); |
+        And database and connection
+        When we run pgmigrate with "-t 2 migrate"
+        Then pgmigrate command "succeeded"
+        And query "SELECT count(*) FROM test" on database "pgmigratetest" equals
+           | count |
+           | 2     |
+
+    Scenario: Failure to record nontransactional version keeps its progress
+        Given migration dir
+        And migrations
+           | file                                  | code                                                                                                                                                                                                                                                                                                                                       |
+           | V1__Create_test_table.sql             | CREATE TABLE ready (id bigint); CREATE FUNCTION check_ready() RETURNS trigger LANGUAGE plpgsql AS $$BEGIN IF NOT EXISTS (SELECT 1 FROM ready) THEN RAISE EXCEPTION 'not ready'; END IF; RETURN NEW; END$$; CREATE TRIGGER check_ready BEFORE INSERT ON schema_version FOR EACH ROW WHEN (NEW.version = 2) EXECUTE PROCEDURE check_ready(); |
+           | V2__NONTRANSACTIONAL_Create_table.sql | CREATE TABLE test2 (id bigint);\nCREATE TABLE test3 (id bigint);                                                                                                                                                                                                                                                                           |
+        And database and connection
+        And successful pgmigrate run with "-t 1 migrate"
+        When we run pgmigrate with "-t 2 migrate"
+        Then migrate command failed with not ready
+        And query "SELECT count(*) FROM schema_version_progress" on database "pgmigratetest" equals
+           | count |
+           | 2     |
+        Given query "INSERT INTO ready VALUES (1)"
+        When we run pgmigrate with "-t 2 migrate"
+        Then pgmigrate command "succeeded"
+        And "Skipping statement 2 of version 2 (completed by previous run)" is logged 1 times
+        And query "SELECT count(*) FROM schema_version_progress" on database "pgmigratetest" equals
+           | count |
+           | 0     |
@@ -0,0 +1,79 @@
+Feature: Large relation rewrite guard
+
+    Scenario: Rewrite of large relation is blocked
+        Given migration dir
+        And migrations
+           | file               | code                                                     |
+           | V1__Create_big.sql | CREATE TABLE big AS SELECT generate_series(1, 10000) id; |
+           | V2__Alter_big.sql  | ALTER TABLE big ALTER COLUMN id TYPE bigint;             |
+        And database and connection
+        And successful pgmigrate run with "-t 1 migrate"
+        When we run pgmigrate with "--max_rewrite_size 65536 -t 2 migrate"
+        Then pgmigrate command "failed"
+        And migrate command failed with Relations larger than 65536 bytes would be rewritten or scanned: public.big
+        And "Version 2 would rewrite public.big" is logged 1 times
+        And query "SELECT count(*) FROM schema_version" on database "pgmigratetest" equals
+           | count |
+           | 1     |
+
+    Scenario: Rewrite of large relation is applied with confirmation
+        Given migration dir
+        And migrations
+           | file               | code                                                     |
+           | V1__Create_big.sql | CREATE TABLE big AS SELECT generate_series(1, 10000) id; |
+           | V2__Alter_big.sql  | ALTER TABLE big ALTER COLUMN id TYPE bigint;             |
+        And database and connection
+        And successful pgmigrate run with "-t 1 migrate"
+        When we run pgmigrate with "--max_rewrite_size 65536 --confirm_rewrite big -t 2 migrate"
+        Then pgmigrate command "succeeded"
+        And "Version 2 will rewrite public.big" is logged 1 times
+
+    Scenario: Small and new relations are not blocked
+        Given migration dir
+        And migrations
+           | file                 | code                                                     |
+           | V1__Create_small.sql | CREATE TABLE small (id int);                             |
+           | V2__Alter_small.sql  | ALTER TABLE small ALTER COLUMN id TYPE bigint;           |
+           | V3__Create_big.sql   | CREATE TABLE big AS SELECT generate_series(1, 10000) id; |
+           | V4__Index_big.sql    | CREATE INDEX ON big (id);                                |
+        And database and connection
+        And successful pgmigrate run with "-t 1 migrate"
+        When we run pgmigrate with "--max_rewrite_size 65536 -t latest migrate"
+        Then pgmigrate command "succeeded"
+        And "would" is logged 0 times
+
+    Scenario Outline: Operations rewriting or scanning large relation are detected
+        Given migration dir
+        And migrations
+           | file               | code                                                     |
+           | V1__Create_big.sql | CREATE TABLE big AS SELECT generate_series(1, 10000) id; |
+           | V2__Change_big.sql | <code>                                                   |
+        And database and connection
+        And successful pgmigrate run with "-t 1 migrate"
+        When we run pgmigrate with "--max_rewrite_size 65536 -t 2 migrate"
+        Then pgmigrate command "<result>"
+        And "would <kind> public.big" is logged <count> times
+
+        Examples:
+           | code                                                                  | result    | kind    | count |
+           | ALTER TABLE big ALTER id SET NOT NULL;                                | failed    | scan    | 1     |
+           | ALTER TABLE big ADD CONSTRAINT c CHECK (id > 0);                      | failed    | scan    | 1     |
+           | ALTER TABLE big ADD CHECK (id > 0) NOT VALID;                         | succeeded | scan    | 0     |
+           | ALTER TABLE big ADD COLUMN name text;                                 | succeeded | rewrite | 0     |
+           | ALTER TABLE public.big SET UNLOGGED;                                  | failed    | rewrite | 1     |
+           | CREATE INDEX big_id_idx ON big (id);                                  | failed    | scan    | 1     |
+           | CLUSTER big USING big_id_idx;                                         | failed    | rewrite | 1     |
+           | VACUUM FULL big;                                                      | failed    | rewrite | 1     |
+           | REINDEX TABLE big;                                                    | failed    | scan    | 1     |
+           | ALTER TABLE big ADD COLUMN r float8 DEFAULT random();                 | failed    | rewrite | 1     |
+           | ALTER TABLE big ADD COLUMN t timestamptz DEFAULT clock_timestamp();   | failed    | rewrite | 1     |
+           | ALTER TABLE big ADD COLUMN u uuid DEFAULT gen_random_uuid();          | failed    | rewrite | 1     |
+           | ALTER TABLE big ADD COLUMN t timestamptz DEFAULT now();               | succeeded | rewrite | 0     |
+           | ALTER TABLE big ADD COLUMN n numeric(10, 2) DEFAULT 0;                | succeeded | rewrite | 0     |
+           | ALTER TABLE big ADD COLUMN d int GENERATED ALWAYS AS (id * 2) STORED; | failed    | rewrite | 1     |
+           | ALTER TABLE big ADD COLUMN s bigserial;                               | failed    | rewrite | 1     |
+           | ALTER TABLE big ADD COLUMN i int GENERATED BY DEFAULT AS IDENTITY;    | failed    | rewrite | 1     |
+           | ALTER TABLE big ADD COLUMN k int UNIQUE;                              | failed    | scan    | 1     |
+           | ALTER TABLE big ADD COLUMN p serial PRIMARY KEY;                      | failed    | rewrite | 1     |
+           | INSERT INTO big VALUES (1);                                           | succeeded | scan    | 0     |
+           | COPY big FROM STDIN;\n1\n\.\n                                         | succeeded | scan    | 0     |
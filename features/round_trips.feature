@@ -0,0 +1,38 @@
+Feature: Database round trips
+
+    Scenario: Migrate of initialized database loads state with few queries
+        Given migration dir
+        And migrations
+           | file                | code                                   |
+           | V1__Create_test.sql | CREATE TABLE test (id bigint);         |
+           | V2__Alter_test.sql  | ALTER TABLE test ADD COLUMN name text; |
+        And database and connection
+        And successful pgmigrate run with "-t 1 migrate"
+        When we run pgmigrate with "-t 2 migrate"
+        Then pgmigrate command "succeeded"
+        And "Database round trips: 7" is logged 1 times
+        And "information_schema" is logged 0 times
+        And "SELECT CURRENT_USER" is logged 0 times
+
+    Scenario: Up to date database is checked with few queries
+        Given migration dir
+        And migrations
+           | file                | code                           |
+           | V1__Create_test.sql | CREATE TABLE test (id bigint); |
+        And database and connection
+        And successful pgmigrate run with "-t 1 migrate"
+        When we run pgmigrate with "-t latest migrate"
+        Then pgmigrate command "succeeded"
+        And "Database is up to date" is logged 1 times
+        And "Database round trips: 3" is logged 1 times
+
+    Scenario: Installed time of versions is formatted by database
+        Given migration dir
+        And migrations
+           | file                | code                           |
+           | V1__Create_test.sql | CREATE TABLE test (id bigint); |
+        And database and connection
+        And successful pgmigrate run with "-t 1 migrate"
+        When we run pgmigrate with "-t 1 info"
+        Then pgmigrate command "succeeded"
+        And migrate command output key "1.installed_on" matches "^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$"
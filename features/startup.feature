@@ -0,0 +1,43 @@
+Feature: Startup
+
+    Scenario: Migrations are listed without database connection
+        Given migration dir
+        And migrations
+           | file                      | code                           |
+           | V1__Single_migration.sql  | CREATE TABLE test (id bigint); |
+           | V2__Another_migration.sql | SELECT 1;                      |
+        When we run pgmigrate with "-c port=1 -t 1 list"
+        Then pgmigrate command "succeeded"
+        And migrate command output contains ""description": "Single migration""
+        And "Schedule of" is logged 0 times
+
+    Scenario: List shows schedule from dependency headers
+        Given migration dir
+        And migrations
+           | file                      | code                                   |
+           | V1__Create_test_table.sql | CREATE TABLE test (id bigint);         |
+           | V2__Alter_test.sql        | ALTER TABLE test ADD COLUMN test text; |
+           | V3__Select.sql            | -- pgmigrate: depends=1\nSELECT 1;     |
+        When we run pgmigrate with "-c port=1 --parallel_workers 2 list"
+        Then pgmigrate command "succeeded"
+        And migrate command output contains ""stage": 2"
+
+    Scenario: Info does not start conflicting pids terminator
+        Given migration dir
+        And migrations
+           | file                     | code                           |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint); |
+        And database and connection
+        When we run pgmigrate with "-l 0.1 info"
+        Then pgmigrate command "succeeded"
+        And "pg_blocking_pids" is logged 0 times
+
+    Scenario: Heavy modules are not imported on startup
+        Then module import does not load "sqlparse,yaml,psycopg2.extras"
+
+    Scenario: Listing migrations is fast
+        Given migration dir
+        And migrations
+           | file                     | code                           |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint); |
+        Then pgmigrate "-c port=1 list" starts in less than 1.0 seconds
@@ -0,0 +1,77 @@
+Feature: On-disk cache of split statements
+
+    Scenario: Statements are cached and reused
+        Given migration dir
+        And migrations
+           | file                      | code                                              |
+           | V1__Single_migration.sql  | CREATE TABLE test (id bigint); -- comment         |
+           | V2__Another_migration.sql | INSERT INTO test (id) VALUES (1); SELECT 'a;b';   |
+        And callbacks
+           | type      | file           | code                              |
+           | afterEach | after_each.sql | INSERT INTO test (id) VALUES (0); |
+        And database and connection
+        And successful pgmigrate run with our callbacks and "--cache_dir .pgmigrate-cache -t latest migrate"
+        Then cache dir ".pgmigrate-cache" contains 3 entries
+        Given database and connection
+        When we run pgmigrate with our callbacks and "--cache_dir .pgmigrate-cache -t latest migrate"
+        Then pgmigrate command "succeeded"
+        And cache dir ".pgmigrate-cache" contains 3 entries
+        And query "SELECT count(*), sum(id) FROM test" equals
+           | count | sum |
+           | 3     | 1   |
+
+    Scenario: Cache dir is scanned once while filling cache
+        Given migration dir
+        And migrations
+           | file                      | code      |
+           | V1__Single_migration.sql  | SELECT 1; |
+           | V2__Another_migration.sql | SELECT 2; |
+           | V3__Third_migration.sql   | SELECT 3; |
+        And database and connection
+        When we run pgmigrate with "--cache_dir .pgmigrate-cache -t 3 migrate"
+        Then pgmigrate command "succeeded"
+        And cache dir ".pgmigrate-cache" contains 3 entries
+        And "Scanning statement cache" is logged 1 times
+
+    Scenario: Statements are cached separately for each parser
+        Given migration dir
+        And migrations
+           | file                     | code      |
+           | V1__Single_migration.sql | SELECT 1; |
+        And database and connection
+        And successful pgmigrate run with "--cache_dir .pgmigrate-cache -t 1 --dryrun migrate"
+        When we run pgmigrate with "--parser sqlparse --cache_dir .pgmigrate-cache -t 1 migrate"
+        Then pgmigrate command "succeeded"
+        And cache dir ".pgmigrate-cache" contains 2 entries
+
+    Scenario: Least recently used statements are evicted from cache
+        Given migration dir
+        And migrations
+           | file                      | code      |
+           | V1__Single_migration.sql  | SELECT 1; |
+           | V2__Another_migration.sql | SELECT 2; |
+        And database and connection
+        When we run pgmigrate with "--cache_dir .pgmigrate-cache --cache_size 20 -t 2 migrate"
+        Then pgmigrate command "succeeded"
+        And cache dir ".pgmigrate-cache" contains 1 entries
+
+    Scenario: Statements of failed file are not cached
+        Given migration dir
+        And migrations
+           | file                     | code                               |
+           | V1__Single_migration.sql | SELECT 1; THIS_IS_ERROR; SELECT 2; |
+        And database and connection
+        When we run pgmigrate with "--cache_dir .pgmigrate-cache -t 1 migrate"
+        Then pgmigrate command "failed"
+        And migrate command failed with THIS_IS_ERROR
+        And cache dir ".pgmigrate-cache" contains 0 entries
+
+    Scenario: Cache path is not a directory
+        Given migration dir
+        And migrations
+           | file                     | code      |
+           | V1__Single_migration.sql | SELECT 1; |
+        And database and connection
+        When we run pgmigrate with "--cache_dir migrations/V1__Single_migration.sql -t 1 migrate"
+        Then pgmigrate command "failed"
+        And migrate command failed with Cache path is not a directory
@@ -0,0 +1,73 @@
+Feature: Native statement splitter
+
+    Scenario: Native splitter is conformant with sqlparse on feature migrations
+        Then native splitter matches sqlparse on all feature migrations
+
+    Scenario: Native splitter is conformant with sqlparse on corner cases
+        Then native splitter matches sqlparse on
+           | code                                                                                        |
+           | SELECT 1; -- comment\nSELECT 2;                                                             |
+           | SELECT 1 -- trailing comment                                                                |
+           | select /* inline */ 1; select 2                                                             |
+           | /* leading */ SELECT 1;\n/* trailing */                                                     |
+           | SELECT 'a;b'; SELECT "c;d" FROM t;                                                          |
+           | SELECT $$;$$; SELECT $tag$ $$;$$ $tag$;                                                     |
+           | SELECT E'it\'s;'; SELECT 'it''s;';                                                           |
+           | SELECT (1; 2); SELECT 3                                                                     |
+           | BEGIN; SELECT 1; COMMIT;                                                                    |
+           | SELECT /*+ SeqScan(t) */ * FROM t;                                                          |
+           | CREATE FUNCTION f() RETURNS int LANGUAGE sql BEGIN ATOMIC SELECT 1; SELECT 2; END; SELECT 3; |
+
+    Scenario: Native splitter handles postgresql lexical structure
+        Then native splitter splits
+           | code                                                                                                                        | statements |
+           | SELECT 1;;                                                                                                                  | 1          |
+           | SELECT 1\n\copy t from 'data.csv'\n;                                                                                        | 1          |
+           | /* outer /* nested; */ still comment; */ SELECT 1;                                                                          | 1          |
+           | SELECT E'\\\\'; SELECT 2;                                                                                                   | 2          |
+           | SELECT "quoted "" identifier;" FROM t; SELECT 2;                                                                            | 2          |
+           | SELECT $1; SELECT a$b FROM t;                                                                                               | 2          |
+           | SELECT 'unterminated;                                                                                                       | 1          |
+           | SELECT $x$ unterminated;                                                                                                    | 1          |
+           | SELECT 1 /* unterminated;                                                                                                   | 1          |
+           | SELECT 1 --+ hint;\nSELECT 2;                                                                                               | 1          |
+           | SELECT begin, "end", case when true then 1 end FROM t; SELECT 2;                                                            | 2          |
+           | CREATE OR REPLACE PROCEDURE p() LANGUAGE sql BEGIN ATOMIC SELECT CASE WHEN true THEN 1 END; SELECT (1); END; SELECT 2;       | 2          |
+           | CREATE /* c */ FUNCTION f() RETURNS int LANGUAGE sql BEGIN ATOMIC SELECT 1; END; SELECT 2;                                  | 2          |
+           | CREATE FUNCTION f(x int) RETURNS int LANGUAGE sql RETURN CASE WHEN x > 0 THEN 1 END; SELECT 2;                              | 2          |
+           | COPY (SELECT 'from stdin') TO STDOUT;\nCREATE TABLE t (id int);                                                             | 2          |
+           | COPY t TO STDOUT;\nSELECT 2;                                                                                                | 2          |
+           | COPY t (id, "from stdin") FROM STDIN;\n1\n\.\nSELECT 2;                                                                     | 2          |
+
+    Scenario: Migration with function defined by sql standard body
+        Given migration dir
+        And migrations
+           | file                     | code                                                                                                                                  |
+           | V1__Single_migration.sql | CREATE FUNCTION f() RETURNS int LANGUAGE sql BEGIN ATOMIC SELECT 1; SELECT 2; END; CREATE TABLE test (id int DEFAULT f()); -- comment |
+        And database and connection
+        When we run pgmigrate with "-t 1 migrate"
+        Then pgmigrate command "succeeded"
+        And query "SELECT f(), 'ok'" equals
+           | f | ok |
+           | 2 | ok |
+
+    Scenario: Migration with sqlparse splitter
+        Given migration dir
+        And migrations
+           | file                     | code                                        |
+           | V1__Single_migration.sql | CREATE TABLE test (id int); /* comment */   |
+        And database and connection
+        When we run pgmigrate with "--parser sqlparse -t 1 migrate"
+        Then pgmigrate command "succeeded"
+        And database contains schema_version
+
+    Scenario: Unexpected parser in config
+        Given migration dir
+        And config
+        """
+        parser: unknown
+        """
+        And database and connection
+        When we run pgmigrate with "-t 1 migrate"
+        Then pgmigrate command "failed"
+        And migrate command failed with Unexpected parser
@@ -0,0 +1,74 @@
+import json
+import threading
+import time
+
+import psycopg2
+
+from behave import given, then
+
+
+@given('fleet databases "{names}"')
+def step_impl(context, names):
+    conn = psycopg2.connect('dbname=postgres')
+    conn.autocommit = True
+    cur = conn.cursor()
+    for name in names.split(','):
+        cur.execute(
+            'select pg_terminate_backend(pid) '
+            'from pg_stat_activity where datname = %s', (name, ))
+        cur.execute('drop database if exists {name}'.format(name=name))
+        cur.execute('create database {name}'.format(name=name))
+    conn.close()
+
+
+@then('query "{query}" on database "{name}" equals')  # noqa
+def step_impl(context, query, name):
+    conn = psycopg2.connect(dbname=name)
+    cur = conn.cursor()
+    cur.execute(query)
+    r = cur.fetchall()
+    conn.close()
+    formatted = ';'.join(map(lambda x: '|'.join(map(str, x)), r))
+    res = []
+    for row in context.table:
+        res.append('|'.join(row))
+    result = ';'.join(res)
+    assert formatted == result, 'Unexpected result: ' + formatted
+
+
+@then('fleet report has {count:d} "{status}" targets')  # noqa
+def step_impl(context, count, status):
+    report = json.loads(context.last_migrate_res['out'])
+    statuses = [x['status'] for x in report.values()]
+    assert statuses.count(status) == count, \
+        'Actual result: ' + context.last_migrate_res['out']
+
+
+@then('fleet report contains target "{target}"')  # noqa
+def step_impl(context, target):
+    report = json.loads(context.last_migrate_res['out'])
+    assert target in report, \
+        'Actual result: ' + context.last_migrate_res['out']
+
+
+@given('query "{query}" on database "{name}"')  # noqa
+def step_impl(context, query, name):
+    conn = psycopg2.connect(dbname=name)
+    conn.autocommit = True
+    conn.cursor().execute(query)
+    conn.close()
+
+
+@given('running query "{query}" on database "{name}"')  # noqa
+def step_impl(context, query, name):
+    conn = psycopg2.connect(dbname=name)
+
+    def run():
+        try:
+            conn.cursor().execute(query)
+            conn.commit()
+        except psycopg2.Error:
+            pass
+
+    threading.Thread(target=run, daemon=True).start()
+    time.sleep(0.5)
@@ -17,3 +17,10 @@ def step_impl(context, dirname):
     migrations_path = os.path.join(context.migr_dir, 'migrations')
     path = os.path.join(migrations_path, dirname)
     os.mkdir(path)
+
+
+@given('migration "{fname}" with invalid utf-8')  # noqa
+def step_impl(context, fname):
+    path = os.path.join(context.migr_dir, 'migrations', fname)
+    with open(path, 'wb') as f:
+        f.write(b'SELECT 1; -- \xff\n')
@@ -2,7 +2,7 @@ import os
 import shutil
 import tempfile
 
-from behave import given
+from behave import given, then
 
 
 @given('migration dir')
@@ -19,3 +19,19 @@ def step_migrations_dir(context):
 @given('removed migrations subdir')
 def step_removed_subdir(context):
     shutil.rmtree(os.path.join(context.migr_dir, 'migrations'))
+
+
+@given('file "{fname}" in migration dir')
+def step_file_in_migration_dir(context, fname):
+    path = os.path.join(context.migr_dir, fname)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(context.text)
+
+
+@then('file "{fname}" in migration dir contains "{text}"')
+def step_file_contains(context, fname, text):
+    with open(os.path.join(context.migr_dir, fname)) as f:
+        data = f.read()
+    assert text in data, 'Unable to find "{text}" in {data}'.format(
+        text=text, data=data)
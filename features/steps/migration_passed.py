@@ -7,3 +7,11 @@ def step_impl(context, message):
         'Failed with: ' + context.last_migrate_res['err']
     assert message in context.last_migrate_res['err'], \
         'Actual result: ' + context.last_migrate_res['err']
+
+
+@then('"{message}" is logged {count:d} times')  # noqa
+def step_impl(context, message, count):
+    actual = context.last_migrate_res['err'].count(message)
+    assert actual == count, \
+        'Logged {actual} times: {err}'.format(
+            actual=actual, err=context.last_migrate_res['err'])
@@ -1,4 +1,5 @@
 import json
+import re
 
 from behave import then
 
@@ -9,3 +10,25 @@ def step_impl(context):
     out_data = json.loads(context.last_migrate_res['out'])
     assert json.dumps(ref_data) == json.dumps(out_data), \
             'Actual result: ' + context.last_migrate_res['out']
+
+
+@then('migrate command output contains "{text}"')  # noqa
+def step_impl(context, text):
+    assert text in context.last_migrate_res['out'], \
+        'Actual result: ' + context.last_migrate_res['out']
+
+
+@then('migrate command output key "{path}" equals {value}')  # noqa
+def step_impl(context, path, value):
+    data = json.loads(context.last_migrate_res['out'])
+    for key in path.split('.'):
+        data = data[key]
+    assert data == json.loads(value), 'Actual value: ' + json.dumps(data)
+
+
+@then('migrate command output key "{path}" matches "{pattern}"')  # noqa
+def step_impl(context, path, pattern):
+    data = json.loads(context.last_migrate_res['out'])
+    for key in path.split('.'):
+        data = data[key]
+    assert re.match(pattern, data), 'Actual value: ' + json.dumps(data)
@@ -0,0 +1,25 @@
+import json
+import os
+import pstats
+
+from behave import then
+
+
+@then('trace "{fname}" in migration dir has spans')
+def step_impl(context, fname):
+    with open(os.path.join(context.migr_dir, fname)) as f:
+        data = json.load(f)
+    spans = [(x['cat'], x['name']) for x in data['traceEvents']
+             if x['ph'] == 'X']
+    for row in context.table:
+        assert (row['cat'], row['name']) in spans, \
+            'Unable to find span {span} in {spans}'.format(
+                span=(row['cat'], row['name']), spans=spans)
+
+
+@then('stats "{fname}" in migration dir have function "{name}"')  # noqa
+def step_impl(context, fname, name):
+    stats = pstats.Stats(os.path.join(context.migr_dir, fname))
+    functions = [x[2] for x in stats.stats]
+    assert name in functions, 'Unable to find {name} in {functions}'.format(
+        name=name, functions=functions)
@@ -1,3 +1,8 @@
+import threading
+import time
+
+import psycopg2
+
 from behave import given, then
 
 
@@ -14,6 +19,21 @@ def step_impl(context, query):
     cur.execute('commit;')
 
 
+@given('running query "{query}"')  # noqa
+def step_impl(context, query):
+    conn = psycopg2.connect('dbname=pgmigratetest')
+
+    def run():
+        try:
+            conn.cursor().execute(query)
+            conn.commit()
+        except psycopg2.Error:
+            pass
+
+    threading.Thread(target=run, daemon=True).start()
+    time.sleep(0.5)
+
+
 @then('query "{query}" equals')  # noqa
 def step_impl(context, query):
     cur = context.conn.cursor()
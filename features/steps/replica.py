@@ -0,0 +1,77 @@
+import select
+import threading
+import time
+
+import psycopg2
+from psycopg2.extras import PhysicalReplicationConnection
+
+from behave import given
+
+REPLICAS = []
+
+
+def _stop_replicas():
+    while REPLICAS:
+        stop, thread = REPLICAS.pop()
+        stop.set()
+        thread.join()
+    conn = psycopg2.connect('dbname=postgres')
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute('SELECT pg_current_wal_lsn()')
+    lsn = cur.fetchone()[0]
+    conn.close()
+    return lsn
+
+
+def _start_replica(name, feedback):
+    lsn = _stop_replicas()
+    conn = psycopg2.connect(
+        'dbname=postgres application_name={name}'.format(name=name),
+        connection_factory=PhysicalReplicationConnection)
+    cur = conn.cursor()
+    cur.start_replication(start_lsn=lsn)
+    high, low = lsn.split('/')
+    start = (int(high, 16) << 32) + int(low, 16)
+    cur.send_feedback(write_lsn=start,
+                      flush_lsn=start,
+                      apply_lsn=start,
+                      force=True)
+    stop = threading.Event()
+
+    def run():
+        while not stop.is_set():
+            msg = cur.read_message()
+            if msg is None:
+                select.select([cur], [], [], 0.1)
+            else:
+                feedback(msg)
+        conn.close()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    REPLICAS.append((stop, thread))
+    time.sleep(0.2)
+
+
+@given('replica with {delay:f} seconds replay delay')  # noqa
+def step_impl(context, delay):
+    def feedback(msg):
+        time.sleep(delay)
+        end = msg.data_start + len(msg.payload)
+        msg.cursor.send_feedback(write_lsn=end,
+                                 flush_lsn=end,
+                                 apply_lsn=end,
+                                 force=True)
+
+    _start_replica('replica', feedback)
+
+
+@given('stuck replica')  # noqa
+def step_impl(context):
+    _start_replica('stuck', lambda msg: None)
+
+
+@given('no replicas')  # noqa
+def step_impl(context):
+    _stop_replicas()
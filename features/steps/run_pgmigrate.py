@@ -59,6 +59,13 @@ def step_impl(context, args):
     context.last_migrate_res = {'ret': res[0], 'out': res[1], 'err': res[2]}
 
 
+@when('we run pgmigrate in subdir "{subdir}" with "{args}"')  # noqa
+def step_impl(context, subdir, args):
+    res = run_pgmigrate(os.path.join(context.migr_dir, subdir), args)
+
+    context.last_migrate_res = {'ret': res[0], 'out': res[1], 'err': res[2]}
+
+
 @then('pgmigrate command "{result}"')  # noqa
 def step_impl(context, result):
     if not context.last_migrate_res:
@@ -75,3 +82,10 @@ def step_impl(context, result):
                         '%d' % context.last_migrate_res['ret'])
     elif result not in ['failed', 'succeeded']:
         raise Exception('Incorrect step arguments')
+
+
+@then('pgmigrate command exited with code {code:d}')  # noqa
+def step_impl(context, code):
+    assert context.last_migrate_res['ret'] == code, \
+        'Expected retcode=%d got retcode=%d' % (
+            code, context.last_migrate_res['ret'])
@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+import time
+
+from behave import then
+
+
+@then('module import does not load "{modules}"')
+def step_impl(context, modules):
+    out = subprocess.check_output([
+        sys.executable, '-c',
+        'import sys, pgmigrate; sys.stdout.write(" ".join(sys.modules))'
+    ]).decode('utf-8')
+    loaded = set(modules.split(',')) & set(out.split())
+    assert not loaded, 'Unexpected modules loaded: ' + ', '.join(loaded)
+
+
+@then('pgmigrate "{args}" starts in less than {limit:f} seconds')  # noqa
+def step_impl(context, args, limit):
+    cmd = [sys.executable, os.path.abspath('pgmigrate.py'), '-d',
+           context.migr_dir] + args.split(' ')
+    best = None
+    for _ in range(5):
+        started = time.monotonic()
+        subprocess.check_call(cmd,
+                              stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+        duration = time.monotonic() - started
+        best = duration if best is None else min(best, duration)
+    assert best < limit, 'Startup took %.3f seconds' % best
@@ -0,0 +1,41 @@
+import json
+import os
+
+from behave import given, then
+
+
+@then('cache dir "{dirname}" contains {count:d} entries')
+def step_impl(context, dirname, count):
+    path = os.path.join(context.migr_dir, dirname)
+    entries = [x for x in os.listdir(path) if x.endswith('.jsonl')]
+    assert len(entries) == count, 'Unexpected cache entries: ' + str(entries)
+    leftovers = [x for x in os.listdir(path) if x.startswith('.tmp-')]
+    assert not leftovers, 'Temporary files left in cache: ' + str(leftovers)
+
+
+@given('manifest of migrations dir with versions "{versions}" saved {seconds:d} seconds after its change')  # noqa
+def step_impl(context, versions, seconds):
+    path = os.path.abspath(os.path.join(context.migr_dir, 'migrations'))
+    mtime = os.stat(path).st_mtime_ns
+    os.makedirs(os.path.join(context.migr_dir, 'cache'), exist_ok=True)
+    with open(os.path.join(context.migr_dir, 'cache', 'manifest.json'),
+              'w') as out:
+        json.dump(
+            {
+                path: {
+                    'dirs': {
+                        path: mtime
+                    },
+                    'saved': mtime + seconds * 10**9,
+                    'versions': [int(x) for x in versions.split(',')],
+                },
+            }, out)
+
+
+@given('manifest of migrations dir')  # noqa
+def step_impl(context):
+    path = os.path.abspath(os.path.join(context.migr_dir, 'migrations'))
+    os.makedirs(os.path.join(context.migr_dir, 'cache'), exist_ok=True)
+    with open(os.path.join(context.migr_dir, 'cache', 'manifest.json'),
+              'w') as out:
+        json.dump({path: json.loads(context.text)}, out)
@@ -0,0 +1,62 @@
+import glob
+import os
+
+from behave import then
+from behave.parser import parse_file
+from pgmigrate import (CopyBlock, MalformedStatement, _split_statements,
+                       _split_statements_sqlparse)
+
+CORPUS_STEPS = ('migrations', 'callbacks', 'config callbacks')
+
+
+def _normalize(statements):
+    return [' '.join(x.split()) for x in statements]
+
+
+def _feature_codes():
+    base = os.path.dirname(os.path.dirname(__file__))
+    for path in sorted(glob.glob(os.path.join(base, '*.feature'))):
+        for scenario in parse_file(path).walk_scenarios():
+            for step in scenario.steps:
+                if step.name in CORPUS_STEPS and 'code' in step.table.headings:
+                    for row in step.table:
+                        yield row['code'].replace('\\n', '\n')
+
+
+@then('native splitter matches sqlparse on all feature migrations')
+def step_impl(context):
+    codes = list(_feature_codes())
+    assert codes, 'No migrations found in features'
+    for code in codes:
+        try:
+            native = list(_split_statements(code))
+        except MalformedStatement:
+            continue
+        if any(isinstance(x, CopyBlock) for x in native):
+            continue
+        native = _normalize(native)
+        reference = _normalize(_split_statements_sqlparse(code))
+        assert native == reference, \
+            'Split mismatch for {code!r}: {native!r} != {reference!r}'.format(
+                code=code, native=native, reference=reference)
+
+
+@then('native splitter matches sqlparse on')  # noqa
+def step_impl(context):
+    for row in context.table:
+        code = row['code'].replace('\\n', '\n')
+        native = _normalize(_split_statements(code))
+        reference = _normalize(_split_statements_sqlparse(code))
+        assert native == reference, \
+            'Split mismatch for {code!r}: {native!r} != {reference!r}'.format(
+                code=code, native=native, reference=reference)
+
+
+@then('native splitter splits')  # noqa
+def step_impl(context):
+    for row in context.table:
+        code = row['code'].replace('\\n', '\n')
+        statements = list(_split_statements(code))
+        assert len(statements) == int(row['statements']), \
+            'Unexpected split for {code!r}: {res!r}'.format(code=code,
+                                                            res=statements)
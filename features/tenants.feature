@@ -0,0 +1,104 @@
+Feature: Schema-per-tenant mode
+
+    Scenario: Migrations are applied to tenant schemas matching pattern
+        Given migration dir
+        And migrations
+           | file                      | code                           |
+           | V1__Single_migration.sql  | CREATE TABLE test (id bigint); |
+           | V2__Another_migration.sql | INSERT INTO test VALUES (1);   |
+        And callbacks
+           | type      | file           | code                         |
+           | afterEach | after_each.sql | INSERT INTO test VALUES (0); |
+        And database and connection
+        And query "CREATE SCHEMA tenant_1; CREATE SCHEMA tenant_2; CREATE SCHEMA other"
+        And successful pgmigrate run with our callbacks and "--tenant_schemas tenant_2 -t 1 tenants"
+        When we run pgmigrate with our callbacks and "-l 0.1 --tenant_pattern ^tenant_ -t latest tenants"
+        Then pgmigrate command "succeeded"
+        And fleet report has 2 "succeeded" targets
+        And "Reading statements from" is logged 3 times
+        And query "SELECT count(*), sum(id) FROM tenant_1.test" on database "pgmigratetest" equals
+           | count | sum |
+           | 3     | 1   |
+        And query "SELECT count(*), sum(id) FROM tenant_2.test" on database "pgmigratetest" equals
+           | count | sum |
+           | 3     | 1   |
+        And query "SELECT count(*) FROM pg_tables WHERE schemaname = 'other'" on database "pgmigratetest" equals
+           | count |
+           | 0     |
+
+    Scenario: Up to date tenant schemas are skipped
+        Given migration dir
+        And migrations
+           | file                     | code                           |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint); |
+        And database and connection
+        And query "CREATE SCHEMA tenant_1; CREATE SCHEMA tenant_2"
+        And successful pgmigrate run with "--tenant_schemas tenant_1 -t 1 tenants"
+        When we run pgmigrate with "--tenant_schemas tenant_1,tenant_2 -t latest tenants"
+        Then pgmigrate command "succeeded"
+        And "Schema tenant_1 is up to date" is logged 1 times
+        And query "SELECT count(*) FROM tenant_2.schema_version" on database "pgmigratetest" equals
+           | count |
+           | 1     |
+
+    Scenario: Nontransactional migrations are applied to tenant schemas
+        Given migration dir
+        And migrations
+           | file                                | code                                         |
+           | V1__Single_migration.sql            | CREATE TABLE test (id bigint);               |
+           | V2__NONTRANSACTIONAL_migration.sql  | CREATE INDEX CONCURRENTLY test_idx ON test (id); |
+        And database and connection
+        And query "CREATE SCHEMA tenant_1; CREATE SCHEMA tenant_2"
+        When we run pgmigrate with "--tenant_pattern ^tenant_ -t latest tenants"
+        Then pgmigrate command "succeeded"
+        And query "SELECT count(*) FROM pg_indexes WHERE indexname = 'test_idx'" on database "pgmigratetest" equals
+           | count |
+           | 2     |
+
+    Scenario: Failed tenant does not break connections pool
+        Given migration dir
+        And migrations
+           | file                     | code                                                                                                                          |
+           | V1__Single_migration.sql | DO $$ BEGIN IF current_schema() = 'tenant_1' THEN PERFORM pg_terminate_backend(pg_backend_pid()); END IF; END $$; CREATE TABLE test (id bigint); |
+        And database and connection
+        And query "CREATE SCHEMA tenant_1; CREATE SCHEMA tenant_2; CREATE SCHEMA tenant_3; CREATE TABLE tenant_3.schema_version (id int)"
+        When we run pgmigrate with "--fleet_workers 1 --fleet_policy continue --tenant_pattern ^tenant_ -t latest tenants"
+        Then pgmigrate command "failed"
+        And fleet report has 2 "failed" targets
+        And migrate command failed with has unexpected structure
+        And query "SELECT count(*) FROM tenant_2.schema_version" on database "pgmigratetest" equals
+           | count |
+           | 1     |
+
+    Scenario: Dry run is rolled back for tenant schemas
+        Given migration dir
+        And migrations
+           | file                     | code                           |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint); |
+        And database and connection
+        And query "CREATE SCHEMA tenant_1"
+        When we run pgmigrate with "--dryrun --tenant_schemas tenant_1 -t latest tenants"
+        Then pgmigrate command "succeeded"
+        And query "SELECT count(*) FROM pg_tables WHERE schemaname = 'tenant_1'" on database "pgmigratetest" equals
+           | count |
+           | 0     |
+
+    Scenario: Missing tenant schemas are reported
+        Given migration dir
+        And migrations
+           | file                     | code      |
+           | V1__Single_migration.sql | SELECT 1; |
+        And database and connection
+        When we run pgmigrate with "--tenant_schemas tenant_1 -t latest tenants"
+        Then pgmigrate command "failed"
+        And migrate command failed with Schemas not found: tenant_1
+
+    Scenario: Tenants mode without tenant schemas fails
+        Given migration dir
+        And migrations
+           | file                     | code      |
+           | V1__Single_migration.sql | SELECT 1; |
+        And database and connection
+        When we run pgmigrate with "--tenant_pattern ^tenant_ -t latest tenants"
+        Then pgmigrate command "failed"
+        And migrate command failed with No tenant schemas
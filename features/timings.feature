@@ -0,0 +1,184 @@
+Feature: Versions timings
+
+    Scenario: Durations of versions and statements are recorded
+        Given migration dir
+        And migrations
+           | file                      | code                                          |
+           | V1__Single_migration.sql  | CREATE TABLE test (id bigint); SELECT 1;      |
+           | V2__Another_migration.sql | INSERT INTO test VALUES (1);                  |
+        And database and connection
+        When we run pgmigrate with "--timings statement -t latest migrate"
+        Then pgmigrate command "succeeded"
+        And "Version 2 applied in" is logged 1 times
+        And query "SELECT count(*), sum(array_length(statements, 1)) FROM schema_version_timings" equals
+           | count | sum |
+           | 2     | 3   |
+
+    Scenario: Only durations of versions are recorded by default
+        Given migration dir
+        And migrations
+           | file                      | code                                     |
+           | V1__Single_migration.sql  | CREATE TABLE test (id bigint); SELECT 1; |
+        And database and connection
+        When we run pgmigrate with "--timings version -t latest migrate"
+        Then pgmigrate command "succeeded"
+        And query "SELECT count(*) FROM schema_version_timings WHERE statements IS NULL" on database "pgmigratetest" equals
+           | count |
+           | 1     |
+
+    Scenario: Info shows recorded durations and estimates from timings file
+        Given migration dir
+        And migrations
+           | file                      | code                           |
+           | V1__Single_migration.sql  | CREATE TABLE test (id bigint); |
+           | V2__Another_migration.sql | SELECT 1;                      |
+           | V3__Third_migration.sql   | SELECT 1;                      |
+        And file "timings.json" in migration dir
+        """
+        {"2": 1.5}
+        """
+        And database and connection
+        And successful pgmigrate run with "--timings version --timings_file timings.json -t 1 migrate"
+        When we run pgmigrate with "--timings_file timings.json info"
+        Then pgmigrate command "succeeded"
+        And migrate command output contains ""duration": "
+        And migrate command output contains ""estimated_duration": 1.5"
+        And "Estimated duration of pending versions: 1.500 seconds (1 versions without estimate)" is logged 1 times
+
+    Scenario: Timings file is updated by migrate
+        Given migration dir
+        And migrations
+           | file                      | code                           |
+           | V1__Single_migration.sql  | CREATE TABLE test (id bigint); |
+           | V2__Another_migration.sql | SELECT 1;                      |
+        And database and connection
+        And successful pgmigrate run with "--timings_file timings.json -t latest migrate"
+        Given database and connection
+        When we run pgmigrate with "--timings_file timings.json info"
+        Then pgmigrate command "succeeded"
+        And migrate command output contains ""estimated_duration": 0."
+        And "(0 versions without estimate)" is logged 1 times
+
+    Scenario: Timings file is updated by fleet migration
+        Given migration dir
+        And migrations
+           | file                     | code                           |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint); |
+        And config
+        """
+        fleet_conn:
+            - dbname=pgmigratetest_f1
+            - dbname=pgmigratetest_f2
+        """
+        And fleet databases "pgmigratetest_f1,pgmigratetest_f2"
+        And successful pgmigrate run with "--timings_file timings.json -t latest fleet"
+        And database and connection
+        When we run pgmigrate with "--timings_file timings.json info"
+        Then pgmigrate command "succeeded"
+        And "(0 versions without estimate)" is logged 1 times
+
+    Scenario: Durations of rolled back fleet targets are not saved
+        Given migration dir
+        And migrations
+           | file                      | code                           |
+           | V1__Single_migration.sql  | SELECT 1;                      |
+           | V2__Another_migration.sql | CREATE TABLE test (id bigint); |
+        And config
+        """
+        fleet_conn:
+            - dbname=pgmigratetest_f1
+        """
+        And fleet databases "pgmigratetest_f1"
+        And query "CREATE TABLE test (id bigint)" on database "pgmigratetest_f1"
+        When we run pgmigrate with "--timings_file timings.json -t latest fleet"
+        Then pgmigrate command "failed"
+        Given database and connection
+        When we run pgmigrate with "--timings_file timings.json info"
+        Then pgmigrate command "succeeded"
+        And "(2 versions without estimate)" is logged 1 times
+
+    Scenario: Durations of committed chunks are saved on failure
+        Given migration dir
+        And migrations
+           | file                      | code                           |
+           | V1__Single_migration.sql  | SELECT 1;                      |
+           | V2__Another_migration.sql | CREATE TABLE test (id bigint); |
+        And config
+        """
+        commit_every: 1
+        fleet_conn:
+            - dbname=pgmigratetest_f1
+        """
+        And fleet databases "pgmigratetest_f1"
+        And query "CREATE TABLE test (id bigint)" on database "pgmigratetest_f1"
+        When we run pgmigrate with "--timings_file timings.json -t latest fleet"
+        Then pgmigrate command "failed"
+        Given database and connection
+        When we run pgmigrate with "--timings_file timings.json info"
+        Then pgmigrate command "succeeded"
+        And "(1 versions without estimate)" is logged 1 times
+
+    Scenario: Durations of nontransactional versions are saved on failure
+        Given migration dir
+        And migrations
+           | file                               | code                            |
+           | V1__Single_migration.sql           | SELECT 1;                       |
+           | V2__NONTRANSACTIONAL_migration.sql | SELECT 1;                       |
+           | V3__Another_migration.sql          | INSERT INTO missing VALUES (1); |
+        And database and connection
+        When we run pgmigrate with "--timings_file timings.json -t latest migrate"
+        Then pgmigrate command "failed"
+        And file "timings.json" in migration dir contains ""2": "
+
+    Scenario: Malformed timings file is ignored
+        Given migration dir
+        And migrations
+           | file                     | code                           |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint); |
+        And file "timings.json" in migration dir
+        """
+        {"1": 1.5
+        """
+        And database and connection
+        When we run pgmigrate with "--timings_file timings.json -t latest migrate"
+        Then pgmigrate command "succeeded"
+        And migrate command passed with Ignoring malformed timings file
+        And file "timings.json" in migration dir contains ""1": "
+
+    Scenario: Info shows unknown durations without timings table
+        Given migration dir
+        And migrations
+           | file                     | code                           |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint); |
+        And database and connection
+        And successful pgmigrate run with "-t latest migrate"
+        When we run pgmigrate with "--timings version info"
+        Then pgmigrate command "succeeded"
+        And migrate command output contains ""duration": null"
+
+    Scenario: Clean drops timings table
+        Given migration dir
+        And migrations
+           | file                     | code                           |
+           | V1__Single_migration.sql | CREATE TABLE test (id bigint); |
+        And database and connection
+        And successful pgmigrate run with "--timings version -t latest migrate"
+        When we run pgmigrate with "clean"
+        Then pgmigrate command "succeeded"
+        And query "SELECT count(*) FROM pg_tables WHERE tablename = 'schema_version_timings'" on database "pgmigratetest" equals
+           | count |
+           | 0     |
+
+    Scenario: Unexpected timings are reported
+        Given migration dir
+        And migrations
+           | file                     | code      |
+           | V1__Single_migration.sql | SELECT 1; |
+        And config
+        """
+        timings: everything
+        """
+        And database and connection
+        When we run pgmigrate with "-t latest migrate"
+        Then pgmigrate command "failed"
+        And migrate command failed with Unexpected timings
@@ -23,24 +23,28 @@ PGmigrate - PostgreSQL migrations made easy
 #    SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
 
 import argparse
+import hashlib
+import io
 import json
 import logging
 import os
+import random
 import re
 import sys
+import tempfile
 import threading
 import time
 import uuid
-from collections import OrderedDict, namedtuple
-from contextlib import closing
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import closing, contextmanager, nullcontext, suppress
+from functools import partial
 
 import psycopg2
-import sqlparse
-import sqlparse.engine.grouping
-import yaml
+from psycopg2.errorcodes import (INVALID_SCHEMA_NAME, LOCK_NOT_AVAILABLE,
+                                 UNDEFINED_COLUMN, UNDEFINED_TABLE)
 from psycopg2.extensions import make_dsn, parse_dsn
-from psycopg2.extras import LoggingConnection
-from psycopg2.sql import SQL, Identifier
+from psycopg2.sql import SQL, Identifier, Literal
 
 LOG = logging.getLogger(__name__)
 
@@ -57,6 +61,12 @@ class MalformedStatement(MigrateError):
     """
 
 
+class LockNotAvailable(MigrateError):
+    """
+    Statement failed on lock timeout exception
+    """
+
+
 class MalformedMigration(MigrateError):
     """
     Incorrect migration exception
@@ -81,6 +91,18 @@ class BaselineError(MigrateError):
     """
 
 
+class UnconfirmedRewrite(MigrateError):
+    """
+    Unconfirmed rewrite or full scan of large relation exception
+    """
+
+
+class ReplicasWaitTimeout(MigrateError):
+    """
+    Replicas are not caught up with already committed migration exception
+    """
+
+
 def get_conn_id(conn):
     """
     Extract application_name from dsn
@@ -89,26 +111,90 @@ def get_conn_id(conn):
     return parsed['application_name']
 
 
+TERMINATOR_QUERY = """
+SELECT pid, usename, query, wait, terminate,
+       CASE WHEN terminate THEN pg_terminate_backend(pid)
+            ELSE pg_cancel_backend(pid) END
+FROM (SELECT b.pid, b.usename, left(b.query, 200) AS query,
+             extract(epoch FROM max(clock_timestamp() - w.query_start))
+                 AS wait,
+             %(grace)s <= 0 OR b.pid = ANY(%(overdue)s) AS terminate
+      FROM pg_stat_activity w
+      JOIN pg_stat_activity b ON b.pid = ANY(pg_blocking_pids(w.pid))
+      WHERE w.application_name = ANY(%(conns)s)
+            AND b.application_name <> ALL(%(conns)s)
+      GROUP BY b.pid, b.usename, b.query) AS blockers
+"""
+
+TERMINATOR_MAX_BACKOFF = 8
+
+TERMINATOR_REPORT_SIZE = 100
+
+
+class BlockerStats:
+    """
+    Counts and log of backends hit by conflict terminator
+    """
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+        self.cancelled = 0
+        self.terminated = 0
+        self.blockers = OrderedDict()
+
+    def add(self, pid, user, query, wait, terminate):
+        """
+        Account cancelled or terminated backend
+        """
+        if terminate:
+            self.terminated += 1
+        else:
+            self.cancelled += 1
+        if self.metrics:
+            self.metrics.inc('pgmigrate_terminated_backends_total' if terminate
+                             else 'pgmigrate_cancelled_backends_total')
+        if pid in self.blockers or len(self.blockers) < TERMINATOR_REPORT_SIZE:
+            self.blockers[pid] = (user, query, wait or 0.0,
+                                  'terminated' if terminate else 'cancelled')
+
+    def report(self, log):
+        """
+        Log summary of hit backends
+        """
+        if not self.cancelled and not self.terminated:
+            return
+        log.info('Conflicting backends: %d cancels, %d terminations',
+                 self.cancelled, self.terminated)
+        for pid, (user, query, wait, action) in self.blockers.items():
+            log.info(
+                'Conflicting pid %s (user %s, %s, waited %.3f seconds): %s',
+                pid, user, action, wait, query)
+
+
 class ConflictTerminator(threading.Thread):
     """
-    Kills conflicting pids (only on postgresql > 9.6)
+    Cancels (and terminates after grace period) conflicting pids
+    (only on postgresql > 9.6)
     """
 
-    def __init__(self, conn_str, interval):
-        super().__init__(name='terminator')
-        self.daemon = True
+    def __init__(self, conn_str, interval, grace, metrics=None):
+        super().__init__(name='terminator', daemon=True)
         self.log = logging.getLogger('terminator')
         self.conn_str = conn_str
         self.conns = set()
         self.interval = interval
-        self.should_run = True
-        self.conn = None
+        self.grace = grace
+        self.stopped = threading.Event()
+        self.stats = BlockerStats(metrics)
 
     def stop(self):
         """
-        Stop iterations and close connection
+        Stop iterations and report hit backends (only on first call)
         """
-        self.should_run = False
+        if self.stopped.is_set():
+            return
+        self.stopped.set()
+        self.stats.report(self.log)
 
     def add_conn(self, conn):
         """
@@ -124,27 +210,41 @@ class ConflictTerminator(threading.Thread):
 
     def run(self):
         """
-        Periodically terminate all backends blocking pgmigrate pids
-        """
-        self.conn = _create_raw_connection(self.conn_str, self.log)
-        self.conn.autocommit = True
-        while self.should_run:
-            with self.conn.cursor() as cursor:
-                for conn_id in self.conns:
-                    cursor.execute(
-                        """
-                        SELECT b.blocking_pid,
-                               pg_terminate_backend(b.blocking_pid)
-                        FROM (SELECT unnest(pg_blocking_pids(pid))
-                              AS blocking_pid
-                              FROM pg_stat_activity
-                              WHERE application_name
-                                  LIKE '%%' || %s || '%%') as b
-                        """, (conn_id, ))
-                    terminated = [x[0] for x in cursor.fetchall()]
-                    for i in terminated:
-                        self.log.info('Terminated conflicting pid: %s', i)
-            time.sleep(self.interval)
+        Periodically cancel (or terminate) all backends blocking pgmigrate pids
+
+        Polling interval is doubled (up to TERMINATOR_MAX_BACKOFF times)
+        while nothing is blocked.
+        """
+        conn = _create_raw_connection(self.conn_str, self.log)
+        conn.autocommit = True
+        delay = self.interval
+        seen = {}
+        while not self.stopped.is_set():
+            now = time.monotonic()
+            overdue = [
+                pid for pid, first in seen.items() if now - first >= self.grace
+            ]
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    TERMINATOR_QUERY, {
+                        'conns': list(self.conns),
+                        'grace': self.grace,
+                        'overdue': overdue,
+                    })
+                rows = cursor.fetchall()
+            for pid, user, query, wait, terminate, _ in rows:
+                if pid in seen and not terminate:
+                    continue
+                self.log.info('%s conflicting pid: %s',
+                              'Terminated' if terminate else 'Cancelled', pid)
+                self.stats.add(pid, user, query, wait, terminate)
+            seen = {row[0]: seen.get(row[0], now) for row in rows}
+            if rows:
+                delay = self.interval
+            else:
+                delay = min(delay * 2, self.interval * TERMINATOR_MAX_BACKOFF)
+            self.stopped.wait(delay)
+        conn.close()
 
 
 REF_COLUMNS = [
@@ -155,8 +255,49 @@ REF_COLUMNS = [
     'installed_on',
 ]
 
+# installed_on is formatted by server (not with strftime for each row)
+REF_COLUMNS_SQL = SQL(', ').join([
+    SQL("to_char(installed_on, 'YYYY-MM-DD HH24:MI:SS')")
+    if x == 'installed_on' else Identifier(x) for x in REF_COLUMNS
+])
+
+SCHEMA_VERSION_COLUMNS_QUERY = """
+SELECT array_agg(a.attname::text ORDER BY a.attnum)
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+JOIN pg_attribute a ON a.attrelid = c.oid
+    AND a.attnum > 0 AND NOT a.attisdropped
+WHERE n.nspname = %s AND c.relname = 'schema_version'
+    AND c.relkind IN ('r', 'p', 'v', 'f')
+"""
+
+
+class RoundTrips(logging.LoggerAdapter):
+    """
+    Logger of executed queries counting database round trips
+    """
+
+    def __init__(self, logger):
+        super().__init__(logger, {})
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def debug(self, msg, *args, **kwargs):
+        """
+        Count and log executed query
+        """
+        with self.lock:
+            self.count += 1
+        super().debug(msg, *args, **kwargs)
+
+
+ROUND_TRIPS = RoundTrips(LOG)
 
-def _create_raw_connection(conn_string, logger=LOG):
+
+def _create_raw_connection(conn_string, logger=ROUND_TRIPS):
+    # psycopg2.extras is slow to import (and not needed without connection)
+    # pylint: disable-next=import-outside-toplevel
+    from psycopg2.extras import LoggingConnection
     conn = psycopg2.connect(conn_string, connection_factory=LoggingConnection)
     conn.initialize(logger)
 
@@ -187,32 +328,29 @@ def _init_cursor(conn, session):
 
 def _is_initialized(schema, cursor):
     """
-    Check that database is initialized
+    Check that database is initialized (with single catalog query)
     """
-    cursor.execute(
-        'SELECT EXISTS(SELECT 1 FROM '
-        'information_schema.tables '
-        'WHERE table_schema = %s '
-        'AND table_name = %s)', (schema, 'schema_version'))
-    table_exists = cursor.fetchone()[0]
+    cursor.execute(SCHEMA_VERSION_COLUMNS_QUERY, (schema, ))
+    colnames = cursor.fetchone()[0]
 
-    if not table_exists:
+    if colnames is None:
         return False
 
-    cursor.execute(
-        SQL('SELECT * from {schema}.schema_version limit 1').format(
-            schema=Identifier(schema)))
+    _check_columns(schema, colnames)
+
+    return True
 
-    colnames = [desc[0] for desc in cursor.description]
 
+def _check_columns(schema, colnames):
+    """
+    Check that schema_version table has expected columns
+    """
     if colnames != REF_COLUMNS:
         raise MalformedSchema(
             ('Table {schema}.schema_version has unexpected '
              'structure: {struct}').format(schema=Identifier(schema),
                                            struct='|'.join(colnames)))
 
-    return True
-
 
 MIGRATION_FILE_RE = re.compile(r'V(?P<version>\d+)__(?P<description>.+)\.sql$')
 
@@ -225,11 +363,33 @@ Config = namedtuple(
     'Config',
     ('target', 'baseline', 'cursor', 'dryrun', 'callbacks', 'user', 'base_dir',
      'conn', 'session', 'conn_instance', 'terminator_instance',
-     'termination_interval', 'schema', 'disable_schema_check',
-     'check_serial_versions', 'set_version_info_after_callbacks',
-     'show_only_unapplied', 'force_mixed'))
-
-CONFIG_IGNORE = ['cursor', 'conn_instance', 'terminator_instance']
+     'termination_interval', 'termination_grace', 'schema',
+     'disable_schema_check', 'check_serial_versions',
+     'set_version_info_after_callbacks', 'show_only_unapplied', 'force_mixed',
+     'parser', 'cache_dir', 'cache_size', 'cache_instance',
+     'callback_statements', 'prefetch', 'prefetch_instance', 'batch',
+     'batch_bytes', 'fleet_conn', 'fleet_file', 'fleet_workers',
+     'fleet_policy', 'shared_instance', 'tenant_schemas', 'tenant_pattern',
+     'timings', 'timings_file', 'timings_instance', 'metrics_file',
+     'metrics_interval', 'metrics_instance', 'lock_retry',
+     'lock_retry_deadline', 'lock_retry_backoff', 'max_lag_bytes',
+     'max_lag_seconds', 'lag_check_interval', 'lag_timeout', 'wait_replicas',
+     'parallel_workers', 'disable_advisory_lock', 'advisory_lock_timeout',
+     'commit_every', 'commit_interval', 'max_rewrite_size', 'confirm_rewrite',
+     'drop_invalid_indexes', 'profile', 'profile_stats', 'profile_instance'))
+
+CONFIG_IGNORE = [
+    'cursor',
+    'conn_instance',
+    'terminator_instance',
+    'cache_instance',
+    'callback_statements',
+    'prefetch_instance',
+    'shared_instance',
+    'timings_instance',
+    'metrics_instance',
+    'profile_instance',
+]
 
 
 def _get_files_from_dir(path):
@@ -241,16 +401,47 @@ def _get_files_from_dir(path):
             yield os.path.basename(fname), os.path.join(root, fname)
 
 
-def _get_migrations_info_from_dir(base_dir):
+def _is_transactional(description):
     """
-    Get all migrations from base dir
+    Check if migration is transactional (by description)
+    """
+    return 'NONTRANSACTIONAL' not in description and not _is_chunked(
+        description)
+
+
+def _is_parallel(description):
+    """
+    Check if nontransactional migration could run concurrently with
+    adjacent ones (by description)
+    """
+    return 'PARALLEL' in description
+
+
+def _is_chunked(description):
+    """
+    Check if migration is chunked (by description)
+    """
+    return 'CHUNKED' in description
+
+
+def _get_migrations_dir(base_dir):
+    """
+    Get migrations dir path (checking that it exists)
     """
     path = os.path.join(base_dir, 'migrations')
-    migrations = {}
     if not (os.path.exists(path) and os.path.isdir(path)):
         raise ConfigurationError(
             'Migrations dir not found (expected to be {path})'.format(
                 path=path))
+    return path
+
+
+def _get_migrations_info_from_dir(base_dir):
+    """
+    Get all migrations from base dir
+    """
+    path = _get_migrations_dir(base_dir)
+    migrations = {}
     for fname, file_path in _get_files_from_dir(path):
         match = MIGRATION_FILE_RE.match(fname)
         if match is None:
@@ -265,7 +456,7 @@ def _get_migrations_info_from_dir(base_dir):
             'installed_on': None,
             'description': match.group('description').replace('_', ' '),
         }
-        ret['transactional'] = 'NONTRANSACTIONAL' not in ret['description']
+        ret['transactional'] = _is_transactional(ret['description'])
         migration = MigrationInfo(
             ret,
             file_path,
@@ -283,14 +474,17 @@ def _get_migrations_info_from_dir(base_dir):
     return migrations
 
 
-def _get_migrations_info(base_dir, baseline_v, target_v):
+def _get_migrations_info(base_dir, baseline_v, target_v, scanned=None):
     """
     Get migrations from baseline to target from base dir
+    (or from already scanned migrations)
     """
     migrations = {}
     target = target_v if target_v is not None else float('inf')
+    if scanned is None:
+        scanned = _get_migrations_info_from_dir(base_dir)
 
-    for version, ret in _get_migrations_info_from_dir(base_dir).items():
+    for version, ret in scanned.items():
         if baseline_v < version <= target:
             migrations[version] = ret
         else:
@@ -303,30 +497,33 @@ def _get_migrations_info(base_dir, baseline_v, target_v):
     return migrations
 
 
-def _get_info(base_dir, baseline_v, target_v, schema, cursor):
+def _get_info(base_dir, baseline_v, target_v, schema, cursor, scanned=None):
     """
     Get migrations info from database and base dir
     """
-    ret = {}
     cursor.execute(
         SQL('SELECT {columns} FROM {schema}.schema_version').format(
-            schema=Identifier(schema),
-            columns=SQL(', ').join([Identifier(x) for x in REF_COLUMNS])))
-    for i in cursor.fetchall():
-        version = {}
-        for j in enumerate(REF_COLUMNS):
-            if j[1] == 'installed_on':
-                version[j[1]] = i[j[0]].strftime('%F %H:%M:%S')
-            else:
-                version[j[1]] = i[j[0]]
+            schema=Identifier(schema), columns=REF_COLUMNS_SQL))
+    return _get_info_from_rows(cursor.fetchall(), base_dir, baseline_v,
+                               target_v, scanned)
+
+
+def _get_info_from_rows(rows, base_dir, baseline_v, target_v, scanned=None):
+    """
+    Get migrations info from schema_version rows and base dir
+    """
+    ret = {}
+    for row in rows:
+        version = dict(zip(REF_COLUMNS, row))
         version['version'] = int(version['version'])
-        transactional = 'NONTRANSACTIONAL' not in version['description']
-        version['transactional'] = transactional
+        version['transactional'] = _is_transactional(version['description'])
         ret[version['version']] = MigrationInfo(meta=version, file_path='')
 
-        baseline_v = max(baseline_v, sorted(ret.keys())[-1])
+    if ret:
+        baseline_v = max(baseline_v, *ret)
 
-    migrations_info = _get_migrations_info(base_dir, baseline_v, target_v)
+    migrations_info = _get_migrations_info(base_dir, baseline_v, target_v,
+                                           scanned)
     for version in migrations_info:
         num = migrations_info[version].meta['version']
         if num not in ret:
@@ -340,13 +537,24 @@ def _get_database_user(cursor):
     return cursor.fetchone()[0]
 
 
-def _get_state(base_dir, baseline_v, target, schema, cursor):
+def _get_state(base_dir, baseline_v, target, schema, cursor, scanned=None):
     """
     Get info wrapper (able to handle noninitialized database)
     """
     if _is_initialized(schema, cursor):
-        return _get_info(base_dir, baseline_v, target, schema, cursor)
-    return _get_migrations_info(base_dir, baseline_v, target)
+        return _get_info(base_dir, baseline_v, target, schema, cursor, scanned)
+    return _get_migrations_info(base_dir, baseline_v, target, scanned)
+
+
+def _get_config_state(config):
+    """
+    Get state for config (migrations dir is scanned once in fleet mode)
+    """
+    with _profile(config, 'state', 'state'):
+        if config.shared_instance:
+            return config.shared_instance.get_state(config)
+        return _get_state(config.base_dir, config.baseline, config.target,
+                          config.schema, config.cursor)
 
 
 def _set_baseline(baseline_v, user, schema, cursor):
@@ -380,6 +588,47 @@ def _set_baseline(baseline_v, user, schema, cursor):
     LOG.info(cursor.statusmessage)
 
 
+def _init_timings(schema, cursor):
+    """
+    Create schema_version_timings table (if not exists)
+    """
+    cursor.execute(
+        SQL('CREATE TABLE IF NOT EXISTS {schema}.schema_version_timings ('
+            'version BIGINT NOT NULL PRIMARY KEY, '
+            'duration DOUBLE PRECISION NOT NULL, '
+            'statements DOUBLE PRECISION[], '
+            'recorded_on TIMESTAMP WITHOUT time ZONE '
+            'DEFAULT now() NOT NULL)').format(schema=Identifier(schema)))
+
+
+def _get_timings(schema, cursor):
+    """
+    Get recorded durations of versions (empty if timings are not recorded)
+    """
+    cursor.execute(
+        'SELECT to_regclass(%s)',
+        ('{schema}.{table}'.format(schema=Identifier(schema).as_string(cursor),
+                                   table='schema_version_timings'), ))
+    if cursor.fetchone()[0] is None:
+        return {}
+    cursor.execute(
+        SQL('SELECT version, duration FROM {schema}.schema_version_timings').
+        format(schema=Identifier(schema)))
+    return dict(cursor.fetchall())
+
+
+def _set_timings(version, duration, statements, schema, cursor):
+    cursor.execute(
+        SQL('INSERT INTO {schema}.schema_version_timings '
+            '(version, duration, statements) '
+            'VALUES (%s::bigint, %s, %s) '
+            'ON CONFLICT (version) DO UPDATE SET '
+            'duration = EXCLUDED.duration, '
+            'statements = EXCLUDED.statements, '
+            'recorded_on = now()').format(schema=Identifier(schema)),
+        (str(version), duration, statements))
+
+
 def _init_schema(schema, cursor):
     """
     Create schema_version table
@@ -414,203 +663,1969 @@ def _init_schema(schema, cursor):
     LOG.info(cursor.statusmessage)
 
 
-def _get_statements(path):
-    """
-    Get statements from file
-    """
-    with open(path, encoding='utf-8') as i:
-        data = i.read()
-    if '/* pgmigrate-encoding: utf-8 */' not in data:
-        try:
-            data.encode('ascii')
-        except UnicodeError as exc:
-            raise MalformedStatement(
-                'Non ascii symbols in file: {0}, {1}'.format(path, str(exc)))
-    data = sqlparse.format(data, strip_comments=True)
-    for statement in sqlparse.parsestream(data, encoding='utf-8'):
-        st_str = str(statement).strip().encode('utf-8')
-        if st_str:
-            yield st_str
+SPLITTER_TOKEN_RE = re.compile(
+    r"(?P<quote>(?<![\w$])[eE]'|['\"])"
+    r'|(?P<dollar>(?<![\w$])\$(?:[^\W\d]\w*)?\$)'
+    r'|(?P<comment>--|/\*)'
+    r'|(?P<punct>[;()])'
+    r'|(?P<word>(?<![\w$])(?:begin|case|end)(?![\w$]))'
+    r'|(?P<meta>(?<![^\n])[ \t]*\\copy(?![\w$]))', re.IGNORECASE)
 
+SPLITTER_QUOTE_END_RE = {
+    "'": re.compile(r"[^']*(?:''[^']*)*'"),
+    '"': re.compile(r'[^"]*(?:""[^"]*)*"'),
+    "e'": re.compile(r"[^'\\]*(?:(?:\\.|'')[^'\\]*)*'", re.DOTALL),
+}
 
-def _apply_statement(statement, file_path, cursor):
-    """
-    Execute statement using cursor
-    """
-    try:
-        cursor.execute(statement)
-    except psycopg2.Error as exc:
-        LOG.error('Error executing statement from %s:', file_path)
-        for line in statement.splitlines():
-            LOG.error(line)
-        LOG.error(exc)
-        raise MigrateError('Unable to apply statement')
+SPLITTER_COMMENT_RE = re.compile(r'/\*|\*/')
 
+SPLITTER_GAP = r'(?:\s|--[^\n]*|/\*.*?\*/)'
 
-def _apply_file(file_path, cursor):
-    """
-    Execute all statements in file
-    """
-    try:
-        for statement in _get_statements(file_path):
-            _apply_statement(statement, file_path, cursor)
-    except MalformedStatement as exc:
-        LOG.error(exc)
-        raise exc
+SPLITTER_ROUTINE_RE = re.compile(
+    r'{gap}*create{gap}+(?:or{gap}+replace{gap}+)?'
+    r'(?:function|procedure)(?![\w$])'.format(gap=SPLITTER_GAP),
+    re.IGNORECASE | re.DOTALL)
 
+SPLITTER_NAME = r'(?:"(?:[^"]|"")+"|[^\W\d][\w$]*)'
 
-def _apply_version(version_info, cursor):
-    """
-    Execute all statements in migration version
-    """
-    LOG.info('Try apply version %r', version_info)
+# Only COPY table [(columns)] FROM STDIN grammar is matched (so no string
+# literal or subquery could precede FROM STDIN)
+SPLITTER_COPY_RE = re.compile(
+    r'copy\s+(?:binary\s+)?{name}(?:\s*\.\s*{name})?\s*'
+    r'(?:\(\s*{name}(?:\s*,\s*{name})*\s*\)\s*)?'
+    r'from\s+stdin(?![\w$])'.format(name=SPLITTER_NAME), re.IGNORECASE)
 
-    _apply_file(version_info.file_path, cursor)
+SPLITTER_COPY_END_RE = re.compile(r'^\\\.[ \t]*\r?$', re.MULTILINE)
 
+SPLITTER_COPY_COMMAND_RE = re.compile(
+    r"\\copy\s+(?P<target>.+?)\s+from\s+'(?P<path>(?:[^']|'')*)'"
+    r'(?P<options>.*?);?$', re.IGNORECASE)
 
-def _set_schema_version(version, version_info, user, schema, cursor):
-    cursor.execute(
-        SQL('INSERT INTO {schema}.schema_version '
-            '(version, description, installed_by) '
-            'VALUES (%s::bigint, %s, %s)').format(schema=Identifier(schema)),
-        (str(version), version_info.meta['description'], user))
+CopyBlock = namedtuple('CopyBlock', ('statement', 'start', 'end', 'path'))
 
 
-def _parse_str_callbacks(callbacks, ret, base_dir):
-    if not callbacks:
-        return ret
-    callbacks = callbacks.split(',')
-    for callback in callbacks:
-        if not callback:
-            continue
-        tokens = callback.split(':')
-        if tokens[0] not in ret._fields:
-            raise ConfigurationError(
-                'Unexpected callback '
-                'type: {type}'.format(type=str(tokens[0])))
-        path = os.path.join(base_dir, tokens[1])
-        if not os.path.exists(path):
-            raise ConfigurationError(
-                'Path unavailable: {path}'.format(path=str(path)))
-        if os.path.isdir(path):
-            for fname in sorted(os.listdir(path)):
-                getattr(ret, tokens[0]).append(os.path.join(path, fname))
-        else:
-            getattr(ret, tokens[0]).append(path)
+def _skip_block_comment(data, pos):
+    """
+    Get position right after (possibly nested) block comment
+    """
+    depth = 1
+    while depth:
+        match = SPLITTER_COMMENT_RE.search(data, pos)
+        if match is None:
+            return len(data)
+        depth += 1 if match.group(0) == '/*' else -1
+        pos = match.end()
+    return pos
 
-    return ret
 
+def _skip_literal(data, match):
+    """
+    Get position right after quoted string, identifier or comment
+    """
+    token = match.group(0)
+    pos = match.end()
+    if match.lastgroup == 'quote':
+        end = SPLITTER_QUOTE_END_RE[token.lower()].match(data, pos)
+        return end.end() if end else len(data)
+    if token == '/*':
+        return _skip_block_comment(data, pos)
+    if token == '--':
+        end = data.find('\n', pos)
+        return end if end >= 0 else len(data)
+    end = data.find(token, pos)
+    return end + len(token) if end >= 0 else len(data)
+
+
+def _change_begin_depth(word, begin_depth):
+    """
+    Track BEGIN ... END nesting in sql-standard routine body
+    """
+    word = word.lower()
+    if word == 'begin':
+        return begin_depth + 1
+    if begin_depth:
+        return begin_depth + (1 if word == 'case' else -1)
+    return begin_depth
 
-def _parse_dict_callbacks(callbacks, ret, base_dir):
-    for i in callbacks:
-        if i in ret._fields:
-            for j in callbacks[i] or []:
-                path = os.path.join(base_dir, j)
-                if not os.path.exists(path):
-                    raise ConfigurationError(
-                        'Path unavailable: {path}'.format(path=str(path)))
-                if os.path.isdir(path):
-                    for fname in sorted(os.listdir(path)):
-                        getattr(ret, i).append(os.path.join(path, fname))
-                else:
-                    getattr(ret, i).append(path)
-        else:
-            raise ConfigurationError(
-                'Unexpected callback type: {type}'.format(type=str(i)))
 
-    return ret
+def _read_copy_data(data, statement, pos):
+    """
+    Get COPY ... FROM STDIN block with inline data following statement
+
+    Data starts on the next line and ends with \\. line (like in psql).
+    """
+    start = data.find('\n', pos)
+    start = len(data) if start < 0 else start + 1
+    end = SPLITTER_COPY_END_RE.search(data, start)
+    if end is None:
+        raise MalformedStatement(
+            'No end of data marker (\\.) for {0}'.format(statement))
+    return CopyBlock(statement, start, end.start(), None), end.end()
 
 
-def _get_callbacks(callbacks, base_dir=''):
+def _read_copy_command(data, match):
     """
-    Parse cmdline/config callbacks
+    Get COPY block for psql-like \\copy ... from 'file' command line
     """
-    ret = Callbacks(beforeAll=[], beforeEach=[], afterEach=[], afterAll=[])
-    if isinstance(callbacks, dict):
-        return _parse_dict_callbacks(callbacks, ret, base_dir)
-    return _parse_str_callbacks(callbacks, ret, base_dir)
+    end = data.find('\n', match.end())
+    end = len(data) if end < 0 else end
+    line = data[match.start():end].strip()
+    command = SPLITTER_COPY_COMMAND_RE.match(line)
+    if command is None:
+        raise MalformedStatement('Unsupported copy command: {0}'.format(line))
+    statement = 'COPY {target} FROM STDIN{options}'.format(
+        target=command.group('target'),
+        options=command.group('options').rstrip())
+    path = command.group('path').replace("''", "'")
+    return CopyBlock(statement, None, None, path), end
+
+
+def _read_statement(data, statement, pos):
+    """
+    Get statement (with inline COPY data if any) ending at pos
+    """
+    if SPLITTER_COPY_RE.match(statement):
+        return _read_copy_data(data, statement, pos)
+    return (None if statement == ';' else statement), pos
 
 
-def _migrate_step(state, callbacks, user, schema,
-                  set_version_info_after_callbacks, cursor):
+def _is_statement_start(data, chunks, start, pos):
     """
-    Apply one version with callbacks
+    Check if there is nothing but comments between statement start and pos
     """
-    before_all_executed = False
-    should_migrate = False
-    if not _is_initialized(schema, cursor):
-        LOG.info('schema not initialized')
-        _init_schema(schema, cursor)
-    for version in sorted(state.keys()):
-        LOG.debug('has version %r', version)
-        if state[version].meta['installed_on'] is None:
-            should_migrate = True
-            if not before_all_executed and callbacks.beforeAll:
-                LOG.info('Executing beforeAll callbacks:')
-                for callback in callbacks.beforeAll:
-                    _apply_file(callback, cursor)
-                    LOG.info(callback)
-                before_all_executed = True
-
-            LOG.info('Migrating to version %d', version)
-            if callbacks.beforeEach:
-                LOG.info('Executing beforeEach callbacks:')
-                for callback in callbacks.beforeEach:
-                    LOG.info(callback)
-                    _apply_file(callback, cursor)
+    if data[start:pos].strip():
+        return False
+    return not any(x.strip() for x in chunks)
 
-            _apply_version(state[version], cursor)
 
-            if not set_version_info_after_callbacks:
-                _set_schema_version(version, state[version], user, schema,
-                                    cursor)
+def _split_statements(data):
+    """
+    Split sql text into statements stripping comments
+
+    Only statement boundaries are tracked (like psql does): semicolons
+    inside quotes, dollar-quotes, comments, parentheses and
+    BEGIN ATOMIC ... END bodies of functions and procedures do not
+    terminate a statement. SQL hints (/*+ ... */) are preserved.
+    COPY ... FROM STDIN with inline data and \\copy ... from 'file'
+    commands are returned as CopyBlock.
+    """
+    pos = start = head = 0
+    chunks = []
+    depth = begin_depth = 0
+    routine = None
+    while True:
+        match = SPLITTER_TOKEN_RE.search(data, pos)
+        if match is None:
+            break
+        token = match.group(0)
+        pos = match.end()
+        if match.lastgroup in ('quote', 'dollar', 'comment'):
+            pos = _skip_literal(data, match)
+            hint = data.startswith('+', match.end())
+            if match.lastgroup == 'comment' and not hint:
+                chunks.append(data[start:match.start()])
+                if token == '/*':
+                    chunks.append(' ')
+                start = pos
+        elif match.lastgroup == 'meta':
+            if _is_statement_start(data, chunks, start, match.start()):
+                copy, pos = _read_copy_command(data, match)
+                yield copy
+                chunks = []
+                start = head = pos
+        elif token in '()':
+            depth = max(0, depth + (1 if token == '(' else -1))
+        elif token == ';':
+            if depth == 0 and begin_depth == 0:
+                chunks.append(data[start:pos])
+                statement, pos = _read_statement(data, ''.join(chunks).strip(),
+                                                 pos)
+                if statement:
+                    yield statement
+                chunks = []
+                start = head = pos
+                routine = None
+        elif depth == 0:
+            if routine is None:
+                routine = SPLITTER_ROUTINE_RE.match(data, head) is not None
+            if routine:
+                begin_depth = _change_begin_depth(token, begin_depth)
+    chunks.append(data[start:])
+    statement = ''.join(chunks).strip()
+    if statement:
+        yield statement
+
+
+def _split_statements_sqlparse(data):
+    """
+    Split sql text into statements stripping comments with sqlparse
+    """
+    import sqlparse  # pylint: disable=import-outside-toplevel
+    data = sqlparse.format(data, strip_comments=True)
+    for statement in sqlparse.parsestream(data, encoding='utf-8'):
+        yield str(statement).strip()
 
-            if callbacks.afterEach:
-                LOG.info('Executing afterEach callbacks:')
-                for callback in callbacks.afterEach:
-                    LOG.info(callback)
-                    _apply_file(callback, cursor)
 
-            if set_version_info_after_callbacks:
-                _set_schema_version(version, state[version], user, schema,
-                                    cursor)
+PARSERS = {
+    'native': _split_statements,
+    'sqlparse': _split_statements_sqlparse,
+}
 
-    if should_migrate and callbacks.afterAll:
-        LOG.info('Executing afterAll callbacks:')
-        for callback in callbacks.afterAll:
-            LOG.info(callback)
-            _apply_file(callback, cursor)
+SPLITTER_VERSION = 2
 
+MANIFEST_FILE = 'manifest.json'
 
-def _finish(config):
-    if config.dryrun:
-        config.conn_instance.rollback()
-    else:
-        config.conn_instance.commit()
-    if config.terminator_instance:
-        config.terminator_instance.stop()
-    config.conn_instance.close()
+# eviction frees cache down to this share of max size (so it is not
+# repeated on each store while cache is full)
+CACHE_EVICT_TARGET = 0.9
 
 
-def info(config, stdout=True):
+class StatementCache:
     """
-    Info cmdline wrapper
+    Content-addressed on-disk cache of split statements
     """
-    state = _get_state(config.base_dir, config.baseline, config.target,
-                       config.schema, config.cursor)
-    if stdout:
-        out_state = OrderedDict()
-        for version in sorted(state, key=int):
-            if config.show_only_unapplied and state[version].meta[
-                    'installed_on'] is not None:
-                continue
-            out_state[version] = state[version].meta
-        sys.stdout.write(
-            json.dumps(out_state, indent=4, separators=(',', ': ')) + '\n')
 
-    _finish(config)
+    def __init__(self, path, max_size):
+        if os.path.exists(path) and not os.path.isdir(path):
+            raise ConfigurationError(
+                'Cache path is not a directory: {path}'.format(path=path))
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.max_size = max_size
+        # total size of entries (None until cache dir is scanned)
+        self.size = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_key(data, parser):
+        """
+        Get cache key for file content split with parser
+        """
+        if parser == 'native':
+            version = SPLITTER_VERSION
+        else:
+            import sqlparse  # pylint: disable=import-outside-toplevel
+            version = sqlparse.__version__
+        digest = hashlib.sha256('{parser}-{version}\0'.format(
+            parser=parser, version=version).encode('utf-8'))
+        digest.update(data.encode('utf-8'))
+        return digest.hexdigest()
 
-    return state
+    def _get_entry_path(self, key):
+        return os.path.join(self.path, key + '.jsonl')
+
+    def load(self, key):
+        """
+        Get statements iterator for key (None if key is not cached)
+        """
+        path = self._get_entry_path(key)
+        try:
+            with open(path, encoding='utf-8') as entry:
+                lines = entry.readlines()
+        except FileNotFoundError:
+            return None
+        # entry is touched after reading (it could be evicted meanwhile)
+        with suppress(OSError):
+            os.utime(path)
+        return self._parse(lines)
+
+    @staticmethod
+    def _parse(lines):
+        for line in lines:
+            statement = json.loads(line)
+            if isinstance(statement, list):
+                statement = CopyBlock(*statement)
+            yield statement
+
+    def store(self, key, statements):
+        """
+        Pass statements through saving them into cache on success
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as out:
+                for statement in statements:
+                    out.write(json.dumps(statement) + '\n')
+                    yield statement
+            size = os.stat(tmp_path).st_size
+            os.replace(tmp_path, self._get_entry_path(key))
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        with self.lock:
+            if self.size is None or self.size + size > self.max_size:
+                self._evict()
+            else:
+                self.size += size
+
+    def _load_manifests(self):
+        with suppress(OSError, ValueError):
+            with open(os.path.join(self.path, MANIFEST_FILE),
+                      encoding='utf-8') as source:
+                manifests = json.load(source)
+            if isinstance(manifests, dict):
+                return manifests
+        return {}
+
+    def load_manifest(self, path):
+        """
+        Get cached manifest of migrations dir with absolute path
+        (None if there is no manifest for this path)
+        """
+        manifest = self._load_manifests().get(path)
+        if isinstance(manifest, dict):
+            return manifest
+        return None
+
+    def store_manifest(self, path, manifest):
+        """
+        Save manifest of migrations dir with absolute path
+        (cache dir could be shared by several migrations dirs)
+        """
+        manifests = self._load_manifests()
+        manifests[path] = manifest
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix='.tmp-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as out:
+            json.dump(manifests, out)
+        os.replace(tmp_path, os.path.join(self.path, MANIFEST_FILE))
+
+    def _evict(self):
+        """
+        Scan cache dir and remove least recently used entries if it does
+        not fit in max size (called once per run and then only when
+        tracked size exceeds max size)
+        """
+        LOG.debug('Scanning statement cache %s', self.path)
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.jsonl'):
+                with suppress(FileNotFoundError):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(x[1] for x in entries)
+        if total > self.max_size:
+            target = self.max_size * CACHE_EVICT_TARGET
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                LOG.debug('Evicting %s from statement cache', path)
+                with suppress(FileNotFoundError):
+                    os.unlink(path)
+                total -= size
+        self.size = total
+
+
+CopyStatement = namedtuple('CopyStatement',
+                           ('statement', 'data', 'start', 'end', 'path'))
+
+
+def _get_copy_statement(block, data, path):
+    """
+    Get COPY statement with data source (sidecar file is relative to path)
+    """
+    if block.path is None:
+        return CopyStatement(block.statement.encode('utf-8'), data,
+                             block.start, block.end, None)
+    return CopyStatement(block.statement.encode('utf-8'), None, None, None,
+                         os.path.join(os.path.dirname(path), block.path))
+
+
+def _get_statements(path, parser='native', cache=None, metrics=None):
+    """
+    Get statements from file
+    """
+    LOG.debug('Reading statements from %s', path)
+    with open(path, encoding='utf-8') as i:
+        data = i.read()
+        if metrics:
+            metrics.inc('pgmigrate_parsed_bytes_total',
+                        os.fstat(i.fileno()).st_size)
+    if '/* pgmigrate-encoding: utf-8 */' not in data:
+        try:
+            data.encode('ascii')
+        except UnicodeError as exc:
+            raise MalformedStatement(
+                'Non ascii symbols in file: {0}, {1}'.format(path, str(exc)))
+    if cache:
+        key = cache.get_key(data, parser)
+        statements = cache.load(key)
+        if statements is None:
+            statements = cache.store(key, PARSERS[parser](data))
+    else:
+        statements = PARSERS[parser](data)
+    for statement in statements:
+        if isinstance(statement, CopyBlock):
+            yield _get_copy_statement(statement, data, path)
+            continue
+        st_str = statement.encode('utf-8')
+        if st_str:
+            yield st_str
+
+
+class StatementPrefetcher:
+    """
+    Reads and splits upcoming migration files in background
+    (get is safe to call from parallel migration workers)
+    """
+
+    def __init__(self, config, paths):
+        self.config = config
+        self.depth = config.prefetch
+        self.lock = threading.Lock()
+        self.paths = deque(paths)
+        self.futures = {}
+        workers = min(self.depth, os.cpu_count() or 1)
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix='prefetch')
+        with self.lock:
+            self._fill()
+
+    def _fill(self):
+        """
+        Keep up to depth files prepared or in progress (under lock)
+        """
+        while self.paths and len(self.futures) < self.depth:
+            path = self.paths.popleft()
+            self.futures[path] = self.executor.submit(self._prepare, path)
+
+    def _prepare(self, path):
+        return list(
+            _get_statements(path, self.config.parser,
+                            self.config.cache_instance,
+                            self.config.metrics_instance))
+
+    def get(self, path):
+        """
+        Get prepared statements for file (None if file was not scheduled)
+        """
+        with self.lock:
+            future = self.futures.pop(path, None)
+            self._fill()
+        return future.result() if future else None
+
+    def stop(self):
+        """
+        Cancel scheduled preparations and wait for running ones
+        """
+        with self.lock:
+            self.paths.clear()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+class SharedMigrations:
+    """
+    Migrations dir scanned and files split once for all fleet targets
+    """
+
+    def __init__(self, config):
+        self.parser = config.parser
+        self.cache = config.cache_instance
+        self.metrics = config.metrics_instance
+        self.migrations = _get_migrations_info_from_dir(config.base_dir)
+        self.states = {}
+        self.lock = threading.Lock()
+        self.futures = {}
+
+    def get(self, path):
+        """
+        Get statements of file (split by first requesting target)
+        """
+        with self.lock:
+            future = self.futures.get(path)
+            owner = future is None
+            if owner:
+                future = self.futures[path] = Future()
+        if owner:
+            try:
+                future.set_result(
+                    list(
+                        _get_statements(path, self.parser, self.cache,
+                                        self.metrics)))
+            except (MigrateError, OSError, ValueError) as exc:
+                future.set_exception(exc)
+        return future.result()
+
+    def get_state(self, config):
+        """
+        Get state of target using scanned migrations
+        (tenant states are fetched in bulk beforehand)
+        """
+        state = self.states.get(config.schema)
+        if isinstance(state, MigrateError):
+            raise state
+        if state is not None:
+            return state
+        return _get_state(config.base_dir, config.baseline, config.target,
+                          config.schema, config.cursor, self.migrations)
+
+
+class Timings:
+    """
+    Durations of versions applied in this run and estimates from timings file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.durations = {}
+        self.estimates = self._load()
+
+    def _load(self):
+        if not (self.path and os.path.exists(self.path)):
+            return {}
+        try:
+            with open(self.path, encoding='utf-8') as i:
+                return {int(k): float(v) for k, v in json.load(i).items()}
+        except (OSError, ValueError, TypeError, AttributeError) as exc:
+            LOG.warning('Ignoring malformed timings file %s: %s', self.path,
+                        exc)
+            return {}
+
+    def add(self, version, duration):
+        """
+        Add version duration (kept only after its transaction is committed)
+        """
+        vars(self.local).setdefault('pending', {})[version] = duration
+
+    def commit(self):
+        """
+        Keep durations of versions committed by current thread
+        (max of durations is kept in fleet mode)
+        """
+        pending = vars(self.local).pop('pending', {})
+        with self.lock:
+            for version, duration in pending.items():
+                self.durations[version] = max(duration,
+                                              self.durations.get(version, 0))
+
+    def discard(self):
+        """
+        Drop durations of versions rolled back on current thread
+        """
+        vars(self.local).pop('pending', None)
+
+    def save(self):
+        """
+        Merge durations of this run into timings file
+        """
+        if not (self.path and self.durations):
+            return
+        with self.lock:
+            timings = self._load()
+            timings.update(self.durations)
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+            data = {str(k): v for k, v in sorted(timings.items())}
+            with os.fdopen(fd, 'w', encoding='utf-8') as out:
+                json.dump(data, out, indent=4)
+            os.replace(tmp_path, self.path)
+
+
+METRICS_COUNTERS = OrderedDict([
+    ('pgmigrate_versions_applied_total', 'Versions applied'),
+    ('pgmigrate_statements_total', 'Statements executed'),
+    ('pgmigrate_parsed_bytes_total', 'Bytes of sql files read and split'),
+    ('pgmigrate_parse_seconds_total',
+     'Time spent waiting for statements to be read and split'),
+    ('pgmigrate_execute_seconds_total', 'Time spent executing statements'),
+    ('pgmigrate_cancelled_backends_total', 'Conflicting backends cancelled'),
+    ('pgmigrate_terminated_backends_total', 'Conflicting backends terminated'),
+    ('pgmigrate_lock_timeouts_total',
+     'Version attempts failed on lock timeout'),
+    ('pgmigrate_lock_retry_wait_seconds_total',
+     'Time spent waiting before version retries'),
+    ('pgmigrate_replication_wait_seconds_total',
+     'Time spent waiting for replicas'),
+    ('pgmigrate_advisory_lock_wait_seconds_total',
+     'Time spent waiting for advisory lock of other pgmigrate run'),
+    ('pgmigrate_round_trips_total', 'Queries sent to database'),
+])
+
+METRICS_HISTOGRAMS = OrderedDict([
+    ('pgmigrate_version_duration_seconds',
+     'Duration of versions (with callbacks)'),
+    ('pgmigrate_statement_duration_seconds',
+     'Duration of statements (or statement batches)'),
+])
+
+METRICS_BUCKETS = (0.001, 0.01, 0.1, 1.0, 10.0, 60.0, 300.0, 1800.0, 3600.0,
+                   float('inf'))
+
+
+class Metrics:
+    """
+    Run metrics written to file in prometheus text format
+    (for node-exporter textfile collector)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.counters = dict.fromkeys(METRICS_COUNTERS, 0)
+        self.histograms = {
+            x: [[0] * len(METRICS_BUCKETS), 0.0]
+            for x in METRICS_HISTOGRAMS
+        }
+        self.stopped = threading.Event()
+        self.refresher = None
+
+    def inc(self, name, value=1):
+        """
+        Increment counter
+        """
+        with self.lock:
+            self.counters[name] += value
+
+    def observe(self, name, value):
+        """
+        Add value to histogram
+        """
+        with self.lock:
+            buckets, _ = self.histograms[name]
+            for num, bound in enumerate(METRICS_BUCKETS):
+                if value <= bound:
+                    buckets[num] += 1
+            self.histograms[name][1] += value
+
+    def start(self, interval=None):
+        """
+        Start refreshing metrics file every interval seconds (if set)
+        """
+        self.write()
+        if interval:
+            self.refresher = threading.Thread(target=self._refresh,
+                                              args=(interval, ),
+                                              name='metrics',
+                                              daemon=True)
+            self.refresher.start()
+
+    def _refresh(self, interval):
+        while not self.stopped.wait(interval):
+            self.write()
+
+    def stop(self, success):
+        """
+        Stop refreshing and write final metrics
+        """
+        self.stopped.set()
+        if self.refresher:
+            self.refresher.join()
+        self.write(success)
+
+    def _render(self, success):
+        lines = []
+
+        def add(name, kind, doc, samples):
+            lines.append('# HELP {name} {doc}'.format(name=name, doc=doc))
+            lines.append('# TYPE {name} {kind}'.format(name=name, kind=kind))
+            for sample, value in samples:
+                lines.append('{sample} {value}'.format(sample=sample,
+                                                       value=repr(value)))
+
+        add('pgmigrate_run_duration_seconds', 'gauge', 'Duration of run',
+            [('pgmigrate_run_duration_seconds',
+              round(time.monotonic() - self.started, 6))])
+        add('pgmigrate_run_in_progress', 'gauge', 'Run is in progress',
+            [('pgmigrate_run_in_progress', int(success is None))])
+        add('pgmigrate_run_success', 'gauge', 'Last run succeeded',
+            [('pgmigrate_run_success', int(bool(success)))])
+        for name, doc in METRICS_COUNTERS.items():
+            add(name, 'counter', doc, [(name, self.counters[name])])
+        for name, doc in METRICS_HISTOGRAMS.items():
+            buckets, total = self.histograms[name]
+            samples = []
+            for bound, count in zip(METRICS_BUCKETS, buckets):
+                samples.append(
+                    ('{name}_bucket{{le="{le}"}}'.format(
+                        name=name,
+                        le='+Inf' if bound == float('inf') else bound), count))
+            samples.append((name + '_sum', total))
+            samples.append((name + '_count', buckets[-1]))
+            add(name, 'histogram', doc, samples)
+        return '\n'.join(lines) + '\n'
+
+    def write(self, success=None):
+        """
+        Atomically replace metrics file
+        """
+        with self.lock:
+            data = self._render(success)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as out:
+            out.write(data)
+        os.replace(tmp_path, self.path)
+
+
+class Profiler:
+    """
+    Spans of run phases written to file in Chrome trace event format
+    (with optional cProfile stats of main thread)
+    """
+
+    def __init__(self, path, stats_path=None, started=None):
+        self.path = path
+        self.stats_path = stats_path
+        self.lock = threading.Lock()
+        self.origin = time.monotonic() if started is None else started
+        self.events = []
+        self.threads = {}
+        self.profile = None
+        if stats_path:
+            import cProfile  # pylint: disable=import-outside-toplevel
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+    def add(self, name, category, started, args=None):
+        """
+        Add span from started (monotonic time) to now
+        """
+        duration = time.monotonic() - started
+        thread = threading.current_thread()
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': round((started - self.origin) * 1000000, 1),
+            'dur': round(duration * 1000000, 1),
+            'pid': os.getpid(),
+            'tid': thread.ident,
+        }
+        if args:
+            event['args'] = args
+        with self.lock:
+            self.events.append(event)
+            self.threads[thread.ident] = thread.name
+
+    @contextmanager
+    def span(self, name, category, args=None):
+        """
+        Record span of code block
+        """
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, category, started, args)
+
+    def save(self):
+        """
+        Write trace file (and cProfile stats if enabled)
+        """
+        if self.profile:
+            self.profile.disable()
+            self.profile.dump_stats(self.stats_path)
+        if not self.path:
+            return
+        events = []
+        with self.lock:
+            for tid, name in self.threads.items():
+                events.append({
+                    'name': 'thread_name',
+                    'ph': 'M',
+                    'pid': os.getpid(),
+                    'tid': tid,
+                    'args': {
+                        'name': name,
+                    },
+                })
+            events.extend(self.events)
+        with open(self.path, 'w', encoding='utf-8') as out:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, out)
+
+
+def _profile(config, name, category, args=None):
+    """
+    Get context manager recording span (if profile is enabled)
+    """
+    if config.profile_instance:
+        return config.profile_instance.span(name, category, args)
+    return nullcontext()
+
+
+def _init_profiler(conf, started):
+    """
+    Create profiler for config (if trace or stats file is set)
+    """
+    if not conf.profile and not conf.profile_stats:
+        return conf
+    paths = [
+        os.path.join(conf.base_dir, x) if x else None
+        for x in (conf.profile, conf.profile_stats)
+    ]
+    return conf._replace(profile_instance=Profiler(*paths, started))
+
+
+def _add_profile_span(config, name, category, started, args=None):
+    """
+    Add span from started to now (if profile is enabled)
+    """
+    if config.profile_instance:
+        config.profile_instance.add(name, category, started, args)
+
+
+def _log_statement_error(statement, file_path, exc):
+    LOG.error('Error executing statement from %s:', file_path)
+    for line in statement.splitlines():
+        LOG.error(line)
+    LOG.error(exc)
+
+
+class CopyData(io.TextIOBase):
+    """
+    File-like reader of inline COPY data (without copying whole block)
+    """
+
+    def __init__(self, data, start, end):
+        super().__init__()
+        self.data = data
+        self.pos = start
+        self.end = end
+
+    def read(self, size=-1):
+        """
+        Read up to size characters of data
+        """
+        end = self.end if size < 0 else min(self.pos + size, self.end)
+        chunk = self.data[self.pos:end]
+        self.pos = end
+        return chunk
+
+
+def _apply_copy(statement, file_path, cursor):
+    """
+    Stream inline or sidecar file data with COPY ... FROM STDIN
+    """
+    LOG.debug(statement.statement)
+    try:
+        if statement.path is None:
+            cursor.copy_expert(
+                statement.statement,
+                CopyData(statement.data, statement.start, statement.end))
+            return
+        with open(statement.path, 'rb') as source:
+            cursor.copy_expert(statement.statement, source)
+    except OSError as exc:
+        raise MalformedStatement(
+            'Unable to read COPY data for {0}: {1}'.format(
+                file_path, str(exc)))
+    except psycopg2.Error as exc:
+        _log_statement_error(statement.statement, file_path, exc)
+        raise _statement_error(exc)
+
+
+def _statement_error(exc):
+    """
+    Get migration error for failed statement
+    """
+    if exc.pgcode == LOCK_NOT_AVAILABLE:
+        return LockNotAvailable('Unable to apply statement')
+    return MigrateError('Unable to apply statement')
+
+
+def _apply_statement(statement, file_path, cursor):
+    """
+    Execute statement using cursor
+    """
+    if isinstance(statement, CopyStatement):
+        _apply_copy(statement, file_path, cursor)
+        return
+    try:
+        cursor.execute(statement)
+    except psycopg2.Error as exc:
+        _log_statement_error(statement, file_path, exc)
+        raise _statement_error(exc)
+
+
+BATCH_SAVEPOINT = b'SAVEPOINT pgmigrate_batch'
+
+BATCH_RELEASE = b'RELEASE SAVEPOINT pgmigrate_batch'
+
+BATCH_ROLLBACK = (b'ROLLBACK TO SAVEPOINT pgmigrate_batch; '
+                  b'RELEASE SAVEPOINT pgmigrate_batch')
+
+
+def _get_batch_statement(query, batch, position):
+    """
+    Get batch statement by error position (in characters) in query
+    """
+    offset = 0
+    found = None
+    for part, statement in zip(query, [None] + batch + [None]):
+        found = statement
+        offset += len(part.decode('utf-8')) + 1
+        if position <= offset:
+            break
+    return found
+
+
+def _apply_batch(config, batch, file_path, cursor):
+    """
+    Execute statements in single round trip
+
+    Errors with position (e.g. syntax errors) are mapped to statement
+    directly. Otherwise batch (wrapped in savepoint) is rolled back and
+    replayed statement by statement to report exact failed statement.
+    """
+    args = {'file': os.path.basename(file_path), 'statements': len(batch)}
+    started = time.monotonic()
+    with _profile(config, 'batch', 'execute', args):
+        _execute_batch(batch, file_path, cursor)
+    _observe_statements(config, len(batch), time.monotonic() - started)
+
+
+def _execute_batch(batch, file_path, cursor):
+    if len(batch) == 1:
+        _apply_statement(batch[0], file_path, cursor)
+        return
+    query = [BATCH_SAVEPOINT + b';']
+    for statement in batch:
+        if not statement.endswith(b';'):
+            statement += b'\n;'
+        query.append(statement)
+    query.append(BATCH_RELEASE)
+    try:
+        cursor.execute(b'\n'.join(query))
+    except psycopg2.Error as exc:
+        statement = None
+        if exc.diag.statement_position:
+            statement = _get_batch_statement(query, batch,
+                                             int(exc.diag.statement_position))
+        if statement is not None:
+            _log_statement_error(statement, file_path, exc)
+            raise _statement_error(exc)
+        LOG.info('Batch of %d statements failed (%s), replaying it',
+                 len(batch),
+                 str(exc).strip())
+        cursor.execute(BATCH_ROLLBACK)
+        for statement in batch:
+            _apply_statement(statement, file_path, cursor)
+
+
+def _observe_parse(statements, metrics):
+    """
+    Pass statements through adding time spent waiting for them to metrics
+    """
+    iterator = iter(statements)
+    while True:
+        started = time.monotonic()
+        statement = next(iterator, None)
+        metrics.inc('pgmigrate_parse_seconds_total',
+                    time.monotonic() - started)
+        if statement is None:
+            return
+        yield statement
+
+
+def _observe_statements(config, count, duration):
+    metrics = config.metrics_instance
+    if metrics:
+        metrics.inc('pgmigrate_statements_total', count)
+        metrics.inc('pgmigrate_execute_seconds_total', duration)
+        metrics.observe('pgmigrate_statement_duration_seconds', duration)
+
+
+def _apply_statements(config, statements, file_path, cursor):
+    """
+    Execute statements (packed into batches in transaction if enabled)
+
+    Returns statement durations (if statement timings are enabled
+    and statements are not batched).
+    """
+    durations = []
+    if config.metrics_instance:
+        statements = _observe_parse(statements, config.metrics_instance)
+    if config.batch < 2 or cursor.connection.autocommit:
+        for statement in statements:
+            started = time.monotonic()
+            with _profile(config, 'statement', 'execute',
+                          {'file': os.path.basename(file_path)}):
+                _apply_statement(statement, file_path, cursor)
+            duration = time.monotonic() - started
+            _observe_statements(config, 1, duration)
+            if config.timings == 'statement':
+                durations.append(duration)
+            if cursor.connection.autocommit:
+                _throttle_replication(config, cursor)
+        return durations
+    batch = []
+    size = 0
+    for statement in statements:
+        copy = isinstance(statement, CopyStatement)
+        overflow = size + len(statement) > config.batch_bytes
+        if batch and (copy or len(batch) >= config.batch or overflow):
+            _apply_batch(config, batch, file_path, cursor)
+            batch = []
+            size = 0
+        if copy:
+            _apply_batch(config, [statement], file_path, cursor)
+            continue
+        batch.append(statement)
+        size += len(statement)
+    if batch:
+        _apply_batch(config, batch, file_path, cursor)
+    return durations
+
+
+def _get_callback_statements(config, file_path):
+    """
+    Get callback statements (callback files are split once per run)
+    """
+    if config.shared_instance:
+        return config.shared_instance.get(file_path)
+    if file_path not in config.callback_statements:
+        config.callback_statements[file_path] = list(
+            _get_statements(file_path, config.parser, config.cache_instance,
+                            config.metrics_instance))
+    return config.callback_statements[file_path]
+
+
+def _get_file_statements(config, file_path):
+    """
+    Get migration statements (prepared in background if prefetch enabled)
+    """
+    if config.shared_instance:
+        yield from config.shared_instance.get(file_path)
+        return
+    if config.prefetch_instance:
+        statements = config.prefetch_instance.get(file_path)
+        if statements is not None:
+            yield from statements
+            return
+    yield from _get_statements(file_path, config.parser, config.cache_instance,
+                               config.metrics_instance)
+
+
+def _apply_file(config, file_path, cursor, is_callback=False):
+    """
+    Execute all statements in file (returns statement durations)
+    """
+    try:
+        if is_callback:
+            with _profile(config, os.path.basename(file_path), 'callback'):
+                return _apply_statements(
+                    config, _get_callback_statements(config, file_path),
+                    file_path, cursor)
+        with closing(_get_file_statements(config, file_path)) as statements:
+            if config.profile_instance:
+                with _profile(config, os.path.basename(file_path), 'parse'):
+                    statements = list(statements)
+            return _apply_statements(config, statements, file_path, cursor)
+    except MalformedStatement as exc:
+        LOG.error(exc)
+        raise exc
+
+
+PRAGMA_RE = re.compile(r'^--\s*pgmigrate:(?P<params>.*)$')
+
+CHUNKED_DEFAULTS = OrderedDict([
+    ('batch_size', int),
+    ('sleep', float),
+    ('target_duration', float),
+])
+
+
+def _get_pragma_params(file_path):
+    """
+    Get key=value params from migration header pragma lines
+    (e.g. -- pgmigrate: batch_size=1000 sleep=0.1)
+    """
+    with open(file_path, encoding='utf-8') as source:
+        for line in source:
+            if not line.startswith('--'):
+                break
+            match = PRAGMA_RE.match(line.strip())
+            if match is None:
+                continue
+            for token in match.group('params').split():
+                key, _, value = token.partition('=')
+                yield key, value
+
+
+def _get_chunked_params(file_path):
+    """
+    Get chunked migration params from header pragma
+    (e.g. -- pgmigrate: batch_size=1000 sleep=0.1 target_duration=1)
+    """
+    params = {'batch_size': 1000, 'sleep': 0.0, 'target_duration': None}
+    for key, value in _get_pragma_params(file_path):
+        if key == 'depends':
+            continue
+        if key not in CHUNKED_DEFAULTS:
+            raise MalformedStatement(
+                'Unknown chunked migration param {key} in {path}'.format(
+                    key=key, path=file_path))
+        try:
+            params[key] = CHUNKED_DEFAULTS[key](value)
+        except ValueError as exc:
+            raise MalformedStatement(
+                'Invalid chunked migration param {key} in {path}'.format(
+                    key=key, path=file_path)) from exc
+    if params['batch_size'] < 1:
+        raise MalformedStatement(
+            'Chunked migration batch_size should be positive in {path}'.format(
+                path=file_path))
+    return params
+
+
+def _get_depends(file_path):
+    """
+    Get versions from dependency header pragma
+    (e.g. -- pgmigrate: depends=1,3) or None if there is no such header
+    """
+    ret = None
+    for key, value in _get_pragma_params(file_path):
+        if key != 'depends':
+            continue
+        if ret is None:
+            ret = set()
+        try:
+            ret.update(int(x) for x in value.split(',') if x)
+        except ValueError as exc:
+            raise MalformedMigration(
+                'Invalid dependency header in {path}'.format(
+                    path=file_path)) from exc
+    return ret
+
+
+def _check_depends(version, depends, state):
+    """
+    Check that versions from dependency header are known and earlier
+    """
+    lowest = min(state)
+    for dep in sorted(depends):
+        if dep >= version:
+            raise MalformedMigration(
+                'Version {version} depends on later version {dep}'.format(
+                    version=version, dep=dep))
+        if dep not in state and dep > lowest:
+            raise MalformedMigration(
+                'Version {version} depends on unknown version {dep}'.format(
+                    version=version, dep=dep))
+
+
+def _get_dependencies(state):
+    """
+    Get dependencies of pending versions (from dependency headers)
+
+    Version without header depends on all previous versions
+    (parallel nontransactional one depends only on previous
+    version without header and parallel marker).
+    """
+    ret = OrderedDict()
+    barrier = set()
+    tail = set()
+    for version in sorted(state):
+        meta = state[version].meta
+        if meta['installed_on'] is not None:
+            continue
+        depends = _get_depends(state[version].file_path)
+        if depends is not None:
+            _check_depends(version, depends, state)
+            ret[version] = {x for x in depends if x in ret}
+            tail.add(version)
+        elif not meta['transactional'] and _is_parallel(meta['description']):
+            ret[version] = set(barrier)
+            tail.add(version)
+        else:
+            ret[version] = barrier | tail
+            barrier = {version}
+            tail = set()
+    return ret
+
+
+def _get_schedule(dependencies, estimates=None):
+    """
+    Get stage (length of longest dependency chain ending with version)
+    and estimated finish time of each pending version
+    """
+    stages = {}
+    finish = {}
+    for version, depends in dependencies.items():
+        stages[version] = 1 + max((stages[x] for x in depends), default=0)
+        finish[version] = (estimates or {}).get(version, 0.0) + max(
+            (finish[x] for x in depends), default=0.0)
+    return stages, finish
+
+
+def _init_chunks(schema, cursor):
+    """
+    Create schema_version_chunks table (if not exists)
+    """
+    cursor.execute(
+        SQL('CREATE TABLE IF NOT EXISTS {schema}.schema_version_chunks ('
+            'version BIGINT NOT NULL PRIMARY KEY, '
+            'position BIGINT, '
+            'batches BIGINT NOT NULL, '
+            'rows BIGINT NOT NULL, '
+            'updated_on TIMESTAMP WITHOUT time ZONE '
+            'DEFAULT now() NOT NULL)').format(schema=Identifier(schema)))
+
+
+def _get_chunks_progress(version, schema, cursor):
+    cursor.execute(
+        SQL('SELECT position, batches, rows '
+            'FROM {schema}.schema_version_chunks '
+            'WHERE version = %s::bigint').format(schema=Identifier(schema)),
+        (str(version), ))
+    return cursor.fetchone() or (None, 0, 0)
+
+
+def _set_chunks_progress(version, progress, schema, cursor):
+    cursor.execute(
+        SQL('INSERT INTO {schema}.schema_version_chunks '
+            '(version, position, batches, rows) '
+            'VALUES (%s::bigint, %s, %s, %s) '
+            'ON CONFLICT (version) DO UPDATE SET '
+            'position = EXCLUDED.position, '
+            'batches = EXCLUDED.batches, '
+            'rows = EXCLUDED.rows, '
+            'updated_on = now()').format(schema=Identifier(schema)),
+        (str(version), ) + tuple(progress))
+
+
+def _get_chunked_statement(config, file_path, cursor):
+    """
+    Get batch statement and key range (None for LIMIT batches)
+
+    Migration should have single statement with %(limit)s placeholder
+    or key range query and statement with %(start)s and %(end)s placeholders.
+    Key range query should return min and max integer keys.
+    """
+    statements = list(_get_file_statements(config, file_path))
+    if len(statements) == 1 and b'%(limit)s' in statements[0]:
+        return statements[0], None
+    if len(statements) == 2 and all(x in statements[1]
+                                    for x in (b'%(start)s', b'%(end)s')):
+        _apply_statement(statements[0], file_path, cursor)
+        key_range = cursor.fetchone()
+        if key_range is None or len(key_range) != 2 or not all(
+                x is None or isinstance(x, int) for x in key_range):
+            raise MalformedStatement(
+                'Key range query of chunked migration {path} should return '
+                'min and max integer keys, got {range}'.format(
+                    path=file_path, range=key_range))
+        return statements[1], key_range
+    raise MalformedStatement(
+        'Chunked migration {path} should have statement with %(limit)s '
+        'or key range query and statement with %(start)s and %(end)s'.format(
+            path=file_path))
+
+
+def _apply_chunk(config, version_info, statement, args, progress, cursor):
+    """
+    Execute batch and save progress in one transaction
+    """
+    version = version_info.meta['version']
+    file_path = version_info.file_path
+    position, batches, rows = progress
+    started = time.monotonic()
+    cursor.execute('BEGIN')
+    try:
+        cursor.execute(statement, args)
+    except psycopg2.Error as exc:
+        _log_statement_error(statement, file_path, exc)
+        cursor.execute('ROLLBACK')
+        raise _statement_error(exc)
+    affected = max(cursor.rowcount, 0)
+    if position is not None:
+        position = args['end']
+    progress = (position, batches + 1, rows + affected)
+    _set_chunks_progress(version, progress, config.schema, cursor)
+    cursor.execute('COMMIT')
+    duration = time.monotonic() - started
+    LOG.info('Version %d batch %d: %d rows in %.3f seconds (size %d)', version,
+             progress[1], affected, duration,
+             args['limit'] if position is None else position - args['start'])
+    _observe_statements(config, 1, duration)
+    return progress, affected, duration
+
+
+def _apply_chunked(config, version_info, cursor):
+    """
+    Execute chunked migration committing each batch with its progress
+
+    Batch size is adapted to target_duration (if set). Interrupted
+    migration resumes from recorded key range position.
+    """
+    version = version_info.meta['version']
+    params = _get_chunked_params(version_info.file_path)
+    _init_chunks(config.schema, cursor)
+    statement, key_range = _get_chunked_statement(config,
+                                                  version_info.file_path,
+                                                  cursor)
+    progress = _get_chunks_progress(version, config.schema, cursor)
+    if key_range is not None:
+        if key_range[0] is None:
+            LOG.info('Version %d has empty key range', version)
+            return
+        if progress[0] is None:
+            progress = (key_range[0], ) + tuple(progress[1:])
+    size = params['batch_size']
+    while key_range is None or progress[0] <= key_range[1]:
+        if key_range is None:
+            args = {'limit': size}
+        else:
+            args = {'start': progress[0], 'end': progress[0] + size}
+        progress, affected, duration = _apply_chunk(config, version_info,
+                                                    statement, args, progress,
+                                                    cursor)
+        if key_range is None and not affected:
+            break
+        if params['target_duration']:
+            factor = params['target_duration'] / max(duration, 0.001)
+            size = max(1, int(size * min(max(factor, 0.5), 2.0)))
+        _throttle_replication(config, cursor)
+        time.sleep(params['sleep'])
+    LOG.info('Version %d processed %d rows in %d batches', version,
+             progress[2], progress[1])
+
+
+CONCURRENT_INDEX_RE = re.compile(
+    rb'^(?:\s+|--[^\n]*\n)*CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+'
+    rb'(?:IF\s+NOT\s+EXISTS\s+)?(?P<name>"(?:[^"]|"")+"|[\w$]+)\s+'
+    rb'ON\s+(?:ONLY\s+)?(?P<table>(?:"(?:[^"]|"")+"|[\w$]+)'
+    rb'(?:\s*\.\s*(?:"(?:[^"]|"")+"|[\w$]+))?)', re.IGNORECASE)
+
+
+def _init_progress(schema, cursor):
+    """
+    Create schema_version_progress table (if not exists)
+    """
+    cursor.execute(
+        SQL('CREATE TABLE IF NOT EXISTS {schema}.schema_version_progress ('
+            'version BIGINT NOT NULL, '
+            'ordinal INT NOT NULL, '
+            'hash TEXT NOT NULL, '
+            'completed_on TIMESTAMP WITHOUT time ZONE '
+            'DEFAULT now() NOT NULL, '
+            'PRIMARY KEY (version, ordinal))').format(
+                schema=Identifier(schema)))
+
+
+def _get_progress(version, schema, cursor):
+    cursor.execute(
+        SQL('SELECT ordinal, hash FROM {schema}.schema_version_progress '
+            'WHERE version = %s::bigint').format(schema=Identifier(schema)),
+        (str(version), ))
+    return dict(cursor.fetchall())
+
+
+def _set_progress(version, ordinal, digest, schema, cursor):
+    cursor.execute(
+        SQL('INSERT INTO {schema}.schema_version_progress '
+            '(version, ordinal, hash) VALUES (%s::bigint, %s, %s)').format(
+                schema=Identifier(schema)), (str(version), ordinal, digest))
+
+
+def _clear_progress(version, schema, cursor):
+    cursor.execute(
+        SQL('DELETE FROM {schema}.schema_version_progress '
+            'WHERE version = %s::bigint').format(schema=Identifier(schema)),
+        (str(version), ))
+
+
+def _get_statement_hash(statement):
+    if isinstance(statement, CopyStatement):
+        statement = statement.statement
+    return hashlib.sha256(statement).hexdigest()
+
+
+def _drop_invalid_index(config, statement, cursor):
+    """
+    Drop invalid index left by failed concurrent build of statement index
+    (only with drop_invalid_indexes, otherwise its presence is an error)
+    """
+    if isinstance(statement, CopyStatement):
+        return
+    match = CONCURRENT_INDEX_RE.match(statement)
+    if match is None:
+        return
+    name = match.group('name').decode('utf-8')
+    if name.startswith('"'):
+        name = name[1:-1].replace('""', '"')
+    else:
+        name = name.lower()
+    cursor.execute(
+        'SELECT i.indexrelid::regclass::text FROM pg_index i '
+        'JOIN pg_class c ON (c.oid = i.indexrelid) '
+        'WHERE i.indrelid = to_regclass(%s) AND c.relname = %s '
+        'AND NOT i.indisvalid', (match.group('table').decode('utf-8'), name))
+    for (index, ) in cursor.fetchall():
+        if not config.drop_invalid_indexes:
+            raise MigrateError(
+                'Invalid index {index} is left by previous run '
+                '(drop it or use --drop_invalid_indexes)'.format(index=index))
+        LOG.warning('Dropping invalid index %s left by previous run', index)
+        cursor.execute('DROP INDEX CONCURRENTLY {index}'.format(index=index))
+
+
+def _apply_resumable(config, version_info, cursor):
+    """
+    Execute nontransactional version recording completed statements
+
+    Statements completed by previous (failed) run are skipped and
+    invalid indexes left by failed concurrent builds are dropped
+    (if drop_invalid_indexes is set).
+    """
+    version = version_info.meta['version']
+    file_path = version_info.file_path
+    _init_progress(config.schema, cursor)
+    completed = _get_progress(version, config.schema, cursor)
+    durations = []
+    try:
+        with closing(_get_file_statements(config, file_path)) as statements:
+            for ordinal, statement in enumerate(statements, 1):
+                digest = _get_statement_hash(statement)
+                if ordinal in completed:
+                    if completed[ordinal] != digest:
+                        raise MalformedStatement(
+                            'Statement {ordinal} of {path} was changed '
+                            'after previous run'.format(ordinal=ordinal,
+                                                        path=file_path))
+                    LOG.info(
+                        'Skipping statement %d of version %d '
+                        '(completed by previous run)', ordinal, version)
+                    continue
+                _drop_invalid_index(config, statement, cursor)
+                durations.extend(
+                    _apply_statements(config, [statement], file_path, cursor))
+                _set_progress(version, ordinal, digest, config.schema, cursor)
+    except MalformedStatement as exc:
+        LOG.error(exc)
+        raise exc
+    return durations
+
+
+def _apply_version(config, version_info, cursor):
+    """
+    Execute all statements in migration version
+    """
+    LOG.info('Try apply version %r', version_info)
+
+    with _profile(config, 'V{version}'.format(**version_info.meta), 'version',
+                  {'file': version_info.file_path}):
+        if _is_chunked(version_info.meta['description']):
+            return _apply_chunked(config, version_info, cursor)
+
+        if cursor.connection.autocommit:
+            return _apply_resumable(config, version_info, cursor)
+
+        return _apply_file(config, version_info.file_path, cursor)
+
+
+def _set_schema_version(version, version_info, user, schema, cursor):
+    cursor.execute(
+        SQL('INSERT INTO {schema}.schema_version '
+            '(version, description, installed_by) '
+            'VALUES (%s::bigint, %s, %s)').format(schema=Identifier(schema)),
+        (str(version), version_info.meta['description'], user))
+
+
+def _parse_str_callbacks(callbacks, ret, base_dir):
+    if not callbacks:
+        return ret
+    callbacks = callbacks.split(',')
+    for callback in callbacks:
+        if not callback:
+            continue
+        tokens = callback.split(':')
+        if tokens[0] not in ret._fields:
+            raise ConfigurationError(
+                'Unexpected callback '
+                'type: {type}'.format(type=str(tokens[0])))
+        path = os.path.join(base_dir, tokens[1])
+        if not os.path.exists(path):
+            raise ConfigurationError(
+                'Path unavailable: {path}'.format(path=str(path)))
+        if os.path.isdir(path):
+            for fname in sorted(os.listdir(path)):
+                getattr(ret, tokens[0]).append(os.path.join(path, fname))
+        else:
+            getattr(ret, tokens[0]).append(path)
+
+    return ret
+
+
+def _parse_dict_callbacks(callbacks, ret, base_dir):
+    for i in callbacks:
+        if i in ret._fields:
+            for j in callbacks[i] or []:
+                path = os.path.join(base_dir, j)
+                if not os.path.exists(path):
+                    raise ConfigurationError(
+                        'Path unavailable: {path}'.format(path=str(path)))
+                if os.path.isdir(path):
+                    for fname in sorted(os.listdir(path)):
+                        getattr(ret, i).append(os.path.join(path, fname))
+                else:
+                    getattr(ret, i).append(path)
+        else:
+            raise ConfigurationError(
+                'Unexpected callback type: {type}'.format(type=str(i)))
+
+    return ret
+
+
+def _get_callbacks(callbacks, base_dir=''):
+    """
+    Parse cmdline/config callbacks
+    """
+    ret = Callbacks(beforeAll=[], beforeEach=[], afterEach=[], afterAll=[])
+    if isinstance(callbacks, dict):
+        return _parse_dict_callbacks(callbacks, ret, base_dir)
+    return _parse_str_callbacks(callbacks, ret, base_dir)
+
+
+def _apply_version_step(config, version, version_info, callbacks, cursor):
+    """
+    Apply version with each version callbacks (recording its duration)
+    """
+    started = time.monotonic()
+    LOG.info('Migrating to version %d', version)
+    if callbacks.beforeEach:
+        LOG.info('Executing beforeEach callbacks:')
+        for callback in callbacks.beforeEach:
+            LOG.info(callback)
+            _apply_file(config, callback, cursor, is_callback=True)
+
+    statements = _apply_version(config, version_info, cursor)
+
+    if not config.set_version_info_after_callbacks:
+        _set_version_applied(config, version, version_info, cursor)
+
+    if callbacks.afterEach:
+        LOG.info('Executing afterEach callbacks:')
+        for callback in callbacks.afterEach:
+            LOG.info(callback)
+            _apply_file(config, callback, cursor, is_callback=True)
+
+    if config.set_version_info_after_callbacks:
+        _set_version_applied(config, version, version_info, cursor)
+
+    _record_version(config, version,
+                    time.monotonic() - started, statements, cursor)
+
+
+def _set_version_applied(config, version, version_info, cursor):
+    """
+    Add version to schema_version (and clear its statements progress
+    in the same transaction for nontransactional version)
+    """
+    if not cursor.connection.autocommit or _is_chunked(
+            version_info.meta['description']):
+        _set_schema_version(version, version_info, config.user, config.schema,
+                            cursor)
+        return
+    cursor.execute('BEGIN')
+    _set_schema_version(version, version_info, config.user, config.schema,
+                        cursor)
+    _clear_progress(version, config.schema, cursor)
+    cursor.execute('COMMIT')
+
+
+def _record_version(config, version, duration, statements, cursor):
+    """
+    Log and record applied version duration
+    """
+    LOG.info('Version %d applied in %.3f seconds', version, duration)
+    if config.timings_instance:
+        config.timings_instance.add(version, duration)
+        if cursor.connection.autocommit:
+            config.timings_instance.commit()
+    if config.metrics_instance:
+        config.metrics_instance.inc('pgmigrate_versions_applied_total')
+        config.metrics_instance.observe('pgmigrate_version_duration_seconds',
+                                        duration)
+    if config.timings:
+        _set_timings(version, duration, statements or None, config.schema,
+                     cursor)
+
+
+LOCK_RETRY_MAX_BACKOFF = 30.0
+
+
+def _apply_version_retrying(config, version, version_info, callbacks, cursor):
+    """
+    Apply version with short lock_timeout retrying it on lock timeouts
+
+    Each attempt is wrapped in savepoint. Attempts are repeated with
+    jittered exponential backoff until lock_retry_deadline is reached.
+    """
+    cursor.execute('SHOW lock_timeout')
+    lock_timeout = cursor.fetchone()[0]
+    deadline = time.monotonic() + config.lock_retry_deadline
+    metrics = config.metrics_instance
+    attempt = 1
+    while True:
+        started = time.monotonic()
+        cursor.execute('SAVEPOINT pgmigrate_version')
+        cursor.execute("SELECT set_config('lock_timeout', %s, false)",
+                       (str(config.lock_retry), ))
+        try:
+            _apply_version_step(config, version, version_info, callbacks,
+                                cursor)
+            break
+        except LockNotAvailable as exc:
+            cursor.execute('ROLLBACK TO SAVEPOINT pgmigrate_version')
+            delay = config.lock_retry_backoff * 2**(attempt - 1)
+            delay = min(delay, LOCK_RETRY_MAX_BACKOFF)
+            delay = random.uniform(delay / 2, delay)
+            LOG.info(
+                'Version %d attempt %d failed on lock timeout '
+                'after %.3f seconds', version, attempt,
+                time.monotonic() - started)
+            if metrics:
+                metrics.inc('pgmigrate_lock_timeouts_total')
+            if time.monotonic() + delay > deadline:
+                raise MigrateError(
+                    'Unable to apply version {version} in {attempts} '
+                    'attempts (lock timeout)'.format(
+                        version=version, attempts=attempt)) from exc
+            LOG.info('Retrying version %d in %.3f seconds', version, delay)
+            if metrics:
+                metrics.inc('pgmigrate_lock_retry_wait_seconds_total', delay)
+            time.sleep(delay)
+            attempt += 1
+    cursor.execute('RELEASE SAVEPOINT pgmigrate_version')
+    cursor.execute("SELECT set_config('lock_timeout', %s, false)",
+                   (lock_timeout, ))
+    if attempt > 1:
+        LOG.info('Version %d applied in %d attempts', version, attempt)
+
+
+REPLICATION_LAG_QUERY = """
+SELECT application_name, bytes, seconds
+FROM (SELECT application_name,
+             pg_wal_lsn_diff(pg_current_wal_lsn(),
+                             coalesce(replay_lsn, flush_lsn)) AS bytes,
+             extract(epoch FROM replay_lag) AS seconds
+      FROM pg_stat_replication) AS replicas
+WHERE bytes > %(bytes)s OR seconds > %(seconds)s
+"""
+
+REPLICATION_CATCH_UP_QUERY = """
+SELECT application_name, pg_wal_lsn_diff(%(lsn)s, lsn), NULL
+FROM (SELECT application_name, coalesce(replay_lsn, flush_lsn) AS lsn
+      FROM pg_stat_replication) AS replicas
+WHERE lsn IS NULL OR lsn < %(lsn)s::pg_lsn
+"""
+
+
+def _wait_replication(config, cursor, query, params):
+    """
+    Wait until query returns no lagging replicas (or lag_timeout passes)
+    """
+    started = time.monotonic()
+    while True:
+        cursor.execute(query, params)
+        lagging = cursor.fetchall()
+        if not lagging:
+            break
+        waited = time.monotonic() - started
+        if config.lag_timeout is not None and waited >= config.lag_timeout:
+            raise MigrateError(
+                'Replicas lag is not caught up in {timeout} seconds: '
+                '{replicas}'.format(timeout=config.lag_timeout,
+                                    replicas=', '.join(x[0] for x in lagging)))
+        for name, lag_bytes, lag_seconds in lagging:
+            LOG.info('Waiting for replica %s (lag %s bytes, %s seconds)', name,
+                     lag_bytes, lag_seconds)
+        time.sleep(config.lag_check_interval)
+    waited = time.monotonic() - started
+    if config.metrics_instance:
+        config.metrics_instance.inc('pgmigrate_replication_wait_seconds_total',
+                                    waited)
+    return waited
+
+
+def _throttle_replication(config, cursor):
+    """
+    Pause while replication lag is over max_lag_bytes/max_lag_seconds
+    """
+    if config.max_lag_bytes is None and config.max_lag_seconds is None:
+        return
+    waited = _wait_replication(config, cursor, REPLICATION_LAG_QUERY, {
+        'bytes': config.max_lag_bytes,
+        'seconds': config.max_lag_seconds,
+    })
+    if waited >= config.lag_check_interval:
+        LOG.info('Paused for %.3f seconds on replication lag', waited)
+
+
+def _wait_replicas(config):
+    """
+    Commit and wait until all replicas replay current wal position
+    (timeout is raised as ReplicasWaitTimeout as migration is committed)
+    """
+    if not config.wait_replicas or config.dryrun:
+        return
+    config.conn_instance.commit()
+    config.cursor.execute('SELECT pg_current_wal_lsn()')
+    lsn = config.cursor.fetchone()[0]
+    try:
+        waited = _wait_replication(config, config.cursor,
+                                   REPLICATION_CATCH_UP_QUERY, {'lsn': lsn})
+    except MigrateError as exc:
+        raise ReplicasWaitTimeout(
+            'Migration is committed, only wait for replicas '
+            'timed out: {exc}'.format(exc=exc)) from exc
+    LOG.info('Replicas replayed %s in %.3f seconds', lsn, waited)
+
+
+def _init_step(config, state, cursor):
+    """
+    Create schema_version (and timings) tables if needed for step
+    (database with applied versions in state is known to be initialized)
+    """
+    applied = any(x.meta['installed_on'] is not None for x in state.values())
+    if not applied and not _is_initialized(config.schema, cursor):
+        LOG.info('schema not initialized')
+        _init_schema(config.schema, cursor)
+    if config.timings and any(x.meta['installed_on'] is None
+                              for x in state.values()):
+        _init_timings(config.schema, cursor)
+
+
+def _apply_parallel_version(config, version, version_info):
+    """
+    Apply nontransactional version on its own connection
+    """
+    with closing(_create_connection(config)) as conn:
+        conn.autocommit = True
+        cursor = _init_cursor(conn, config.session)
+        started = time.monotonic()
+        LOG.info('Migrating to version %d', version)
+        try:
+            statements = _apply_version(config, version_info, cursor)
+        finally:
+            if config.terminator_instance:
+                config.terminator_instance.remove_conn(conn)
+        return statements, time.monotonic() - started
+
+
+def _migrate_parallel(config, state, cursor):
+    """
+    Apply parallel-safe nontransactional versions concurrently
+
+    Versions are recorded in schema_version in order after all of them
+    are applied.
+    """
+    _init_step(config, state, cursor)
+    _init_progress(config.schema, cursor)
+    _throttle_replication(config, cursor)
+    versions = sorted(state)
+    LOG.info('Migrating to versions %s in parallel',
+             ', '.join(str(x) for x in versions))
+    with ThreadPoolExecutor(max_workers=config.parallel_workers) as executor:
+        futures = [
+            executor.submit(_apply_parallel_version, config, x, state[x])
+            for x in versions
+        ]
+    for version, future in zip(versions, futures):
+        if future.exception():
+            LOG.error('Version %d failed: %s', version, future.exception())
+    for future in futures:
+        if future.exception():
+            raise future.exception()
+    for version, future in zip(versions, futures):
+        statements, duration = future.result()
+        _set_version_applied(config, version, state[version], cursor)
+        _record_version(config, version, duration, statements, cursor)
+
+
+def _commit_chunk(config, cursor, chunk):
+    """
+    Commit applied versions if commit_every versions are applied or
+    commit_interval seconds are passed since last commit
+    (schema check is done for each committed chunk)
+    """
+    chunk['versions'] += 1
+    if cursor.connection.autocommit or config.dryrun:
+        return
+    elapsed = time.monotonic() - chunk['started']
+    by_count = chunk['versions'] >= (config.commit_every or float('inf'))
+    by_time = config.commit_interval is not None and (
+        elapsed >= config.commit_interval)
+    if not by_count and not by_time:
+        return
+    if not config.disable_schema_check:
+        with _profile(config, 'schema check', 'schema check'):
+            _schema_check(config.schema, cursor)
+    with _profile(config, 'commit', 'commit'):
+        cursor.connection.commit()
+    _commit_timings(config)
+    LOG.info('Committed %d versions in %.3f seconds', chunk['versions'],
+             elapsed)
+    chunk['versions'] = 0
+    chunk['started'] = time.monotonic()
+
+
+def _migrate_step(config, state, callbacks, cursor):
+    """
+    Apply one version with callbacks
+    """
+    before_all_executed = False
+    should_migrate = False
+    chunk = {'versions': 0, 'started': time.monotonic()}
+    _init_step(config, state, cursor)
+    for version in sorted(state.keys()):
+        LOG.debug('has version %r', version)
+        if state[version].meta['installed_on'] is None:
+            should_migrate = True
+            if not before_all_executed and callbacks.beforeAll:
+                LOG.info('Executing beforeAll callbacks:')
+                for callback in callbacks.beforeAll:
+                    _apply_file(config, callback, cursor, is_callback=True)
+                    LOG.info(callback)
+                before_all_executed = True
+
+            _throttle_replication(config, cursor)
+            if config.lock_retry and not cursor.connection.autocommit:
+                _apply_version_retrying(config, version, state[version],
+                                        callbacks, cursor)
+            else:
+                _apply_version_step(config, version, state[version], callbacks,
+                                    cursor)
+            _commit_chunk(config, cursor, chunk)
+
+    if should_migrate and callbacks.afterAll:
+        LOG.info('Executing afterAll callbacks:')
+        for callback in callbacks.afterAll:
+            LOG.info(callback)
+            _apply_file(config, callback, cursor, is_callback=True)
+
+
+def _finish(config):
+    if config.dryrun:
+        with _profile(config, 'rollback', 'commit'):
+            config.conn_instance.rollback()
+    else:
+        with _profile(config, 'commit', 'commit'):
+            config.conn_instance.commit()
+        _commit_timings(config)
+    if config.terminator_instance:
+        config.terminator_instance.stop()
+    config.conn_instance.close()
+
+
+def _commit_timings(config):
+    if config.timings_instance:
+        config.timings_instance.commit()
+
+
+def _save_timings(config):
+    if config.timings_instance and not config.dryrun:
+        config.timings_instance.save()
+
+
+def _add_timings(config, out_state):
+    """
+    Add recorded durations of applied versions and estimates for pending ones
+    """
+    recorded = {}
+    if _is_initialized(config.schema, config.cursor):
+        recorded = _get_timings(config.schema, config.cursor)
+    estimates = config.timings_instance.estimates
+    total = 0.0
+    unknown = 0
+    for version, meta in out_state.items():
+        meta = dict(meta)
+        if meta['installed_on'] is not None:
+            meta['duration'] = recorded.get(version)
+        else:
+            meta['estimated_duration'] = estimates.get(version)
+            if version in estimates:
+                total += estimates[version]
+            else:
+                unknown += 1
+        out_state[version] = meta
+    LOG.info(
+        'Estimated duration of pending versions: %.3f seconds '
+        '(%d versions without estimate)', total, unknown)
+
+
+def _add_schedule(config, state, out_state):
+    """
+    Add dependencies and stages of pending versions and log critical path
+    (only with parallel_workers as dependency headers are not used otherwise)
+    """
+    if config.parallel_workers < 2:
+        return
+    dependencies = _get_dependencies(state)
+    estimates = None
+    if config.timings_instance:
+        estimates = config.timings_instance.estimates
+    stages, finish = _get_schedule(dependencies, estimates)
+    length = max(stages.values(), default=0)
+    if length < len(stages):
+        for version, depends in dependencies.items():
+            if version in out_state:
+                meta = dict(out_state[version])
+                meta['depends'] = sorted(depends)
+                meta['stage'] = stages[version]
+                out_state[version] = meta
+    LOG.info('Schedule of %d pending versions: critical path length %d',
+             len(stages), length)
+    if estimates is not None:
+        LOG.info('Estimated critical path duration: %.3f seconds',
+                 max(finish.values(), default=0.0))
+
+
+def info(config, stdout=True):
+    """
+    Info cmdline wrapper
+    """
+    state = _get_config_state(config)
+    if stdout:
+        out_state = OrderedDict()
+        for version in sorted(state, key=int):
+            if config.show_only_unapplied and state[version].meta[
+                    'installed_on'] is not None:
+                continue
+            out_state[version] = state[version].meta
+        if config.timings_instance:
+            _add_timings(config, out_state)
+        _add_schedule(config, state, out_state)
+        sys.stdout.write(
+            json.dumps(out_state, indent=4, separators=(',', ': ')) + '\n')
+
+    _finish(config)
+
+    return state
+
+
+def list_migrations(config):
+    """
+    List migrations from base dir (without database connection)
+    """
+    state = _get_migrations_info(config.base_dir, config.baseline,
+                                 config.target)
+    out_state = OrderedDict()
+    for version in sorted(state):
+        out_state[version] = state[version].meta
+    _add_schedule(config, state, out_state)
+    sys.stdout.write(
+        json.dumps(out_state, indent=4, separators=(',', ': ')) + '\n')
+
+    return state
+
+
+def check(config):
+    """
+    Check if database is up to date with target
+    (returns CHECK_PENDING_EXIT_CODE if there are pending migrations)
+    """
+    _check_target(config)
+    _, pending, _ = _get_pending_versions(config)
+    _finish(config)
+    if pending:
+        LOG.info('Pending versions: %s', ', '.join(str(x) for x in pending))
+        return CHECK_PENDING_EXIT_CODE
+    LOG.info('Database is up to date')
+    return 0
 
 
 def clean(config):
@@ -623,6 +2638,15 @@ def clean(config):
             SQL('DROP TABLE {schema}.schema_version').format(
                 schema=Identifier(config.schema)))
         LOG.info(config.cursor.statusmessage)
+        config.cursor.execute(
+            SQL('DROP TABLE IF EXISTS {schema}.schema_version_timings').format(
+                schema=Identifier(config.schema)))
+        config.cursor.execute(
+            SQL('DROP TABLE IF EXISTS {schema}.schema_version_chunks').format(
+                schema=Identifier(config.schema)))
+        config.cursor.execute(
+            SQL('DROP TABLE IF EXISTS {schema}.schema_version_progress').
+            format(schema=Identifier(config.schema)))
         LOG.info('dropping schema_version_type')
         config.cursor.execute(
             SQL('DROP TYPE {schema}.schema_version_type').format(
@@ -635,6 +2659,8 @@ def baseline(config):
     """
     Set baseline cmdline wrapper
     """
+    config = _resolve_user(config)
+    _acquire_advisory_lock(config)
     if not _is_initialized(config.schema, config.cursor):
         _init_schema(config.schema, config.cursor)
     _set_baseline(config.baseline, config.user, config.schema, config.cursor)
@@ -642,7 +2668,122 @@ def baseline(config):
     _finish(config)
 
 
-def _prepare_nontransactional_steps(state, callbacks):
+PREVIEW_RELATIONS_QUERY = """
+SELECT c.oid, n.nspname || '.' || c.relname, c.relfilenode,
+       s.n_tup_ins, s.n_tup_upd, s.n_tup_del
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+LEFT JOIN pg_stat_xact_user_tables s ON s.relid = c.oid
+WHERE n.nspname !~ '^pg_' AND n.nspname <> 'information_schema'
+"""
+
+PREVIEW_LOCKS_QUERY = """
+SELECT relation, mode FROM pg_locks
+WHERE pid = pg_backend_pid() AND locktype = 'relation' AND granted
+"""
+
+PREVIEW_ROWS = ('inserted', 'updated', 'deleted')
+
+
+def _get_preview_snapshot(cursor):
+    """
+    Get user relations (with filenodes and rows changed in transaction)
+    and relation locks of current backend
+    """
+    cursor.execute(PREVIEW_RELATIONS_QUERY)
+    relations = {row[0]: row[1:] for row in cursor.fetchall()}
+    cursor.execute(PREVIEW_LOCKS_QUERY)
+    return relations, set(cursor.fetchall())
+
+
+def _get_preview_diff(before, after, held):
+    """
+    Get locks, rewritten/created/dropped relations and affected rows
+    between snapshots
+
+    Locks are all relation locks held after version is applied except
+    held ones (taken by pgmigrate before pending versions): locks taken
+    by previous pending versions are held during it too (as versions
+    are applied in single transaction), and lock re-acquired by version
+    is not distinguishable from already held one in pg_locks.
+    """
+    names = {x: y[0] for x, y in before[0].items()}
+    names.update({x: y[0] for x, y in after[0].items()})
+    ret = {'locks': {}}
+    for relation, mode in sorted(after[1] - held):
+        if relation in names:
+            ret['locks'].setdefault(names[relation], []).append(mode)
+    ret['rewritten'] = sorted(
+        y[0] for x, y in after[0].items()
+        if x in before[0] and before[0][x][1] not in (y[1], 0))
+    ret['created'] = sorted(y[0] for x, y in after[0].items()
+                            if x not in before[0])
+    ret['dropped'] = sorted(y[0] for x, y in before[0].items()
+                            if x not in after[0])
+    ret['rows'] = {}
+    for relation, row in after[0].items():
+        old = before[0].get(relation, (None, None, 0, 0, 0))
+        rows = [(x or 0) - (y or 0) for x, y in zip(row[2:], old[2:])]
+        if any(rows):
+            ret['rows'][row[0]] = dict(zip(PREVIEW_ROWS, rows))
+    return ret
+
+
+def _preview_version(config, version_info, cursor, held):
+    """
+    Apply transactional version in savepoint recording its impact
+    """
+    before = _get_preview_snapshot(cursor)
+    cursor.execute('SAVEPOINT pgmigrate_preview')
+    started = time.monotonic()
+    try:
+        _apply_file(config, version_info.file_path, cursor)
+    except (MigrateError, psycopg2.Error) as exc:
+        cursor.execute('ROLLBACK TO SAVEPOINT pgmigrate_preview')
+        # statement errors are raised while handling database error
+        error = str(exc.__context__ or exc).strip()
+        return {'error': error, 'duration': time.monotonic() - started}
+    duration = time.monotonic() - started
+    cursor.execute('RELEASE SAVEPOINT pgmigrate_preview')
+    ret = _get_preview_diff(before, _get_preview_snapshot(cursor), held)
+    ret['duration'] = duration
+    return ret
+
+
+def preview(config):
+    """
+    Apply pending transactional versions in single transaction reporting
+    locks, rewrites, affected rows and duration of each one
+    (everything is rolled back in the end)
+    """
+    _check_target(config)
+    state = _get_config_state(config)
+    _init_step(config, state, config.cursor)
+    config.cursor.execute(PREVIEW_LOCKS_QUERY)
+    held = set(config.cursor.fetchall())
+    report = OrderedDict()
+    failed = False
+    for version in sorted(state):
+        meta = state[version].meta
+        if meta['installed_on'] is not None:
+            continue
+        report[version] = OrderedDict(description=meta['description'])
+        if failed or not meta['transactional']:
+            report[version]['skipped'] = ('previous version failed'
+                                          if failed else 'nontransactional')
+            continue
+        LOG.info('Previewing version %d', version)
+        report[version].update(
+            _preview_version(config, state[version], config.cursor, held))
+        failed = 'error' in report[version]
+    sys.stdout.write(
+        json.dumps(report, indent=4, separators=(',', ': ')) + '\n')
+    _finish(config._replace(dryrun=True))
+    if failed:
+        raise MigrateError('Preview of pending versions failed')
+
+
+def _prepare_nontransactional_steps(state, callbacks, dependencies=None):
     initialized = False
     steps = []
     i = {'state': {}, 'cbs': _get_callbacks('')}
@@ -658,6 +2799,11 @@ def _prepare_nontransactional_steps(state, callbacks):
                 LOG.error('First migration MUST be transactional')
                 raise MalformedMigration('First migration MUST '
                                          'be transactional')
+            if dependencies is not None and _is_independent(
+                    steps, dependencies[version]):
+                steps[-1]['state'][version] = state[version]
+                steps[-1]['parallel'] = True
+                continue
             steps.append({
                 'state': {
                     version: state[version],
@@ -671,91 +2817,497 @@ def _prepare_nontransactional_steps(state, callbacks):
     if i['state']:
         steps.append(i)
 
-    transactional = []
-    for (num, step) in enumerate(steps):
-        if next(iter(step['state'].values())).meta['transactional']:
-            transactional.append(num)
+    transactional = []
+    for (num, step) in enumerate(steps):
+        if next(iter(step['state'].values())).meta['transactional']:
+            transactional.append(num)
+
+    if len(transactional) > 1:
+        for num in transactional[1:]:
+            steps[num]['cbs'] = steps[num]['cbs']._replace(beforeAll=[])
+        for num in transactional[:-1]:
+            steps[num]['cbs'] = steps[num]['cbs']._replace(afterAll=[])
+
+    LOG.info('Initialization plan result:\n %s',
+             json.dumps(steps, indent=4, separators=(',', ': ')))
+
+    return steps
+
+
+def _is_independent(steps, depends):
+    """
+    Check if nontransactional version could join previous step
+    (it is nontransactional and has no versions version depends on)
+    """
+    return bool(steps) and not next(iter(steps[-1]['state'].values(
+    ))).meta['transactional'] and depends.isdisjoint(steps[-1]['state'])
+
+
+def _get_step_dependencies(config, state):
+    """
+    Get dependencies for parallel steps grouping (if enabled)
+    """
+    if config.parallel_workers > 1:
+        return _get_dependencies(state)
+    return None
+
+
+def _execute_mixed_steps(config, steps, nt_conn):
+    commit_req = False
+    for step in steps:
+        if commit_req:
+            config.conn_instance.commit()
+            commit_req = False
+        if not next(iter(step['state'].values())).meta['transactional']:
+            cur = _init_cursor(nt_conn, config.session)
+        else:
+            cur = config.cursor
+            commit_req = True
+        if step.get('parallel'):
+            _migrate_parallel(config, step['state'], cur)
+        else:
+            _migrate_step(config, step['state'], step['cbs'], cur)
+
+
+def _schema_check(schema, cursor):
+    """
+    Check that only one schema used in migrations
+    """
+    cursor.execute(
+        'SELECT n.nspname, c.relname FROM pg_locks l JOIN pg_class c ON '
+        '(l.relation=c.oid) JOIN pg_namespace n ON '
+        '(c.relnamespace=n.oid) WHERE l.pid = pg_backend_pid() '
+        "AND n.nspname !~ '^pg_' AND n.nspname <> 'information_schema'")
+
+    unexpected = set()
+    for namespace, relation in cursor.fetchall():
+        if namespace != schema:
+            unexpected.add('.'.join((namespace, relation)))
+
+    if unexpected:
+        raise MigrateError(
+            'Unexpected relations used in migrations: {used}'.format(
+                used=(', '.join(sorted(unexpected)))))
+
+
+def _check_serial_versions(state, not_applied):
+    """
+    Check that there are no gaps in migration versions
+    """
+    applied = [x for x in state if state[x].meta['installed_on'] is not None]
+    sorted_versions = sorted(not_applied)
+    if applied:
+        sorted_versions.insert(0, max(applied))
+    first = sorted_versions[0]
+    last = sorted_versions[-1]
+    if last - first + 1 != len(sorted_versions):
+        versions = set(sorted_versions)
+        missing = [str(x) for x in range(first, last) if x not in versions]
+        raise MigrateError(
+            'Migration versions have gaps: missing versions {versions}'.format(
+                versions=', '.join(missing)))
+
+
+REWRITE_GUARD_NAME = r'(?:"(?:[^"]|"")+"|[\w$]+)'
+
+# balanced parentheses with up to 3 levels of nesting
+REWRITE_GUARD_PARENS = r'\((?:[^()]|\((?:[^()]|\([^()]*\))*\))*\)'
+
+REWRITE_GUARD_ADD_COLUMN = (
+    r'\bADD\s+(?:COLUMN\s+)?'
+    r'(?!(?:CONSTRAINT|CHECK|FOREIGN|PRIMARY|UNIQUE|EXCLUDE)\b)'
+    r'(?:IF\s+NOT\s+EXISTS\s+)?{name}\s+')
+
+REWRITE_GUARD_PARTS = {
+    'prefix':
+    r'^(?:\s+|--[^\n]*\n)*',
+    'name':
+    REWRITE_GUARD_NAME,
+    'relation':
+    r'(?P<relation>{name}(?:\s*\.\s*{name})?)'.format(name=REWRITE_GUARD_NAME),
+    'parens':
+    REWRITE_GUARD_PARENS,
+    'add_column':
+    REWRITE_GUARD_ADD_COLUMN.format(name=REWRITE_GUARD_NAME),
+    # rest of column definition (up to next action of ALTER TABLE)
+    'column':
+    r'(?:[^,()]|{parens})*?'.format(parens=REWRITE_GUARD_PARENS),
+    'volatile':
+    r'(?:random|clock_timestamp|timeofday|gen_random_uuid'
+    r'|uuid_generate_v[14]\w*|nextval)\s*\(',
+}
+
+
+def _get_rewrite_guard_re(pattern, flags=re.IGNORECASE):
+    """
+    Compile rewrite guard pattern (with common parts substituted)
+    """
+    return re.compile(
+        pattern.format(**REWRITE_GUARD_PARTS).encode('utf-8'), flags)
+
+
+REWRITE_GUARD_ALTER_RE = _get_rewrite_guard_re(
+    r'{prefix}ALTER\s+TABLE\s+(?:IF\s+EXISTS\s+)?(?:ONLY\s+)?'
+    r'{relation}(?P<actions>.*)', re.IGNORECASE | re.DOTALL)
+
+REWRITE_GUARD_ACTIONS = (
+    (_get_rewrite_guard_re(
+        r'\bALTER\s+(?:COLUMN\s+)?{name}\s+(?:SET\s+DATA\s+)?TYPE\b'),
+     'rewrite'),
+    (_get_rewrite_guard_re(
+        r'\bSET\s+(?:LOGGED|UNLOGGED|TABLESPACE|ACCESS\s+METHOD)\b'),
+     'rewrite'),
+    (_get_rewrite_guard_re(r'\bSET\s+NOT\s+NULL\b'), 'scan'),
+    (_get_rewrite_guard_re(
+        r'\bADD\s+(?:CONSTRAINT\s+{name}\s+)?'
+        r'(?:CHECK|FOREIGN\s+KEY|PRIMARY\s+KEY|UNIQUE|EXCLUDE)\b'
+        r'(?!.*\bNOT\s+VALID\b)(?!.*\bUSING\s+INDEX\b)',
+        re.IGNORECASE | re.DOTALL), 'scan'),
+    (_get_rewrite_guard_re(r'\bVALIDATE\s+CONSTRAINT\b'), 'scan'),
+    (_get_rewrite_guard_re(
+        r'{add_column}{column}\bDEFAULT\s+(?:[^,()]|\(|{parens})*?'
+        r'\b{volatile}'), 'rewrite'),
+    (_get_rewrite_guard_re(
+        r'{add_column}{column}\bGENERATED\s+ALWAYS\s+AS\s*{parens}'
+        r'\s*STORED\b'), 'rewrite'),
+    (_get_rewrite_guard_re(
+        r'{add_column}{column}\bGENERATED\s+(?:ALWAYS|BY\s+DEFAULT)\s+'
+        r'AS\s+IDENTITY\b'), 'rewrite'),
+    (_get_rewrite_guard_re(r'{add_column}(?:small|big)?serial[248]?\b'),
+     'rewrite'),
+    (_get_rewrite_guard_re(
+        r'{add_column}{column}\b(?:PRIMARY\s+KEY|UNIQUE)\b'), 'scan'),
+)
+
+REWRITE_GUARD_STATEMENTS = (
+    (_get_rewrite_guard_re(
+        r'{prefix}CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?!CONCURRENTLY\b)'
+        r'(?:IF\s+NOT\s+EXISTS\s+)?(?:{name}\s+)?ON\s+(?:ONLY\s+)?'
+        r'{relation}'), 'scan'),
+    (_get_rewrite_guard_re(
+        r'{prefix}CLUSTER\s+(?:\([^)]*\)\s*|VERBOSE\s+)?{relation}'),
+     'rewrite'),
+    (_get_rewrite_guard_re(
+        r'{prefix}VACUUM(?:\s*\([^)]*\bFULL\b[^)]*\)\s*'
+        r'|\s+FULL\s+(?:FREEZE\s+)?(?:VERBOSE\s+)?(?:ANALYZE\s+)?)'
+        r'{relation}'), 'rewrite'),
+    (_get_rewrite_guard_re(
+        r'{prefix}REINDEX\s+(?:\([^)]*\)\s*)?TABLE\s+(?!CONCURRENTLY\b)'
+        r'{relation}'), 'scan'),
+)
+
+REWRITE_GUARD_QUERY = """
+SELECT r.name, quote_ident(n.nspname) || '.' || quote_ident(c.relname),
+       pg_total_relation_size(r.rel),
+       pg_size_pretty(pg_total_relation_size(r.rel))
+FROM (SELECT name, to_regclass(name) AS rel
+      FROM unnest(%s::text[]) AS name) r
+LEFT JOIN pg_class c ON (c.oid = r.rel)
+LEFT JOIN pg_namespace n ON (n.oid = c.relnamespace)
+"""
+
+
+def _get_rewrite_operation(statement):
+    """
+    Get (relation, kind) of table rewrite or full scan done by statement
+    """
+    if isinstance(statement, CopyStatement):
+        return None
+    match = REWRITE_GUARD_ALTER_RE.match(statement)
+    if match:
+        kinds = {
+            kind
+            for regexp, kind in REWRITE_GUARD_ACTIONS
+            if regexp.search(match.group('actions'))
+        }
+        if not kinds:
+            return None
+        kind = 'rewrite' if 'rewrite' in kinds else 'scan'
+        return match.group('relation').decode('utf-8'), kind
+    for regexp, kind in REWRITE_GUARD_STATEMENTS:
+        match = regexp.match(statement)
+        if match:
+            return match.group('relation').decode('utf-8'), kind
+    return None
+
+
+def _get_rewrite_operations(config, state, not_applied):
+    """
+    Get (version, relation, kind) of rewrites and scans in pending versions
+    """
+    operations = []
+    for version in sorted(not_applied):
+        file_path = state[version].file_path
+        with closing(_get_file_statements(config, file_path)) as statements:
+            for statement in statements:
+                operation = _get_rewrite_operation(statement)
+                if operation:
+                    operations.append((version, ) + operation)
+    return operations
+
+
+def _check_rewrites(config, state, not_applied):
+    """
+    Check that pending versions do not rewrite or scan large relations
+
+    Relation sizes are fetched with single catalog query.
+    Relations missing in database (created by pending versions) are skipped.
+    """
+    operations = _get_rewrite_operations(config, state, not_applied)
+    if not operations:
+        return
+    config.cursor.execute(REWRITE_GUARD_QUERY,
+                          (sorted({x[1]
+                                   for x in operations}), ))
+    sizes = {row[0]: row[1:] for row in config.cursor.fetchall()}
+    confirmed = config.confirm_rewrite or []
+    if isinstance(confirmed, str):
+        confirmed = confirmed.split(',')
+    blocked = []
+    for version, relation, kind in operations:
+        name, size, pretty = sizes[relation]
+        if size is None or size <= config.max_rewrite_size:
+            continue
+        if relation in confirmed or name in confirmed:
+            LOG.warning('Version %d will %s %s (%s): confirmed', version, kind,
+                        name, pretty)
+            continue
+        LOG.error('Version %d would %s %s (%s)', version, kind, name, pretty)
+        if name not in blocked:
+            blocked.append(name)
+    if blocked:
+        raise UnconfirmedRewrite(
+            'Relations larger than {size} bytes would be rewritten or '
+            'scanned: {names} (use --confirm_rewrite to allow)'.format(
+                size=config.max_rewrite_size, names=', '.join(blocked)))
+
+
+def _apply_state(config, state, not_applied, non_trans):
+    """
+    Apply not applied versions from state
+    """
+    if non_trans:
+        if len(state) != len(not_applied) and not config.force_mixed:
+            if len(not_applied) != len(non_trans):
+                LOG.error('Unable to mix transactional and '
+                          'nontransactional migrations')
+                raise MigrateError('Unable to mix transactional and '
+                                   'nontransactional migrations')
+            config.cursor.execute('rollback')
+            with closing(_create_connection(config)) as nt_conn:
+                nt_conn.autocommit = True
+                if config.parallel_workers > 1:
+                    _execute_mixed_steps(
+                        config,
+                        _prepare_nontransactional_steps(
+                            state, _get_callbacks(''),
+                            _get_dependencies(state)), nt_conn)
+                else:
+                    cursor = _init_cursor(nt_conn, config.session)
+                    _migrate_step(config, state, _get_callbacks(''), cursor)
+                if config.terminator_instance:
+                    config.terminator_instance.remove_conn(nt_conn)
+        else:
+            steps = _prepare_nontransactional_steps(
+                state, config.callbacks, _get_step_dependencies(config, state))
+
+            with closing(_create_connection(config)) as nt_conn:
+                nt_conn.autocommit = True
+
+                _execute_mixed_steps(config, steps, nt_conn)
+
+                if config.terminator_instance:
+                    config.terminator_instance.remove_conn(nt_conn)
+    else:
+        _migrate_step(config, state, config.callbacks, config.cursor)
+        if not config.disable_schema_check:
+            with _profile(config, 'schema check', 'schema check'):
+                _schema_check(config.schema, config.cursor)
+
+
+MANIFEST_RACY_INTERVAL = 2.0
+
+
+def _is_manifest_valid(manifest):
+    """
+    Check that migrations dir and its subdirs are not changed since
+    manifest was saved
 
-    if len(transactional) > 1:
-        for num in transactional[1:]:
-            steps[num]['cbs'] = steps[num]['cbs']._replace(beforeAll=[])
-        for num in transactional[:-1]:
-            steps[num]['cbs'] = steps[num]['cbs']._replace(afterAll=[])
+    Dirs modified less than MANIFEST_RACY_INTERVAL seconds before manifest
+    was saved could be changed again without mtime change (mtime granularity
+    of some filesystems is 1-2 seconds), so such manifest is not trusted.
+    """
+    with suppress(OSError, AttributeError, KeyError, TypeError):
+        racy = manifest['saved'] - int(MANIFEST_RACY_INTERVAL * 1e9)
+        return all(mtime < racy and os.stat(path).st_mtime_ns == mtime
+                   for path, mtime in manifest['dirs'].items())
+    return False
 
-    LOG.info('Initialization plan result:\n %s',
-             json.dumps(steps, indent=4, separators=(',', ': ')))
 
-    return steps
+def _get_manifest_versions(config):
+    """
+    Get versions of migrations in base dir
+    (using cached manifest if statements cache is enabled)
 
+    Only file names are checked here (for duplicate versions), contents
+    of migrations are not read.
+    """
+    path = os.path.abspath(_get_migrations_dir(config.base_dir))
+    cache = config.cache_instance
+    manifest = cache.load_manifest(path) if cache else None
+    if manifest and _is_manifest_valid(manifest):
+        return manifest['versions']
+    saved = time.time_ns()
+    dirs = {}
+    found = {}
+    pending = [path]
+    while pending:
+        root = pending.pop()
+        dirs[root] = os.stat(root).st_mtime_ns
+        for entry in os.scandir(root):
+            if entry.is_dir(follow_symlinks=False):
+                pending.append(entry.path)
+                continue
+            match = MIGRATION_FILE_RE.match(entry.name)
+            if match is None:
+                continue
+            version = int(match.group('version'))
+            if version in found:
+                raise MalformedMigration(
+                    ('Found migrations with same version: {version} '
+                     '\nfirst : {first_path}'
+                     '\nsecond: {second_path}').format(
+                         version=version,
+                         first_path=entry.path,
+                         second_path=found[version]))
+            found[version] = entry.path
+    versions = sorted(found)
+    if cache:
+        cache.store_manifest(path, {
+            'dirs': dirs,
+            'saved': saved,
+            'versions': versions,
+        })
+    return versions
+
+
+def _get_max_applied(config):
+    """
+    Get max applied version and database user with single query
+    (-1 and None if schema_version table does not exist)
+    """
+    try:
+        config.cursor.execute(
+            SQL('SELECT coalesce(max(version), 0), CURRENT_USER '
+                'FROM {schema}.schema_version').format(
+                    schema=Identifier(config.schema)))
+    except psycopg2.Error as exc:
+        if exc.pgcode not in (UNDEFINED_TABLE, INVALID_SCHEMA_NAME,
+                              UNDEFINED_COLUMN):
+            raise
+        config.conn_instance.rollback()
+        _init_cursor(config.conn_instance, config.session)
+        if exc.pgcode == UNDEFINED_COLUMN:
+            # raises MalformedSchema with actual structure
+            _is_initialized(config.schema, config.cursor)
+        return -1, None
+    return config.cursor.fetchone()
 
-def _execute_mixed_steps(config, steps, nt_conn):
-    commit_req = False
-    for step in steps:
-        if commit_req:
-            config.conn_instance.commit()
-            commit_req = False
-        if not next(iter(step['state'].values())).meta['transactional']:
-            cur = _init_cursor(nt_conn, config.session)
-        else:
-            cur = config.cursor
-            commit_req = True
-        _migrate_step(step['state'], step['cbs'], config.user, config.schema,
-                      config.set_version_info_after_callbacks, cur)
+
+def _get_pending_versions(config):
+    """
+    Get versions above max applied version up to target and database user
+    (max applied version is -1 for not initialized database)
+    """
+    applied, user = _get_max_applied(config)
+    lowest = max(applied, config.baseline)
+    pending = [
+        x for x in _get_manifest_versions(config)
+        if lowest < x <= config.target
+    ]
+    return applied, pending, user
 
 
-def _schema_check(schema, cursor):
+def _resolve_user(config):
     """
-    Check that only one schema used in migrations
+    Set database user (if it is not set explicitly)
     """
-    cursor.execute(
-        'SELECT n.nspname, c.relname FROM pg_locks l JOIN pg_class c ON '
-        '(l.relation=c.oid) JOIN pg_namespace n ON '
-        '(c.relnamespace=n.oid) WHERE l.pid = pg_backend_pid() '
-        "AND n.nspname !~ '^pg_' AND n.nspname <> 'information_schema'")
+    if config.user is None:
+        return config._replace(user=_get_database_user(config.cursor))
+    return config
 
-    unexpected = set()
-    for namespace, relation in cursor.fetchall():
-        if namespace != schema:
-            unexpected.add('.'.join((namespace, relation)))
 
-    if unexpected:
-        raise MigrateError(
-            'Unexpected relations used in migrations: {used}'.format(
-                used=(', '.join(sorted(unexpected)))))
+ADVISORY_LOCK_MIN_INTERVAL = 0.05
 
+ADVISORY_LOCK_MAX_INTERVAL = 1.0
 
-def _check_serial_versions(state, not_applied):
+
+def _acquire_advisory_lock(config):
     """
-    Check that there are no gaps in migration versions
+    Take session advisory lock of schema (waiting for other pgmigrate runs)
+
+    Lock is polled with pg_try_advisory_lock, so waiting run is not seen
+    as blocked by conflicting pids terminator. If lock was taken by other
+    run transaction is restarted (with session setup) after acquiring it,
+    so state is not read with snapshot taken before lock holder committed.
+    Returns True if lock was waited for.
     """
-    applied = [x for x in state if state[x].meta['installed_on'] is not None]
-    sorted_versions = sorted(not_applied)
-    if applied:
-        sorted_versions.insert(0, max(applied))
-    first = sorted_versions[0]
-    last = sorted_versions[-1]
-    if last - first + 1 != len(sorted_versions):
-        versions = set(sorted_versions)
-        missing = [str(x) for x in range(first, last) if x not in versions]
-        raise MigrateError(
-            'Migration versions have gaps: missing versions {versions}'.format(
-                versions=', '.join(missing)))
+    if config.disable_advisory_lock:
+        return False
+    started = time.monotonic()
+    delay = ADVISORY_LOCK_MIN_INTERVAL
+    while True:
+        config.cursor.execute('SELECT pg_try_advisory_lock(hashtext(%s))',
+                              (_get_advisory_lock_name(config), ))
+        if config.cursor.fetchone()[0]:
+            break
+        waited = time.monotonic() - started
+        timeout = config.advisory_lock_timeout
+        if timeout is not None and waited >= timeout:
+            raise LockNotAvailable(
+                'Unable to acquire advisory lock of schema {schema} '
+                'in {timeout} seconds'.format(schema=config.schema,
+                                              timeout=timeout))
+        if delay == ADVISORY_LOCK_MIN_INTERVAL:
+            LOG.info('Waiting for advisory lock of schema %s', config.schema)
+        time.sleep(delay)
+        delay = min(delay * 2, ADVISORY_LOCK_MAX_INTERVAL)
+    waited = time.monotonic() - started
+    LOG.info('Advisory lock of schema %s acquired in %.3f seconds',
+             config.schema, waited)
+    if config.metrics_instance:
+        config.metrics_instance.inc(
+            'pgmigrate_advisory_lock_wait_seconds_total', waited)
+    if delay == ADVISORY_LOCK_MIN_INTERVAL:
+        return False
+    config.conn_instance.rollback()
+    _init_cursor(config.conn_instance, config.session)
+    return True
 
 
-def migrate(config):
+def _get_advisory_lock_name(config):
+    return 'pgmigrate:{schema}'.format(schema=config.schema)
+
+
+def _release_advisory_lock(config):
     """
-    Migrate cmdline wrapper
+    Release session advisory lock of schema (for pooled connections)
     """
+    config.cursor.execute('SELECT pg_advisory_unlock(hashtext(%s))',
+                          (_get_advisory_lock_name(config), ))
+
+
+def _check_target(config):
     if config.target is None:
         LOG.error('Unknown target (you could use "latest" to '
                   'use latest available version)')
         raise MigrateError('Unknown target')
 
-    state = _get_state(config.base_dir, config.baseline, config.target,
-                       config.schema, config.cursor)
-    not_applied = [x for x in state if state[x].meta['installed_on'] is None]
-    non_trans = [x for x in not_applied if not state[x].meta['transactional']]
 
+def _check_plan(config, state, not_applied, non_trans):
+    """
+    Check that not applied versions could be applied
+    """
     if not_applied and config.check_serial_versions:
         _check_serial_versions(state, not_applied)
 
@@ -768,47 +3320,374 @@ def migrate(config):
             LOG.error('Dry run for nontransactional migrations is nonsense')
             raise MigrateError('Dry run for nontransactional migrations '
                                'is nonsense')
-        if len(state) != len(not_applied) and not config.force_mixed:
-            if len(not_applied) != len(non_trans):
-                LOG.error('Unable to mix transactional and '
-                          'nontransactional migrations')
-                raise MigrateError('Unable to mix transactional and '
-                                   'nontransactional migrations')
-            config.cursor.execute('rollback')
-            with closing(_create_connection(config)) as nt_conn:
-                nt_conn.autocommit = True
-                cursor = _init_cursor(nt_conn, config.session)
-                _migrate_step(state, _get_callbacks(''), config.user,
-                              config.schema,
-                              config.set_version_info_after_callbacks, cursor)
-                if config.terminator_instance:
-                    config.terminator_instance.remove_conn(nt_conn)
-        else:
-            steps = _prepare_nontransactional_steps(state, config.callbacks)
 
-            with closing(_create_connection(config)) as nt_conn:
-                nt_conn.autocommit = True
+    if not_applied and config.max_rewrite_size is not None:
+        _check_rewrites(config, state, not_applied)
 
-                _execute_mixed_steps(config, steps, nt_conn)
 
-                if config.terminator_instance:
-                    config.terminator_instance.remove_conn(nt_conn)
-    else:
-        _migrate_step(state, config.callbacks, config.user, config.schema,
-                      config.set_version_info_after_callbacks, config.cursor)
-        if not config.disable_schema_check:
-            _schema_check(config.schema, config.cursor)
+def _migrate(config):
+    """
+    Apply not applied migrations up to target (without commit)
+    """
+    _check_target(config)
+    if config.timings_instance:
+        # durations left on this thread by failed target are not committed
+        config.timings_instance.discard()
+
+    if not config.shared_instance:
+        with _profile(config, 'pending versions', 'state'):
+            applied, pending, user = _get_pending_versions(config)
+        if applied >= 0 and not pending:
+            LOG.info('Database is up to date')
+            return
+        if config.user is None:
+            config = config._replace(user=user)
+
+    state = _get_config_state(config)
+    not_applied = [x for x in state if state[x].meta['installed_on'] is None]
+    non_trans = [x for x in not_applied if not state[x].meta['transactional']]
+    if not_applied:
+        config = _resolve_user(config)
 
-    _finish(config)
+    with _profile(config, 'plan', 'plan'):
+        _check_plan(config, state, not_applied, non_trans)
+
+    prefetcher = None
+    if config.prefetch and not_applied:
+        prefetcher = StatementPrefetcher(
+            config, [state[x].file_path for x in sorted(not_applied)])
+        config = config._replace(prefetch_instance=prefetcher)
+    try:
+        _apply_state(config, state, not_applied, non_trans)
+    finally:
+        if prefetcher:
+            prefetcher.stop()
+
+
+def migrate(config):
+    """
+    Migrate cmdline wrapper
+    """
+    _check_target(config)
+    _acquire_advisory_lock(config)
+    try:
+        _migrate(config)
+
+        try:
+            _wait_replicas(config)
+        finally:
+            _finish(config)
+    finally:
+        # only durations of committed versions are saved
+        if not config.shared_instance:
+            _save_timings(config)
+
+
+def _mask_conn(conn):
+    """
+    Get connection string without password (for logs and reports)
+    """
+    params = parse_dsn(conn)
+    if 'password' in params:
+        params['password'] = '***'
+    return make_dsn(**params)
+
+
+def _get_fleet_targets(config):
+    """
+    Get fleet connection strings from config and targets file
+    """
+    targets = list(config.fleet_conn or [])
+    if config.fleet_file:
+        path = os.path.join(config.base_dir, config.fleet_file)
+        with open(path, encoding='utf-8') as i:
+            for line in i:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    targets.append(line)
+    return [make_dsn(config.conn, **parse_dsn(x)) for x in targets]
+
+
+def _close(config):
+    if config.terminator_instance:
+        config.terminator_instance.stop()
+    if config.conn_instance:
+        config.conn_instance.close()
+
+
+def _run_target(config, name, func, stop):
+    """
+    Migrate single fleet target (skipped after failure with stop policy)
+
+    Any error of target is reported as its failure (so other targets
+    are still reported).
+    """
+    result = OrderedDict([('status', 'skipped'), ('duration', 0.0),
+                          ('error', None)])
+    if stop.is_set():
+        return result
+    LOG.info('Migrating %s', name)
+    started = time.monotonic()
+    try:
+        func()
+        result['status'] = 'succeeded'
+    except Exception as exc:  # pylint: disable=broad-exception-caught
+        LOG.error('Unable to migrate %s: %s', name, exc)
+        result['status'] = 'failed'
+        result['error'] = str(exc).strip()
+        if config.fleet_policy == 'stop':
+            stop.set()
+    result['duration'] = round(time.monotonic() - started, 3)
+    return result
+
+
+def _run_fleet(config, targets):
+    """
+    Migrate fleet targets (name -> function) on worker pool and report
+    """
+    stop = threading.Event()
+    workers = min(config.fleet_workers, len(targets))
+    with ThreadPoolExecutor(max_workers=workers,
+                            thread_name_prefix='fleet') as executor:
+        futures = [(name, executor.submit(_run_target, config, name, func,
+                                          stop))
+                   for name, func in targets.items()]
+        report = OrderedDict((name, x.result()) for name, x in futures)
+    sys.stdout.write(
+        json.dumps(report, indent=4, separators=(',', ': ')) + '\n')
+    statuses = [x['status'] for x in report.values()]
+    LOG.info('Fleet migration: %d succeeded, %d failed, %d skipped',
+             statuses.count('succeeded'), statuses.count('failed'),
+             statuses.count('skipped'))
+    if statuses.count('succeeded') != len(statuses):
+        raise MigrateError(
+            'Fleet migration failed on {failed} of {total} targets'.format(
+                failed=len(statuses) - statuses.count('succeeded'),
+                total=len(statuses)))
+
+
+def _migrate_database(config, conn):
+    """
+    Migrate fleet target database
+    """
+    target = config._replace(conn=conn)
+    try:
+        target = _connect(target)
+        migrate(target)
+    finally:
+        _close(target)
+
+
+def fleet(config):
+    """
+    Migrate all fleet targets on worker pool
+    """
+    _check_target(config)
+    targets = list(OrderedDict.fromkeys(_get_fleet_targets(config)))
+    if not targets:
+        raise ConfigurationError('No fleet targets')
+    config = config._replace(shared_instance=SharedMigrations(config),
+                             prefetch=0)
+    try:
+        _run_fleet(
+            config,
+            OrderedDict((_mask_conn(x), partial(_migrate_database, config, x))
+                        for x in targets))
+    finally:
+        _save_timings(config)
+
+
+TENANTS_QUERY = """
+SELECT n.nspname,
+       (SELECT array_agg(a.attname::text ORDER BY a.attnum)
+        FROM pg_attribute a
+        WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped)
+FROM pg_namespace n
+LEFT JOIN pg_class c ON c.relnamespace = n.oid
+    AND c.relname = 'schema_version' AND c.relkind IN ('r', 'p', 'v', 'f')
+WHERE n.nspname = ANY(%s) OR n.nspname ~ %s
+ORDER BY n.nspname
+"""
+
+TENANTS_CHUNK = 500
+
+
+def _get_tenants_rows(schemas, cursor):
+    """
+    Get schema_version rows of schemas (in chunks of union all queries)
+    """
+    rows = {}
+    for pos in range(0, len(schemas), TENANTS_CHUNK):
+        cursor.execute(
+            SQL(' UNION ALL ').join(
+                SQL('SELECT {name}, {columns} FROM {schema}.schema_version').
+                format(name=Literal(x),
+                       columns=REF_COLUMNS_SQL,
+                       schema=Identifier(x))
+                for x in schemas[pos:pos + TENANTS_CHUNK]))
+        for row in cursor.fetchall():
+            rows.setdefault(row[0], []).append(row[1:])
+    return rows
+
+
+def _get_tenants_state(config, scanned):
+    """
+    Get states of tenant schemas (with single catalog query)
+    """
+    listed = config.tenant_schemas or []
+    if isinstance(listed, str):
+        listed = listed.split(',')
+    config.cursor.execute(TENANTS_QUERY, (listed, config.tenant_pattern))
+    found = OrderedDict(config.cursor.fetchall())
+    missing = [x for x in listed if x not in found]
+    if missing:
+        raise ConfigurationError(
+            'Schemas not found: {schemas}'.format(schemas=', '.join(missing)))
+    rows = _get_tenants_rows([x for x in found if found[x] == REF_COLUMNS],
+                             config.cursor)
+    states = OrderedDict()
+    for schema, colnames in found.items():
+        if colnames is None:
+            states[schema] = _get_migrations_info(config.base_dir,
+                                                  config.baseline,
+                                                  config.target, scanned)
+            continue
+        try:
+            _check_columns(schema, colnames)
+            states[schema] = _get_info_from_rows(rows.get(schema,
+                                                          []), config.base_dir,
+                                                 config.baseline,
+                                                 config.target, scanned)
+        except MalformedSchema as exc:
+            states[schema] = exc
+    return found, states
+
+
+class ConnectionPool:
+    """
+    Connections of worker threads (one per thread, recreated if broken)
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.local = threading.local()
+        self.conns = []
+        self.lock = threading.Lock()
+
+    def get(self):
+        """
+        Get connection of current thread
+        """
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or conn.closed:
+            conn = _create_connection(self.config)
+            _init_cursor(conn, self.config.session)
+            conn.commit()
+            self.local.conn = conn
+            with self.lock:
+                self.conns.append(conn)
+        return conn
+
+    def close(self):
+        """
+        Close all connections
+        """
+        for conn in self.conns:
+            conn.close()
+
+
+def _migrate_tenant(config, schema, pool, pending):
+    """
+    Migrate tenant schema using pooled connection
+    """
+    if not pending:
+        LOG.info('Schema %s is up to date', schema)
+        return
+    conn = pool.get()
+    locked = False
+    try:
+        cursor = conn.cursor()
+        search_path = SQL('SET search_path = {schema}').format(
+            schema=Identifier(schema))
+        cursor.execute(search_path)
+        conn.commit()
+        config = config._replace(schema=schema,
+                                 conn_instance=conn,
+                                 cursor=cursor,
+                                 session=config.session + [search_path])
+        waited = _acquire_advisory_lock(config)
+        locked = not config.disable_advisory_lock
+        if waited:
+            # state fetched in bulk could be changed by lock holder
+            config.shared_instance.states.pop(schema, None)
+        _migrate(config)
+        if config.dryrun:
+            conn.rollback()
+        else:
+            conn.commit()
+            _commit_timings(config)
+    finally:
+        if not conn.closed:
+            conn.rollback()
+            if locked:
+                _release_advisory_lock(config)
+                conn.commit()
+
+
+def tenants(config):
+    """
+    Migrate tenant schemas of database on connections pool
+    """
+    _check_target(config)
+    shared = SharedMigrations(config)
+    found, states = _get_tenants_state(config, shared.migrations)
+    if not found:
+        raise ConfigurationError('No tenant schemas')
+    config.conn_instance.commit()
+    shared.states.update(states)
+    config = _resolve_user(config)
+    config = config._replace(shared_instance=shared, prefetch=0)
+    pool = ConnectionPool(config)
+    targets = OrderedDict()
+    for schema, state in states.items():
+        pending = found[schema] is None or isinstance(state, MigrateError)
+        pending = pending or any(x.meta['installed_on'] is None
+                                 for x in state.values())
+        targets[schema] = partial(_migrate_tenant, config, schema, pool,
+                                  pending)
+    try:
+        _run_fleet(config, targets)
+        _wait_replicas(config)
+    finally:
+        pool.close()
+        _finish(config)
+        _save_timings(config)
 
 
 COMMANDS = {
     'info': info,
+    'list': list_migrations,
+    'check': check,
+    'preview': preview,
     'clean': clean,
     'baseline': baseline,
     'migrate': migrate,
+    'fleet': fleet,
+    'tenants': tenants,
 }
 
+CHECK_PENDING_EXIT_CODE = 3
+
+REPLICAS_WAIT_TIMEOUT_EXIT_CODE = 4
+
+OFFLINE_COMMANDS = ('fleet', 'list')
+
+MIGRATE_COMMANDS = ('migrate', 'tenants')
+
+FLEET_POLICIES = ('stop', 'continue')
+
+TIMINGS = (None, 'version', 'statement')
+
 CONFIG_DEFAULTS = Config(target=None,
                          baseline=0,
                          cursor=None,
@@ -822,21 +3701,147 @@ CONFIG_DEFAULTS = Config(target=None,
                          conn_instance=None,
                          terminator_instance=None,
                          termination_interval=None,
+                         termination_grace=1.0,
                          schema=None,
                          force_mixed=False,
                          disable_schema_check=False,
                          check_serial_versions=False,
                          set_version_info_after_callbacks=False,
-                         show_only_unapplied=False)
+                         show_only_unapplied=False,
+                         parser='native',
+                         cache_dir=None,
+                         cache_size=512 * 1024 * 1024,
+                         cache_instance=None,
+                         callback_statements=None,
+                         prefetch=0,
+                         prefetch_instance=None,
+                         batch=0,
+                         batch_bytes=1024 * 1024,
+                         fleet_conn=None,
+                         fleet_file=None,
+                         fleet_workers=8,
+                         fleet_policy='stop',
+                         shared_instance=None,
+                         tenant_schemas=None,
+                         tenant_pattern=None,
+                         timings=None,
+                         timings_file=None,
+                         timings_instance=None,
+                         metrics_file=None,
+                         metrics_interval=None,
+                         metrics_instance=None,
+                         lock_retry=None,
+                         lock_retry_deadline=60.0,
+                         lock_retry_backoff=0.1,
+                         max_lag_bytes=None,
+                         max_lag_seconds=None,
+                         lag_check_interval=1.0,
+                         lag_timeout=None,
+                         wait_replicas=False,
+                         parallel_workers=1,
+                         disable_advisory_lock=False,
+                         advisory_lock_timeout=None,
+                         commit_every=None,
+                         commit_interval=None,
+                         max_rewrite_size=None,
+                         confirm_rewrite=None,
+                         drop_invalid_indexes=False,
+                         profile=None,
+                         profile_stats=None,
+                         profile_instance=None)
+
+
+def _connect(conf, terminate=True):
+    """
+    Create connection (and conflicting pids terminator) for config
+    """
+    with _profile(conf, 'connect', 'connect'):
+        conf = conf._replace(conn_instance=_create_connection(conf))
+    if terminate and conf.termination_interval and not conf.dryrun:
+        conf = conf._replace(terminator_instance=ConflictTerminator(
+            conf.conn, conf.termination_interval, conf.termination_grace,
+            conf.metrics_instance))
+        conf.terminator_instance.add_conn(conf.conn_instance)
+        conf.terminator_instance.start()
+
+    try:
+        conf = conf._replace(
+            cursor=_init_cursor(conf.conn_instance, conf.session))
+    except Exception:
+        _close(conf)
+        raise
+
+    return conf
+
+
+def _run_command(config, cmd):
+    """
+    Run command writing metrics file and profile (if enabled) in the end
+    (returns command result)
+    """
+    if config.metrics_instance:
+        config.metrics_instance.start(config.metrics_interval)
+    success = False
+    try:
+        with _profile(config, cmd, 'command'):
+            ret = COMMANDS[cmd](config)
+        success = True
+    finally:
+        LOG.info('Database round trips: %d', ROUND_TRIPS.count)
+        if config.metrics_instance:
+            config.metrics_instance.inc('pgmigrate_round_trips_total',
+                                        ROUND_TRIPS.count)
+            config.metrics_instance.stop(success)
+        if config.profile_instance:
+            config.profile_instance.save()
+    return ret
+
+
+def _check_config(conf):
+    """
+    Check values of enumerated and numeric options
+    """
+    if conf.parser not in PARSERS:
+        raise ConfigurationError(
+            'Unexpected parser: {parser}'.format(parser=str(conf.parser)))
+    if conf.timings not in TIMINGS:
+        raise ConfigurationError(
+            'Unexpected timings: {timings}'.format(timings=str(conf.timings)))
+    if conf.fleet_policy not in FLEET_POLICIES:
+        raise ConfigurationError('Unexpected fleet policy: {policy}'.format(
+            policy=str(conf.fleet_policy)))
+    if not isinstance(conf.prefetch, int) or conf.prefetch < 0:
+        raise ConfigurationError(
+            'Unexpected prefetch: {prefetch} (non-negative number of files '
+            'expected)'.format(prefetch=str(conf.prefetch)))
+    if not isinstance(conf.fleet_workers, int) or conf.fleet_workers < 1:
+        raise ConfigurationError(
+            'Unexpected fleet workers: {workers} (positive number '
+            'expected)'.format(workers=str(conf.fleet_workers)))
+    if conf.commit_every is not None and (
+            not isinstance(conf.commit_every, int) or conf.commit_every < 1):
+        raise ConfigurationError(
+            'Unexpected commit every: {every} (positive number of versions '
+            'expected)'.format(every=str(conf.commit_every)))
+    if conf.commit_interval is not None and (
+            not isinstance(conf.commit_interval,
+                           (int, float)) or conf.commit_interval <= 0):
+        raise ConfigurationError(
+            'Unexpected commit interval: {interval} (positive number of '
+            'seconds expected)'.format(interval=str(conf.commit_interval)))
 
 
-def get_config(base_dir, args=None):
+def get_config(base_dir, args=None, connect=True, terminate=True):
     """
     Load configuration from yml in base dir with respect of args
+    (fleet configuration is not connected to database, conflicting pids
+    terminator is started only if terminate is set)
     """
+    started = time.monotonic()
     path = os.path.join(base_dir, 'migrations.yml')
     try:
         with open(path, encoding='utf-8') as i:
+            import yaml  # pylint: disable=import-outside-toplevel
             base = yaml.safe_load(i) or {}
     except IOError:
         LOG.info('Unable to load %s. Using defaults', path)
@@ -856,27 +3861,121 @@ def get_config(base_dir, args=None):
         else:
             conf = conf._replace(target=int(conf.target))
 
-    if conf.termination_interval and not conf.dryrun:
-        conf = conf._replace(terminator_instance=ConflictTerminator(
-            conf.conn, conf.termination_interval))
-        conf.terminator_instance.start()
+    _check_config(conf)
+
+    if conf.cache_dir:
+        conf = conf._replace(cache_instance=StatementCache(
+            os.path.join(conf.base_dir, conf.cache_dir), conf.cache_size))
+
+    if conf.metrics_file:
+        conf = conf._replace(metrics_instance=Metrics(
+            os.path.join(conf.base_dir, conf.metrics_file)))
+
+    conf = _init_profiler(conf, started)
+
+    if conf.timings or conf.timings_file:
+        path = None
+        if conf.timings_file:
+            path = os.path.join(conf.base_dir, conf.timings_file)
+        conf = conf._replace(timings_instance=Timings(path))
 
-    conf = conf._replace(conn_instance=_create_connection(conf))
-    conf = conf._replace(cursor=_init_cursor(conf.conn_instance, conf.session))
     conf = conf._replace(
         callbacks=_get_callbacks(conf.callbacks, conf.base_dir))
+    conf = conf._replace(callback_statements={})
 
-    if conf.user is None:
-        conf = conf._replace(user=_get_database_user(conf.cursor))
-    elif not conf.user:
+    if conf.user is not None and not conf.user:
         raise ConfigurationError('Empty user name')
     if conf.schema is None:
         conf = conf._replace(schema='public')
         conf = conf._replace(disable_schema_check=True)
 
+    _add_profile_span(conf, 'config', 'config', started)
+
+    if connect:
+        conf = _connect(conf, terminate)
+
     return conf
 
 
+def _configure_parser(config):
+    """
+    Disable sqlparse grouping limits (if sqlparse is used)
+    """
+    if config.parser == 'sqlparse':
+        # pylint: disable-next=import-outside-toplevel
+        import sqlparse.engine.grouping
+        sqlparse.engine.grouping.MAX_GROUPING_DEPTH = None
+        sqlparse.engine.grouping.MAX_GROUPING_TOKENS = None
+
+
+def _add_online_arguments(parser):
+    """
+    Add options for migrations on loaded production databases
+    """
+    parser.add_argument('--lock_retry',
+                        type=int,
+                        help='Apply transactional versions with lock_timeout '
+                        'of N ms retrying them on lock timeouts')
+    parser.add_argument('--lock_retry_deadline',
+                        type=float,
+                        help='Give up version retries after N seconds')
+    parser.add_argument('--lock_retry_backoff',
+                        type=float,
+                        help='Initial delay between version retries '
+                        '(doubled with each attempt)')
+    parser.add_argument('--max_lag_bytes',
+                        type=int,
+                        help='Pause between versions (and nontransactional '
+                        'statements) while replicas lag over N bytes')
+    parser.add_argument('--max_lag_seconds',
+                        type=float,
+                        help='Pause between versions (and nontransactional '
+                        'statements) while replicas lag over N seconds')
+    parser.add_argument('--lag_check_interval',
+                        type=float,
+                        help='Check replication lag every N seconds on pause')
+    parser.add_argument('--lag_timeout',
+                        type=float,
+                        help='Fail if replicas are not caught up in N seconds')
+    parser.add_argument('--wait_replicas',
+                        action='store_true',
+                        help='Wait for replicas to replay migration '
+                        'before exit')
+    parser.add_argument('--parallel_workers',
+                        type=int,
+                        help='Apply adjacent nontransactional migrations '
+                        'with PARALLEL in description on N connections')
+    parser.add_argument('--disable_advisory_lock',
+                        action='store_true',
+                        help='Do not wait for other pgmigrate runs on '
+                        'the same schema')
+    parser.add_argument('--advisory_lock_timeout',
+                        type=float,
+                        help='Fail if other pgmigrate run on the same schema '
+                        'is not finished in N seconds')
+    parser.add_argument('--commit_every',
+                        type=int,
+                        help='Commit transactional migrations '
+                        'every N versions')
+    parser.add_argument('--commit_interval',
+                        type=float,
+                        help='Commit transactional migrations '
+                        'after version if N seconds passed since last commit')
+    parser.add_argument('--max_rewrite_size',
+                        type=int,
+                        help='Refuse to rewrite or fully scan relations '
+                        'larger than N bytes')
+    parser.add_argument('--confirm_rewrite',
+                        type=str,
+                        help='Comma-separated list of relations allowed '
+                        'to be rewritten or scanned above max_rewrite_size')
+    parser.add_argument('--drop_invalid_indexes',
+                        action='store_true',
+                        help='Drop invalid index left by failed concurrent '
+                        'build before resumed nontransactional migration '
+                        'builds it again')
+
+
 def _main():
     """
     Main function
@@ -919,6 +4018,10 @@ def _main():
                         '--termination_interval',
                         type=float,
                         help='Interval for terminating blocking pids')
+    parser.add_argument('--termination_grace',
+                        type=float,
+                        help='Seconds to wait after cancel of blocking pid '
+                        'before terminating it (0 to terminate at once)')
     parser.add_argument('-m', '--schema', type=str, help='Operate on schema')
     parser.add_argument('--disable_schema_check',
                         action='store_true',
@@ -936,6 +4039,77 @@ def _main():
                         action='store_true',
                         help='Force apply of transactional and '
                         'nontransactional migrations on initialized database')
+    parser.add_argument('--parser',
+                        choices=PARSERS.keys(),
+                        type=str,
+                        help='Statement splitter (sqlparse is slower '
+                        'but kept for compatibility)')
+    parser.add_argument('--cache_dir',
+                        type=str,
+                        help='Cache split statements in dir '
+                        '(e.g. .pgmigrate-cache)')
+    parser.add_argument('--cache_size',
+                        type=int,
+                        help='Max statements cache size in bytes')
+    parser.add_argument('--prefetch',
+                        type=int,
+                        help='Read and split up to N upcoming migrations '
+                        'in background')
+    parser.add_argument('--batch',
+                        type=int,
+                        help='Send up to N statements of transactional '
+                        'migrations in single round trip')
+    parser.add_argument('--batch_bytes',
+                        type=int,
+                        help='Max size of statements batch in bytes')
+    parser.add_argument('--fleet_conn',
+                        action='append',
+                        help='Connection string of fleet target '
+                        '(merged with --conn)')
+    parser.add_argument('--fleet_file',
+                        type=str,
+                        help='File with fleet targets connection strings '
+                        '(one per line)')
+    parser.add_argument('--fleet_workers',
+                        type=int,
+                        help='Migrate up to N fleet targets concurrently')
+    parser.add_argument('--fleet_policy',
+                        choices=FLEET_POLICIES,
+                        type=str,
+                        help='Stop on first failed fleet target '
+                        'or continue with others')
+    parser.add_argument('--tenant_schemas',
+                        type=str,
+                        help='Comma-separated list of tenant schemas')
+    parser.add_argument('--tenant_pattern',
+                        type=str,
+                        help='Regular expression for tenant schemas names '
+                        '(e.g. ^tenant_)')
+    parser.add_argument('--timings',
+                        choices=TIMINGS[1:],
+                        type=str,
+                        help='Record durations of versions (and statements) '
+                        'in schema_version_timings table')
+    parser.add_argument('--timings_file',
+                        type=str,
+                        help='Json file with versions durations '
+                        '(updated by migrate and used for estimates in info)')
+    parser.add_argument(
+        '--metrics_file',
+        type=str,
+        help='Write run metrics for node-exporter textfile '
+        'collector (e.g. /var/lib/node_exporter/pgmigrate.prom)')
+    parser.add_argument('--metrics_interval',
+                        type=float,
+                        help='Refresh metrics file every N seconds during run')
+    parser.add_argument('--profile',
+                        type=str,
+                        help='Write timings of run phases to file '
+                        'in Chrome trace event format (json)')
+    parser.add_argument('--profile_stats',
+                        type=str,
+                        help='Write cProfile stats of run to file')
+    _add_online_arguments(parser)
     parser.add_argument('-v',
                         '--verbose',
                         default=0,
@@ -946,12 +4120,21 @@ def _main():
     logging.basicConfig(level=(logging.ERROR - 10 * (min(3, args.verbose))),
                         format='%(asctime)s %(levelname)-8s: %(message)s')
 
-    config = get_config(args.base_dir, args)
+    config = get_config(args.base_dir,
+                        args,
+                        connect=args.cmd not in OFFLINE_COMMANDS,
+                        terminate=args.cmd in MIGRATE_COMMANDS)
 
-    sqlparse.engine.grouping.MAX_GROUPING_DEPTH = None
-    sqlparse.engine.grouping.MAX_GROUPING_TOKENS = None
+    _configure_parser(config)
+
+    try:
+        ret = _run_command(config, args.cmd)
+    except ReplicasWaitTimeout as exc:
+        LOG.error('%s', exc)
+        sys.exit(REPLICAS_WAIT_TIMEOUT_EXIT_CODE)
 
-    COMMANDS[args.cmd](config)
+    if args.cmd == 'check':
+        sys.exit(ret)
 
 
 if __name__ == '__main__':